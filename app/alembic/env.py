@@ -12,6 +12,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.db import Base, get_database_url
+from app.db import migration_utils
 # Import all models to ensure they are registered with Base
 from app.db.models import User, Wallet, Strategy, StrategyWallet, Recommendation, ChatMessageDB, WalletTokenBalance
 
@@ -78,6 +79,8 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection, target_metadata=target_metadata
         )
+        # Один Inspector на весь запуск: ревизии читают каталог через migration_utils
+        migration_utils.bind(connection)
 
         with context.begin_transaction():
             context.run_migrations()
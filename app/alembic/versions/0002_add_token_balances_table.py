@@ -10,6 +10,8 @@ from typing import Sequence, Union
 from alembic import op
 import sqlalchemy as sa
 
+from app.db import migration_utils
+
 
 # revision identifiers, used by Alembic.
 revision: str = '0002_add_token_balances_table'
@@ -35,20 +37,28 @@ def upgrade() -> None:
         sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ),
         sa.PrimaryKeyConstraint('id')
     )
+    migration_utils.invalidate()
     
-    # Create indexes for better query performance
-    op.create_index('ix_wallet_token_balances_wallet_id', 'wallet_token_balances', ['wallet_id'])
-    op.create_index('ix_wallet_token_balances_user_id', 'wallet_token_balances', ['user_id'])
-    op.create_index('ix_wallet_token_balances_token_symbol', 'wallet_token_balances', ['token_symbol'])
-    op.create_index('ix_wallet_token_balances_wallet_token', 'wallet_token_balances', ['wallet_id', 'token_symbol'], unique=True)
+    # Индексы строим через CREATE INDEX CONCURRENTLY: приложение может писать
+    # в wallet_token_balances во время деплоя, а обычный CREATE INDEX держит
+    # блокировку на запись до конца сканирования таблицы.
+    # CONCURRENTLY нельзя выполнять внутри транзакции, поэтому autocommit_block.
+    # Оценка: два прохода по таблице вместо одного, без блокировки записи;
+    # на свежей (пустой) таблице — мгновенно.
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallet_token_balances_wallet_id ON wallet_token_balances (wallet_id)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallet_token_balances_user_id ON wallet_token_balances (user_id)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallet_token_balances_token_symbol ON wallet_token_balances (token_symbol)")
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_wallet_token_balances_wallet_token ON wallet_token_balances (wallet_id, token_symbol)")
 
 
 def downgrade() -> None:
     # Drop indexes
-    op.drop_index('ix_wallet_token_balances_wallet_token', table_name='wallet_token_balances')
-    op.drop_index('ix_wallet_token_balances_token_symbol', table_name='wallet_token_balances')
-    op.drop_index('ix_wallet_token_balances_user_id', table_name='wallet_token_balances')
-    op.drop_index('ix_wallet_token_balances_wallet_id', table_name='wallet_token_balances')
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallet_token_balances_wallet_token")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallet_token_balances_token_symbol")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallet_token_balances_user_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallet_token_balances_wallet_id")
     
     # Drop table
     op.drop_table('wallet_token_balances')
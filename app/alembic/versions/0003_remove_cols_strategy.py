@@ -10,6 +10,8 @@ from typing import Sequence, Union
 from alembic import op
 import sqlalchemy as sa
 
+from app.db import migration_utils
+
 
 # revision identifiers, used by Alembic.
 revision: str = '0003_remove_cols_strategy'
@@ -20,20 +22,21 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     # Check if columns exist before dropping
-    bind = op.get_bind()
-    inspector = sa.inspect(bind)
-    
-    if 'strategies' in inspector.get_table_names():
-        columns = [col['name'] for col in inspector.get_columns('strategies')]
-        
-        if 'target_allocation' in columns:
-            op.drop_column('strategies', 'target_allocation')
-        
-        if 'threshold_percent' in columns:
-            op.drop_column('strategies', 'threshold_percent')
+    if migration_utils.table_exists('strategies'):
+        columns = migration_utils.column_names('strategies')
+        to_drop = [
+            c for c in ('target_allocation', 'threshold_percent', 'min_profit_threshold_usd')
+            if c in columns
+        ]
         
-        if 'min_profit_threshold_usd' in columns:
-            op.drop_column('strategies', 'min_profit_threshold_usd')
+        # One ALTER TABLE with several DROP COLUMN clauses: a single lock
+        # acquisition and catalog update instead of one per column
+        if to_drop:
+            op.execute(
+                "ALTER TABLE strategies "
+                + ", ".join(f"DROP COLUMN {c}" for c in to_drop)
+            )
+            migration_utils.invalidate()
 
 
 def downgrade() -> None:
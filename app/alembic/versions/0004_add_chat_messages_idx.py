@@ -8,7 +8,8 @@ Create Date: 2025-11-22 21:00:00.000000
 from typing import Sequence, Union
 
 from alembic import op
-import sqlalchemy as sa
+
+from app.db import migration_utils
 
 
 # revision identifiers, used by Alembic.
@@ -20,11 +21,8 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     # Проверяем существование таблицы и индекса
-    bind = op.get_bind()
-    inspector = sa.inspect(bind)
-    
-    if 'chat_messages' in inspector.get_table_names():
-        indexes = [idx['name'] for idx in inspector.get_indexes('chat_messages')]
+    if migration_utils.table_exists('chat_messages'):
+        indexes = migration_utils.index_names('chat_messages')
         
         # Добавляем индекс на strategy_id для оптимизации запросов
         if 'ix_chat_messages_strategy_id' not in indexes:
@@ -33,6 +31,8 @@ def upgrade() -> None:
         # Добавляем индекс на created_at для сортировки
         if 'ix_chat_messages_created_at' not in indexes:
             op.create_index('ix_chat_messages_created_at', 'chat_messages', ['created_at'])
+        
+        migration_utils.invalidate()
 
 
 def downgrade() -> None:
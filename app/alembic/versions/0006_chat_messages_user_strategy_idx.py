@@ -0,0 +1,59 @@
+"""Add composite (user_id, strategy_id, created_at DESC) index on chat_messages
+
+Revision ID: 0006_chat_messages_user_strategy_idx
+Revises: 0005_add_last_checked
+Create Date: 2025-11-24 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_chat_messages_user_strategy_idx'
+down_revision: Union[str, None] = '0005_add_last_checked'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # История чата: WHERE user_id = ? AND strategy_id = ? ORDER BY created_at DESC.
+    # Один составной индекс вместо bitmap-объединения двух одноколоночных.
+    # user_message/agent_response в INCLUDE не добавляем: длинные ответы агента
+    # превышают лимит размера строки B-tree индекса.
+    # Индекс ix_chat_messages_strategy_id оставляем — он нужен для проверки
+    # внешнего ключа при удалении стратегии.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chat_messages_user_strategy_created',
+            'chat_messages',
+            ['user_id', 'strategy_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Заменен составным индексом
+        op.drop_index(
+            'ix_chat_messages_created_at',
+            table_name='chat_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chat_messages_created_at',
+            'chat_messages',
+            ['created_at'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_chat_messages_user_strategy_created',
+            table_name='chat_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
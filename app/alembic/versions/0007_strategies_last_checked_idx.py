@@ -0,0 +1,47 @@
+"""Add indexes on strategies.last_checked_at for the monitor sweep
+
+Revision ID: 0007_strategies_last_checked_idx
+Revises: 0006_chat_messages_user_strategy_idx
+Create Date: 2025-11-24 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_strategies_last_checked_idx'
+down_revision: Union[str, None] = '0006_chat_messages_user_strategy_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # Частичный индекс: только стратегии, которые еще ни разу не проверялись
+        op.create_index(
+            'ix_strategies_stale',
+            'strategies',
+            ['last_checked_at'],
+            postgresql_where=sa.text('last_checked_at IS NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Выборка "давно не проверявшихся" стратегий в порядке давности проверки
+        op.create_index(
+            'ix_strategies_last_checked',
+            'strategies',
+            [sa.text('last_checked_at ASC NULLS FIRST')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Обновляем статистику, чтобы планировщик сразу начал использовать индексы
+        op.execute('ANALYZE strategies')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_strategies_last_checked', table_name='strategies', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_strategies_stale', table_name='strategies', postgresql_concurrently=True, if_exists=True)
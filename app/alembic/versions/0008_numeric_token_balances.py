@@ -0,0 +1,59 @@
+"""Store wallet_token_balances amounts as NUMERIC
+
+Revision ID: 0008_numeric_token_balances
+Revises: 0007_strategies_last_checked_idx
+Create Date: 2025-11-24 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_numeric_token_balances'
+down_revision: Union[str, None] = '0007_strategies_last_checked_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # balance хранится в уже отмасштабированных единицах токена (не в wei),
+    # поэтому NUMERIC(78, 18): 60 знаков целой части и 18 дробной.
+    # balance_usd переводим с double precision на NUMERIC, чтобы суммы не плыли.
+    op.alter_column(
+        'wallet_token_balances',
+        'balance',
+        existing_type=sa.String(length=255),
+        type_=sa.Numeric(precision=78, scale=18),
+        existing_nullable=False,
+        postgresql_using='balance::numeric(78, 18)',
+    )
+    op.alter_column(
+        'wallet_token_balances',
+        'balance_usd',
+        existing_type=sa.Float(),
+        type_=sa.Numeric(precision=20, scale=8),
+        existing_nullable=True,
+        postgresql_using='balance_usd::numeric(20, 8)',
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'wallet_token_balances',
+        'balance_usd',
+        existing_type=sa.Numeric(precision=20, scale=8),
+        type_=sa.Float(),
+        existing_nullable=True,
+        postgresql_using='balance_usd::double precision',
+    )
+    op.alter_column(
+        'wallet_token_balances',
+        'balance',
+        existing_type=sa.Numeric(precision=78, scale=18),
+        type_=sa.String(length=255),
+        existing_nullable=False,
+        postgresql_using='balance::text',
+    )
@@ -0,0 +1,59 @@
+"""Maintain wallet_token_balances.updated_at via trigger and index it per user
+
+Revision ID: 0009_wtb_updated_at_trigger
+Revises: 0008_numeric_token_balances
+Create Date: 2025-11-24 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_wtb_updated_at_trigger'
+down_revision: Union[str, None] = '0008_numeric_token_balances'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # updated_at выставляет сервер при каждом UPDATE — одни часы для всех воркеров
+    op.execute("""
+        CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS trg_wtb_touch ON wallet_token_balances")
+    op.execute("""
+        CREATE TRIGGER trg_wtb_touch
+        BEFORE UPDATE ON wallet_token_balances
+        FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """)
+
+    # Поиск устаревших балансов пользователя ("обновить балансы старше T")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_wallet_token_balances_user_updated',
+            'wallet_token_balances',
+            ['user_id', sa.text('updated_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_wallet_token_balances_user_updated',
+            table_name='wallet_token_balances',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.execute("DROP TRIGGER IF EXISTS trg_wtb_touch ON wallet_token_balances")
+    op.execute("DROP FUNCTION IF EXISTS touch_updated_at()")
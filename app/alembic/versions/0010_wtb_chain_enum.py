@@ -0,0 +1,78 @@
+"""Store wallet_token_balances.chain as a PostgreSQL enum
+
+Revision ID: 0010_wtb_chain_enum
+Revises: 0009_wtb_updated_at_trigger
+Create Date: 2025-11-24 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010_wtb_chain_enum'
+down_revision: Union[str, None] = '0009_wtb_updated_at_trigger'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Значения chain_enum на момент этой ревизии. Список намеренно скопирован,
+# а не импортирован из app.db.models: миграция должна давать тот же результат
+# при любых будущих изменениях моделей, поэтому список здесь не меняется
+CHAINS = ('ethereum', 'polygon', 'arbitrum', 'optimism', 'bsc')
+
+
+def _check_chains() -> None:
+    """
+    Проверяет, что все значения wallet_token_balances.chain приводятся к chain_enum
+
+    Иначе ALTER ... USING lower(chain)::chain_enum упадет посреди миграции
+    с невнятной ошибкой приведения типа.
+    """
+    # В offline-режиме (--sql) базы нет, проверять нечего
+    if context.is_offline_mode():
+        return
+    unknown = op.get_bind().execute(
+        sa.text(
+            "SELECT DISTINCT lower(chain) FROM wallet_token_balances "
+            "WHERE lower(chain) NOT IN :chains"
+        ).bindparams(sa.bindparam('chains', expanding=True)),
+        {'chains': list(CHAINS)},
+    ).scalars().all()
+    if unknown:
+        raise RuntimeError(
+            f"wallet_token_balances.chain contains values outside chain_enum {CHAINS}: "
+            f"{sorted(unknown)}. Fix or delete these rows before upgrading."
+        )
+
+
+def upgrade() -> None:
+    _check_chains()
+
+    # Enum занимает 4 байта вместо varchar(50) в каждой строке
+    chain_enum = postgresql.ENUM(*CHAINS, name='chain_enum')
+    chain_enum.create(op.get_bind(), checkfirst=True)
+
+    op.alter_column(
+        'wallet_token_balances',
+        'chain',
+        existing_type=sa.String(length=50),
+        type_=chain_enum,
+        existing_nullable=False,
+        postgresql_using='lower(chain)::chain_enum',
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'wallet_token_balances',
+        'chain',
+        existing_type=postgresql.ENUM(*CHAINS, name='chain_enum'),
+        type_=sa.String(length=50),
+        existing_nullable=False,
+        postgresql_using='chain::text',
+    )
+    postgresql.ENUM(name='chain_enum').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,58 @@
+"""Add composite (user_id, strategy_id, created_at DESC) index on recommendations
+
+Revision ID: 0011_recommendations_user_strategy_idx
+Revises: 0010_wtb_chain_enum
+Create Date: 2025-11-24 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011_recommendations_user_strategy_idx'
+down_revision: Union[str, None] = '0010_wtb_chain_enum'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Последние рекомендации пользователя (опционально по стратегии), новые первыми.
+    # Текст рекомендации в INCLUDE не добавляем: длинные тексты превышают
+    # лимит размера строки B-tree индекса.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_recommendations_user_strategy_created',
+            'recommendations',
+            ['user_id', 'strategy_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # user_id — ведущая колонка составного индекса, отдельный индекс не нужен.
+        # ix_recommendations_strategy_id оставляем для проверки внешнего ключа.
+        op.drop_index(
+            'ix_recommendations_user_id',
+            table_name='recommendations',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.execute('ANALYZE recommendations')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_recommendations_user_id',
+            'recommendations',
+            ['user_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_recommendations_user_strategy_created',
+            table_name='recommendations',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,40 @@
+"""Add (chain, user_id) index on wallets
+
+Revision ID: 0012_wallets_chain_user_idx
+Revises: 0011_recommendations_user_strategy_idx
+Create Date: 2025-11-24 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012_wallets_chain_user_idx'
+down_revision: Union[str, None] = '0011_recommendations_user_strategy_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Кошельки пользователя в конкретной сети (анализ портфеля по chain).
+    # На новых БД индекс уже создан начальной миграцией.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_wallets_chain_user',
+            'wallets',
+            ['chain', 'user_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_wallets_chain_user',
+            table_name='wallets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
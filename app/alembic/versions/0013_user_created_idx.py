@@ -0,0 +1,72 @@
+"""Add (user_id, created_at DESC) indexes on chat_messages and recommendations
+
+Revision ID: 0013_user_created_idx
+Revises: 0012_wallets_chain_user_idx
+Create Date: 2025-11-25 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0013_user_created_idx'
+down_revision: Union[str, None] = '0012_wallets_chain_user_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # История чата и рекомендации без фильтра по стратегии:
+    # WHERE user_id = ? ORDER BY created_at DESC LIMIT n.
+    # Индексы (user_id, strategy_id, created_at DESC) из 0006/0011 такой
+    # порядок не дают — планировщик сортирует все строки пользователя.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chat_messages_user_created',
+            'chat_messages',
+            ['user_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # user_id — ведущая колонка нового индекса, отдельный индекс не нужен
+        op.drop_index(
+            'ix_chat_messages_user_id',
+            table_name='chat_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            'ix_recommendations_user_created',
+            'recommendations',
+            ['user_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.execute('ANALYZE chat_messages')
+        op.execute('ANALYZE recommendations')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_recommendations_user_created',
+            table_name='recommendations',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            'ix_chat_messages_user_id',
+            'chat_messages',
+            ['user_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_chat_messages_user_created',
+            table_name='chat_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
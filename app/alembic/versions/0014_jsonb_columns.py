@@ -0,0 +1,44 @@
+"""Store JSON columns as JSONB
+
+Revision ID: 0014_jsonb_columns
+Revises: 0013_user_created_idx
+Create Date: 2025-11-25 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0014_jsonb_columns'
+down_revision: Union[str, None] = '0013_user_created_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # jsonb хранится в разобранном бинарном виде: без повторного парсинга
+    # текста при каждом чтении и с поддержкой операторов/GIN-индексов.
+    # Смена типа переписывает таблицу под ACCESS EXCLUSIVE — по одному
+    # ALTER TABLE на таблицу, чтобы переписать каждую один раз.
+    # Default '[]' приводится отдельно: json -> jsonb для DEFAULT автоматически не кастуется
+    op.execute(
+        "ALTER TABLE wallets "
+        "ALTER COLUMN tokens DROP DEFAULT, "
+        "ALTER COLUMN tokens TYPE jsonb USING tokens::jsonb, "
+        "ALTER COLUMN tokens SET DEFAULT '[]'::jsonb"
+    )
+    op.execute("ALTER TABLE recommendations ALTER COLUMN analysis TYPE jsonb USING analysis::jsonb")
+    op.execute("ALTER TABLE chat_messages ALTER COLUMN wallet_ids TYPE jsonb USING wallet_ids::jsonb")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE chat_messages ALTER COLUMN wallet_ids TYPE json USING wallet_ids::json")
+    op.execute("ALTER TABLE recommendations ALTER COLUMN analysis TYPE json USING analysis::json")
+    op.execute(
+        "ALTER TABLE wallets "
+        "ALTER COLUMN tokens DROP DEFAULT, "
+        "ALTER COLUMN tokens TYPE json USING tokens::json, "
+        "ALTER COLUMN tokens SET DEFAULT '[]'::json"
+    )
@@ -0,0 +1,41 @@
+"""Widen wallet_token_balances.balance_usd to NUMERIC(24, 8)
+
+Revision ID: 0015_wtb_balance_usd_precision
+Revises: 0014_jsonb_columns
+Create Date: 2025-11-25 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0015_wtb_balance_usd_precision'
+down_revision: Union[str, None] = '0014_jsonb_columns'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NUMERIC(20, 8) ограничивает сумму 10^12 USD — этого мало для итогов
+    # SUM(balance_usd) по портфелю. Увеличение precision при той же scale
+    # не переписывает таблицу в PostgreSQL.
+    op.alter_column(
+        'wallet_token_balances',
+        'balance_usd',
+        existing_type=sa.Numeric(precision=20, scale=8),
+        type_=sa.Numeric(precision=24, scale=8),
+        existing_nullable=True,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'wallet_token_balances',
+        'balance_usd',
+        existing_type=sa.Numeric(precision=24, scale=8),
+        type_=sa.Numeric(precision=20, scale=8),
+        existing_nullable=True,
+    )
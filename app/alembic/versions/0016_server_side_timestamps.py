@@ -0,0 +1,54 @@
+"""Set created_at/updated_at defaults on the server
+
+Revision ID: 0016_server_side_timestamps
+Revises: 0015_wtb_balance_usd_precision
+Create Date: 2025-11-25 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0016_server_side_timestamps'
+down_revision: Union[str, None] = '0015_wtb_balance_usd_precision'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблица -> колонки времени, которые раньше заполнялись в Python (datetime.utcnow)
+TIMESTAMP_COLUMNS = {
+    'users': ('created_at', 'updated_at'),
+    'wallets': ('created_at', 'updated_at'),
+    'strategies': ('created_at', 'updated_at'),
+    'strategy_wallets': ('created_at',),
+    'recommendations': ('created_at',),
+    'chat_messages': ('created_at',),
+    'wallet_token_balances': ('created_at', 'updated_at'),
+}
+
+
+def upgrade() -> None:
+    # ALTER COLUMN ... SET DEFAULT меняет только каталог, таблицы не переписываются
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                existing_type=sa.DateTime(),
+                server_default=sa.text('statement_timestamp()'),
+                existing_nullable=False,
+            )
+
+
+def downgrade() -> None:
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                existing_type=sa.DateTime(),
+                server_default=None,
+                existing_nullable=False,
+            )
@@ -0,0 +1,60 @@
+"""Move delete cascades to foreign keys (ON DELETE CASCADE / SET NULL)
+
+Revision ID: 0017_fk_on_delete
+Revises: 0016_server_side_timestamps
+Create Date: 2025-11-25 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0017_fk_on_delete'
+down_revision: Union[str, None] = '0016_server_side_timestamps'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (таблица, колонка, ссылка, ON DELETE). Внешние ключи создавались без имени,
+# PostgreSQL назвал их <таблица>_<колонка>_fkey
+FOREIGN_KEYS = (
+    ('wallets', 'user_id', 'users(id)', 'CASCADE'),
+    ('strategies', 'user_id', 'users(id)', 'CASCADE'),
+    ('strategy_wallets', 'strategy_id', 'strategies(id)', 'CASCADE'),
+    ('strategy_wallets', 'wallet_id', 'wallets(id)', 'CASCADE'),
+    ('recommendations', 'user_id', 'users(id)', 'CASCADE'),
+    ('recommendations', 'strategy_id', 'strategies(id)', 'CASCADE'),
+    ('chat_messages', 'user_id', 'users(id)', 'CASCADE'),
+    # История чата переживает удаление стратегии
+    ('chat_messages', 'strategy_id', 'strategies(id)', 'SET NULL'),
+    ('wallet_token_balances', 'user_id', 'users(id)', 'CASCADE'),
+    ('wallet_token_balances', 'wallet_id', 'wallets(id)', 'CASCADE'),
+)
+
+
+def _replace_foreign_keys(with_on_delete: bool) -> None:
+    # Ключ пересоздается как NOT VALID — без сканирования таблицы под
+    # эксклюзивной блокировкой. Данные уже проверены старым ключом;
+    # VALIDATE CONSTRAINT отдельно берет только SHARE UPDATE EXCLUSIVE
+    # и не блокирует запись.
+    for table, column, ref, on_delete in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        action = f' ON DELETE {on_delete}' if with_on_delete else ''
+        op.execute(
+            f'ALTER TABLE {table} '
+            f'DROP CONSTRAINT IF EXISTS {name}, '
+            f'ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {ref}{action} NOT VALID'
+        )
+
+    with op.get_context().autocommit_block():
+        for table, column, _, _ in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_fkey')
+
+
+def upgrade() -> None:
+    _replace_foreign_keys(with_on_delete=True)
+
+
+def downgrade() -> None:
+    _replace_foreign_keys(with_on_delete=False)
@@ -0,0 +1,78 @@
+"""Store wallets.chain as the chain_enum type
+
+Revision ID: 0018_wallets_chain_enum
+Revises: 0017_fk_on_delete
+Create Date: 2025-11-25 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0018_wallets_chain_enum'
+down_revision: Union[str, None] = '0017_fk_on_delete'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Значения chain_enum из 0010. Список намеренно скопирован, а не импортирован
+# из app.db.models: миграция не должна зависеть от будущих изменений моделей,
+# поэтому список здесь не меняется
+CHAINS = ('ethereum', 'polygon', 'arbitrum', 'optimism', 'bsc')
+
+
+def _check_chains() -> None:
+    """
+    Проверяет, что все значения wallets.chain приводятся к chain_enum
+
+    Иначе ALTER ... USING lower(chain)::chain_enum упадет посреди миграции
+    с невнятной ошибкой приведения типа.
+    """
+    # В offline-режиме (--sql) базы нет, проверять нечего
+    if context.is_offline_mode():
+        return
+    unknown = op.get_bind().execute(
+        sa.text(
+            "SELECT DISTINCT lower(chain) FROM wallets "
+            "WHERE lower(chain) NOT IN :chains"
+        ).bindparams(sa.bindparam('chains', expanding=True)),
+        {'chains': list(CHAINS)},
+    ).scalars().all()
+    if unknown:
+        raise RuntimeError(
+            f"wallets.chain contains values outside chain_enum {CHAINS}: "
+            f"{sorted(unknown)}. Fix or delete these rows before upgrading."
+        )
+
+
+def upgrade() -> None:
+    _check_chains()
+
+    # Тип chain_enum создан в 0010 для wallet_token_balances. Enum занимает
+    # 4 байта, и ключи ix_wallets_chain_user становятся короче; индекс
+    # перестраивается вместе с таблицей
+    postgresql.ENUM(*CHAINS, name='chain_enum').create(op.get_bind(), checkfirst=True)
+
+    op.alter_column(
+        'wallets',
+        'chain',
+        existing_type=sa.String(length=50),
+        type_=postgresql.ENUM(*CHAINS, name='chain_enum', create_type=False),
+        existing_nullable=False,
+        postgresql_using='lower(chain)::chain_enum',
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'wallets',
+        'chain',
+        existing_type=postgresql.ENUM(*CHAINS, name='chain_enum', create_type=False),
+        type_=sa.String(length=50),
+        existing_nullable=False,
+        postgresql_using='chain::text',
+    )
@@ -0,0 +1,42 @@
+"""Drop ix_wallet_token_balances_wallet_id covered by the (wallet_id, token_symbol) unique index
+
+Revision ID: 0019_drop_wtb_wallet_id_idx
+Revises: 0018_wallets_chain_enum
+Create Date: 2025-11-25 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0019_drop_wtb_wallet_id_idx'
+down_revision: Union[str, None] = '0018_wallets_chain_enum'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Фильтр по wallet_id и ON DELETE CASCADE от wallets обслуживает
+    # уникальный индекс (wallet_id, token_symbol) — он же арбитр
+    # INSERT ... ON CONFLICT при upsert балансов. Отдельный индекс по wallet_id
+    # только добавляет запись в еще одно B-tree на каждый upsert.
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_wallet_token_balances_wallet_id',
+            table_name='wallet_token_balances',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_wallet_token_balances_wallet_id',
+            'wallet_token_balances',
+            ['wallet_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
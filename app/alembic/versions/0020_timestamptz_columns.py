@@ -0,0 +1,52 @@
+"""Store timestamps as timestamptz (UTC)
+
+Revision ID: 0020_timestamptz_columns
+Revises: 0019_drop_wtb_wallet_id_idx
+Create Date: 2025-11-25 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0020_timestamptz_columns'
+down_revision: Union[str, None] = '0019_drop_wtb_wallet_id_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблица -> колонки времени; значения в них записаны в UTC
+TIMESTAMP_COLUMNS = {
+    'users': ('created_at', 'updated_at'),
+    'wallets': ('created_at', 'updated_at'),
+    'strategies': ('created_at', 'updated_at', 'last_checked_at'),
+    'strategy_wallets': ('created_at',),
+    'recommendations': ('created_at',),
+    'chat_messages': ('created_at',),
+    'wallet_token_balances': ('created_at', 'updated_at'),
+}
+
+
+def _alter_timestamps(timezone: bool) -> None:
+    # При TimeZone = UTC PostgreSQL (12+) меняет timestamp <-> timestamptz
+    # без USING, не переписывая таблицы (перестраиваются только индексы
+    # по этим колонкам); хранимые наивные значения трактуются как UTC
+    op.execute("SET LOCAL TimeZone = 'UTC'")
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                existing_type=sa.DateTime(timezone=not timezone),
+                type_=sa.DateTime(timezone=timezone),
+            )
+
+
+def upgrade() -> None:
+    _alter_timestamps(timezone=True)
+
+
+def downgrade() -> None:
+    _alter_timestamps(timezone=False)
@@ -0,0 +1,73 @@
+"""Generate UUIDv7 primary keys in the database
+
+Revision ID: 0021_server_uuid7_ids
+Revises: 0020_timestamptz_columns
+Create Date: 2025-11-25 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0021_server_uuid7_ids'
+down_revision: Union[str, None] = '0020_timestamptz_columns'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = (
+    'users',
+    'wallets',
+    'strategies',
+    'strategy_wallets',
+    'recommendations',
+    'chat_messages',
+    'wallet_token_balances',
+)
+
+
+def upgrade() -> None:
+    # UUID версии 7 (RFC 9562): первые 48 бит — время Unix в мс, остальное —
+    # случайные биты gen_random_uuid() (встроена с PostgreSQL 13). Биты 52-53
+    # превращают версию 4 (0100) в 7 (0111), вариант уже 10.
+    # Встроенная uuidv7() появилась только в PostgreSQL 18.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+            SELECT encode(
+                set_bit(
+                    set_bit(
+                        overlay(
+                            uuid_send(gen_random_uuid())
+                            PLACING substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+                            FROM 1 FOR 6
+                        ),
+                        52, 1
+                    ),
+                    53, 1
+                ),
+                'hex'
+            )::uuid
+        $$ LANGUAGE sql VOLATILE
+    """)
+    for table in TABLES:
+        op.alter_column(
+            table,
+            'id',
+            existing_type=sa.UUID(),
+            server_default=sa.text('uuid_generate_v7()'),
+            existing_nullable=False,
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.alter_column(
+            table,
+            'id',
+            existing_type=sa.UUID(),
+            server_default=None,
+            existing_nullable=False,
+        )
+    op.execute("DROP FUNCTION IF EXISTS uuid_generate_v7()")
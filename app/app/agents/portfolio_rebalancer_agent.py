@@ -2,10 +2,16 @@
 Агент для автоматической ребалансировки криптопортфеля
 """
 import asyncio
-import json
-from typing import Any, Dict, List, Optional, TypedDict, Set
+import logging
+import math
+from functools import lru_cache
+from typing import Any, AsyncIterator, ClassVar, Dict, Final, List, Optional, Tuple, TypedDict, Set
+
+import numpy as np
+import orjson
 from spoon_ai.agents.toolcall import ToolCallAgent
 from spoon_ai.chat import ChatBot
+from spoon_ai.schema import AgentState
 from spoon_ai.tools.crypto_tools import get_crypto_tools
 from spoon_ai.tools import ToolManager
 from app.tools.rebalancer_tools import (
@@ -17,151 +23,440 @@ from app.tools.rebalancer_tools import (
     FindStrategyTool,
 )
 from app.tools.chainbase_tools import GetAccountTokensTool, GetAccountBalanceTool
-from app.utils.helpers import convert_hex_balance_to_float
+from app.tools.price_tools import BatchGetTokenPricesTool, CachedGetTokenPriceTool
+from app.utils.helpers import convert_hex_balance_to_float, parse_raw_balance
+from app.utils.helpers_numba import scale_balances
+# Предзагрузка данных портфеля использует те же инструменты и правила оценки
+# (AAVE токен -> базовый токен, стейблкоин = $1), что и граф ребалансировки
+from app.graphs.rebalancing_graph import (
+    _STABLECOINS,
+    _extract_underlying_from_upper,
+    _get_balance_tool,
+    _get_tokens_tool,
+    _is_sane_price,
+)
 
+logger = logging.getLogger(__name__)
+
+# Инструмент без состояния: создается один раз, а не на каждую предзагрузку
+_batch_prices_tool = BatchGetTokenPricesTool()
+
+# Максимум одновременных запросов к Chainbase/DEX при предзагрузке данных портфеля
+_PREFETCH_CONCURRENCY: Final[int] = 50
+
+# С какого числа токенов process_token_balances считает балансы через NumPy:
+# на коротких списках накладные расходы на создание массивов не окупаются
+_VECTORIZE_MIN_TOKENS: Final[int] = 10
+
+# Символ нативного токена сети по chain_id
+_NATIVE_SYMBOLS: Final[Dict[int, str]] = {
+    1: "ETH",
+    137: "POL",
+    42161: "ETH",
+    10: "ETH",
+    56: "BNB",
+}
+
+# Нулевые балансы (пыль от старых токенов) — пропускаем без парсинга hex
+_ZERO_BALANCES: Final[frozenset] = frozenset({"0x0", "0x", "0x00", "0", ""})
+
+# chain_id сетей для инструментов Chainbase
+_CHAIN_ID_MAP: Final[Dict[str, int]] = {
+    "ethereum": 1,
+    "polygon": 137,
+    "arbitrum": 42161,
+    "optimism": 10,
+    "bsc": 56,
+}
+
+# Допустимый уровень риска: доли портфеля (%) в рискованных активах,
+# стейблкоинах и консервативных криптовалютах
+_RISK_TOLERANCE: Final[Dict[str, Tuple[Tuple[int, int], ...]]] = {
+    "Low": ((5, 10), (50, 60), (10, 30)),
+    "Medium": ((10, 20), (40, 50), (10, 30)),
+    "High": ((15, 25), (30, 40), (20, 40)),
+}
+
+# Категории токенов в том же порядке, что и доли в _RISK_TOLERANCE
+_TOKEN_CATEGORIES: Final[Dict[str, Tuple[str, ...]]] = {
+    "Risky": ("AVAX", "AAVE", "HYPE"),
+    "Stablecoins": ("USDC", "USDT"),
+    "Conservative": ("wBTC", "ETH"),
+}
+
+
+@lru_cache(maxsize=1)
+def _crypto_tools() -> tuple:
+    """Инструменты spoon_ai для крипто-данных, создаются один раз на процесс"""
+    return tuple(get_crypto_tools())
+
+
+def _build_tools() -> list:
+    """Создает инструменты агента"""
+    # get_token_price заменяем версией с TTL-кэшем
+    price_tool = CachedGetTokenPriceTool()
+    return [
+        # Базовые инструменты для всех задач
+        CalculateRebalancingTool(),
+        EstimateGasFeesTool(),
+        SuggestRebalancingTradesTool(),
+        GetAccountTokensTool(),
+        GetAccountBalanceTool(),
+        price_tool,
+        BatchGetTokenPricesTool(),
+        *(tool for tool in _crypto_tools() if tool.name != price_tool.name),
+        # Инструменты для управления стратегиями (используются только когда нужно)
+        GetStrategiesTool(),
+        GetStrategyDetailsTool(),
+        FindStrategyTool(),
+    ]
 
-class PortfolioRebalancerAgent(ToolCallAgent):
-    """AI-агент для автоматической ребалансировки криптопортфеля"""
-    name: str = "portfolio_rebalancer_agent"
-    description: str = "AI агент для мониторинга и ребалансировки криптопортфеля на основе рыночных условий и допустимого уровня риска"
 
-    system_prompt: str = """
-    You are a professional AI agent for cryptocurrency portfolio rebalancing.
+def _valid_token_symbol(token_data: Dict[str, Any]) -> Optional[str]:
+    """Нормализованный символ токена или None, если токен нужно пропустить"""
+    balance = token_data.get("balance", "0x0")
+    # Нехэшируемый баланс (dict/list из некорректной строки API) в set не ищем,
+    # его разбор вернет 0 и токен отфильтруется дальше
+    if isinstance(balance, str) and balance in _ZERO_BALANCES:
+        return None
+    symbol = token_data.get("symbol") or ""
+    if not isinstance(symbol, str):
+        return None
+    symbol = symbol.strip().upper()
+    # Пропускаем некорректные токены
+    if not symbol or "|" in symbol or len(symbol) > 20:
+        return None
+    return symbol
+
+
+def _usd_value(value: Any) -> float:
+    """balance_usd / current_usd_price токена как float, 0.0 для некорректных значений"""
+    try:
+        result = float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return result if math.isfinite(result) else 0.0
+
+
+def _decimals_value(value: Any) -> float:
+    """decimals токена для NumPy-массива, NaN для некорректных значений"""
+    # Как и в convert_hex_balance_to_float, decimals принимаются только числом:
+    # для NaN баланс тоже получается NaN и токен отбрасывается фильтром balances > 0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return math.nan
+
+
+def _token_entry(token_data: Dict[str, Any]) -> Optional[tuple]:
+    """
+    Конвертирует запись get_account_tokens в (symbol, balance, balance_usd, token_data)
     
-    YOUR MAIN TASK: Analyze portfolio balances and provide rebalancing recommendations.
+    Returns:
+        None для некорректных токенов и нулевых балансов
+    """
+    symbol = _valid_token_symbol(token_data)
+    if symbol is None:
+        return None
     
-    EXECUTION RULES:
-    - Always complete ALL required steps. Never stop early.
-    - When given a task, immediately start calling tools in the specified order.
-    - Do not ask questions - just execute the tools.
-    - If a tool call fails, try again or continue with available data.
-    - After getting data, always proceed to next steps (prices, calculations, recommendations).
-
-
-    RISK TOLERANCE:
-    - Low risk tolerance: 5% - 10% of the portfolio in riskier assets, 50% - 60% of the portfolio in stablecoins, 10% - 30% of the portfolio in conservative cryptocurrencies
-    - Medium risk tolerance: 10% - 20% of the portfolio in riskier assets, 40% - 50% of the portfolio in stablecoins, 10% - 30% of the portfolio in conservative cryptocurrencies
-    - High risk tolerance: 15% - 25% of the portfolio in riskier assets, 30% - 40% of the portfolio in stablecoins, 20% - 40% of the portfolio in conservative cryptocurrencies
-
-    Risky cryptocurrencies:
-    - AVAX
-    - AAVE
-    - HYPE
-
-    Stablecoins:
-    - USDC
-    - USDT
-
-    Conservative cryptocurrencies:
-    - wBTC
-    - ETH
-
-    TOOLS FOR PORTFOLIO ANALYSIS (use ONLY these):
-    - get_account_tokens(chain_id, address) - Get ERC20 token balances. REQUIRED first step.
-    - get_account_balance(chain_id, address) - Get native token balance. REQUIRED second step.
-    - get_token_prices(symbol) - Get token price. Use "TOKEN-USDT" format (with dash, NOT slash).
-    - calculate_rebalancing(current_portfolio, target_allocation, threshold_percent) - Calculate actions.
-    - estimate_gas_fees(chain, num_transactions) - Estimate fees. Chain: "ethereum", "arbitrum", "polygon".
-    - suggest_rebalancing_trades(rebalancing_actions, gas_fees, min_profit_threshold_usd) - Suggest trades.
+    balance = convert_hex_balance_to_float(token_data.get("balance", "0x0"), token_data.get("decimals", 18))
+    if balance <= 0:
+        return None
     
-    DO NOT USE: get_strategies, get_strategy_details, find_strategy - these are for strategy management, not portfolio analysis.
+    balance_usd = _usd_value(token_data.get("balance_usd", 0))
+    # Если balance_usd не указан, но есть current_usd_price, вычисляем
+    if balance_usd == 0:
+        current_price = _usd_value(token_data.get("current_usd_price", 0))
+        if current_price > 0:
+            balance_usd = balance * current_price
     
-    Chain IDs: ethereum=1, polygon=137, arbitrum=42161, optimism=10, bsc=56
+    return symbol, balance, balance_usd, token_data
+
+
+def _process_tokens_vectorized(data: List[Dict[str, Any]]) -> tuple:
+    """
+    Векторизованная версия цикла process_token_balances для длинных списков токенов
     
-    WORKFLOW (MUST FOLLOW ALL STEPS IN ORDER):
-    1. Get current portfolio balances using get_account_tokens for ERC20 tokens and get_account_balance for native tokens
-    2. Get current token prices using get_token_prices for all tokens found in the portfolio
-    3. Calculate current allocation percentages from balances and prices
-    4. Compare with target allocation and calculate deviations using calculate_rebalancing tool
-    5. Estimate gas fees using estimate_gas_fees tool
-    6. Suggest specific trades using suggest_rebalancing_trades tool if rebalancing is beneficial
+    Returns:
+        (tokens, total_value_usd) в том же формате, что и скалярный путь
+    """
+    valid = [
+        (symbol, token_data)
+        for token_data in data
+        if (symbol := _valid_token_symbol(token_data)) is not None
+    ]
     
-    CRITICAL: You MUST complete ALL steps above. Do not stop after getting balances. Continue with prices, calculations, and recommendations.
+    if not valid:
+        return {}, 0.0
     
-    STOPPING CRITERIA (you can ONLY stop when ALL of these are true):
-    1. You have called get_account_tokens AND get_account_balance (balances obtained)
-    2. You have called get_token_prices for at least the main tokens (prices obtained)
-    3. You have called calculate_rebalancing tool (rebalancing calculated)
-    4. You have called estimate_gas_fees tool (gas fees estimated)
-    5. You have called suggest_rebalancing_trades tool (trades suggested)
-    6. You have provided a final recommendation with summary
+    count = len(valid)
+    raw_balances = np.fromiter(
+        (parse_raw_balance(t.get("balance", "0x0")) for _, t in valid), dtype=np.float64, count=count
+    )
+    decimals = np.fromiter(
+        (_decimals_value(t.get("decimals", 18)) for _, t in valid), dtype=np.float64, count=count
+    )
     
-    DO NOT STOP if:
-    - You only got balances but haven't calculated rebalancing yet
-    - You only got prices but haven't called calculate_rebalancing yet
-    - You calculated rebalancing but haven't estimated gas fees yet
-    - You estimated gas fees but haven't suggested trades yet
-    - You haven't provided a final recommendation yet
+    balances = scale_balances(raw_balances, decimals)
+    # NaN (некорректные decimals) сравнение > 0 не проходит
+    positive = np.flatnonzero(balances > 0)
+    if positive.size == 0:
+        return {}, 0.0
     
-    IMPORTANT RULES:
-    - You MUST execute ALL steps in the workflow. Do not stop early.
-    - Always verify that expected rebalancing benefits exceed gas fees
-    - Suggest rebalancing only if deviation from target allocation exceeds threshold (usually 5%)
-    - Provide clear recommendations with specific amounts in USD
-    - Consider gas fees when calculating rebalancing feasibility
-    - If user requests only analysis (consultation mode), don't suggest automatic execution
-    - If user requests autonomous mode, suggest specific transactions for execution
-    - If a tool call fails, try to continue with available data or retry the call
-    - Never stop after just getting balances - always continue to prices, calculations, and recommendations
+    # USD-поля разбираются только для токенов с балансом, как в скалярном пути
+    balances = balances[positive]
+    given_usd = np.fromiter(
+        (_usd_value(valid[i][1].get("balance_usd", 0)) for i in positive), dtype=np.float64, count=positive.size
+    )
+    prices = np.fromiter(
+        (_usd_value(valid[i][1].get("current_usd_price", 0)) for i in positive), dtype=np.float64, count=positive.size
+    )
+    # Если balance_usd не указан, но есть current_usd_price, вычисляем
+    balances_usd = np.where(
+        given_usd == 0,
+        np.where(prices > 0, balances * prices, 0.0),
+        given_usd,
+    )
     
-    RESPONSE FORMAT:
-    - Start with a brief summary of current portfolio status
-    - Show current and target allocation percentages
-    - Indicate deviations and rebalancing necessity
-    - If rebalancing is needed, show suggested trades with amounts
-    - Indicate total gas cost and expected benefit
-    - End with a clear recommendation
+    tokens = {}
+    for j, i in enumerate(positive):
+        symbol, token_data = valid[i]
+        tokens[symbol] = {
+            "balance": float(balances[j]),
+            "balance_usd": float(balances_usd[j]),
+            "decimals": token_data.get("decimals", 18),
+            "raw_balance": token_data.get("balance", "0x0"),
+            "contract_address": token_data.get("contract_address"),
+            "name": token_data.get("name")
+        }
+    return tokens, float(balances_usd.sum())
+
+
+def _aggregation_symbol(symbol: str) -> str:
+    """Базовый токен для AAVE токена (aArbUSDC -> USDC), иначе сам символ"""
+    return _extract_underlying_from_upper(symbol) or symbol
+
+
+def _usd_price(prices: Dict[str, Any], symbol: str) -> float:
+    """
+    Цена базового токена из результата get_token_prices_batch
     
-    COMPLETION CHECKLIST (you can only stop when ALL are done):
-    [ ] Called get_account_tokens
-    [ ] Called get_account_balance
-    [ ] Called get_token_prices for relevant tokens
-    [ ] Calculated portfolio value and allocation
-    [ ] Called calculate_rebalancing tool
-    [ ] Called estimate_gas_fees tool
-    [ ] Called suggest_rebalancing_trades tool
-    [ ] Provided final recommendation with summary
+    Стейблкоины оцениваются в $1 без запроса; 0.0, если разумной цены нет.
+    """
+    if symbol in _STABLECOINS:
+        return 1.0
+    entry = prices.get(f"{symbol}-USDT") or {}
+    try:
+        price = float(entry.get("price", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return price if _is_sane_price(price) else 0.0
+
+
+def _build_current_portfolio(wallets: Dict[str, Any], prices: Dict[str, Any], native_symbol: str) -> Dict[str, Any]:
+    """
+    Считает current_portfolio для calculate_rebalancing по всем кошелькам
     
-    If any item above is unchecked, you MUST continue. Do not say "Task finished" or "No action needed" until ALL items are checked.
+    Стоимость токена — balance * цена DEX базового токена, а если цены нет —
+    balance_usd из Chainbase. AAVE токены суммируются с базовым токеном,
+    как в графе ребалансировки.
     
-    After each step provide checklist with [ ] for each step.
-
-    Always respond in the same language the user is using.
+    Returns:
+        {"total_balances": {"WBTC": 42.67, ...}} только с положительными суммами
     """
-
-    # Базовые инструменты для всех задач
-    _base_tools = [
-        CalculateRebalancingTool(),
-        EstimateGasFeesTool(),
-        SuggestRebalancingTradesTool(),
-        GetAccountTokensTool(),
-        GetAccountBalanceTool(),
-        *get_crypto_tools()
-    ]
+    totals: Dict[str, float] = {}
+    for wallet_data in wallets.values():
+        for symbol, token in wallet_data["tokens"].items():
+            aggregation_symbol = _aggregation_symbol(symbol)
+            price = _usd_price(prices, aggregation_symbol)
+            balance_usd = token["balance"] * price if price > 0 else token["balance_usd"]
+            if balance_usd > 0:
+                totals[aggregation_symbol] = totals.get(aggregation_symbol, 0.0) + balance_usd
+        
+        native_balance = wallet_data.get("native_balance", 0.0)
+        native_price = _usd_price(prices, native_symbol)
+        if native_balance > 0 and native_price > 0:
+            totals[native_symbol] = totals.get(native_symbol, 0.0) + native_balance * native_price
     
-    # Инструменты для управления стратегиями (используются только когда нужно)
-    _strategy_tools = [
-        GetStrategiesTool(),
-        GetStrategyDetailsTool(),
-        FindStrategyTool(),
-    ]
+    return {"total_balances": {symbol: round(value, 2) for symbol, value in totals.items()}}
+
+
+def _stream_event(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Приводит элемент output_queue агента к событию стрима
     
-    available_tools: ToolManager = ToolManager(_base_tools + _strategy_tools)
+    ToolCallAgent.think() кладет в очередь {"content": ...} и {"tool_calls": [...]},
+    act() — {"tool_name": ..., "tool_result": ...}.
+    """
+    if "tool_calls" in item:
+        tool_calls = item["tool_calls"] or []
+        if not tool_calls:
+            return None
+        return {"type": "tool_calls", "tools": [tc.function.name for tc in tool_calls]}
+    if "tool_result" in item:
+        return {"type": "tool_result", "tool": item.get("tool_name"), "content": str(item["tool_result"])}
+    if item.get("content"):
+        return {"type": "content", "content": item["content"]}
+    return None
+
+
+def _dump_allocation(allocation: Dict[str, float]) -> str:
+    """Сериализует целевое распределение для подстановки в промпт"""
+    return orjson.dumps(allocation, option=orjson.OPT_SORT_KEYS).decode()
+
+
+# Шаблон промпта check_rebalancing: собирается один раз при импорте,
+# на каждый вызов подставляются только параметры
+_CHECK_REBALANCING_PROMPT: Final[str] = """Check portfolio rebalancing for wallet {wallet_address} on {chain} (chain_id={chain_id}).
+
+STEP 1-2: get_account_tokens(chain_id={chain_id}, address="{wallet_address}") and get_account_balance(chain_id={chain_id}, address="{wallet_address}").
+STEP 3: get_token_prices_batch(symbols=[...]) once for all tokens.
+STEP 4: Build current_portfolio (see CALCULATIONS).
+STEP 5: calculate_rebalancing(current_portfolio=<STEP 4>, target_allocation={target_allocation}, threshold_percent=5.0)
+STEP 6: estimate_gas_fees(chain="{chain}", num_transactions=<number of actions from STEP 5>)
+STEP 7: suggest_rebalancing_trades(rebalancing_actions=<STEP 5>, gas_fees=<STEP 6>, min_profit_threshold_usd={min_profit_threshold_usd})
+STEP 8: Final recommendation (see RESPONSE FORMAT).
+
+Start with STEP {first_step} immediately.
+"""
+
+
+# Данные STEP 1-4, загруженные и посчитанные заранее без участия LLM
+_PREFETCHED_DATA_PROMPT: Final[str] = """PREFETCHED DATA: STEPS 1-4 are already completed, their results are below.
+Do NOT call get_account_tokens, get_account_balance, get_token_prices_batch or get_token_price again,
+and do NOT recalculate current_portfolio.
+Token balances are already converted from hex using decimals; native_balance is in native token units.
+
+Wallets: {wallets}
+Prices (TOKEN-USDT): {prices}
+current_portfolio (USD, from balances and prices): {current_portfolio}
+
+"""
+
+
+# Системный промпт отправляется первым сообщением на каждом шаге ask_tool
+# и поэтому кэшируется провайдером: Anthropic-провайдер spoon_ai помечает
+# system-сообщения от 4000 символов cache_control, OpenAI/OpenRouter кэшируют
+# одинаковый префикс от 1024 токенов автоматически. Промпт должен оставаться
+# статичным и побайтно одинаковым — все данные запроса передаются только
+# в пользовательских сообщениях.
+_SYSTEM_PROMPT_TEMPLATE: Final[str] = """\
+You are a professional AI agent for cryptocurrency portfolio rebalancing.
+Your task: analyze portfolio balances and provide rebalancing recommendations.
+
+EXECUTION RULES:
+- When given a task, immediately start calling tools. Do not ask questions.
+- If a tool call fails, retry it once or continue with available data.
+- If some prices are missing, continue with available data (use current_usd_price / balance_usd from token data).
+- Data already provided in the user message (balances, prices) must not be fetched again.
+
+{risk_tolerance}
+
+TOOLS FOR PORTFOLIO ANALYSIS (use ONLY these):
+- get_account_tokens(chain_id, address) - ERC20 token balances. Hex balances must be divided by 10^decimals.
+- get_account_balance(chain_id, address) - Native token balance in wei (divide by 1e18).
+- get_token_prices_batch(symbols) - Prices for ALL tokens in one call. Use "TOKEN-USDT" format (with dash, NOT slash).
+- get_token_price(symbol) - Single token price. Use only to retry one token after a batch error.
+- calculate_rebalancing(current_portfolio, target_allocation, threshold_percent) - Calculate rebalancing actions.
+- estimate_gas_fees(chain, num_transactions) - Estimate fees. Chain: "ethereum", "arbitrum", "polygon".
+- suggest_rebalancing_trades(rebalancing_actions, gas_fees, min_profit_threshold_usd) - Suggest trades.
+DO NOT USE get_strategies, get_strategy_details, find_strategy - they are for strategy management, not portfolio analysis.
+
+Chain IDs: {chain_ids}
+
+CALCULATIONS:
+- Hex balance: balance = int(hex) / 10^decimals. Example: balance="0x8edc", decimals=8 -> 36572 / 10^8 = 0.00036572
+- Price: use the price from get_token_prices_batch; if it is 0 or an error, use current_usd_price from token data
+- Wrapped tokens (aArbWBTC, aArbWETH, aArbUSDT): use the underlying token price, skip if not found
+- balance_usd = balance * price. Example: WBTC 0.00036572 * 116676 = 42.67
+- current_portfolio for calculate_rebalancing: {"total_balances": {"WBTC": 42.67, "USDT": 1962.04, ...}}
+  Include only tokens with balance_usd > 0
+- calculate_rebalancing returns {"total_portfolio_value_usd", "rebalancing_needed", "actions": [...]};
+  num_transactions for estimate_gas_fees = len(actions)
+- Pass the full calculate_rebalancing result as rebalancing_actions and the full estimate_gas_fees result
+  (with total_gas_usd) as gas_fees to suggest_rebalancing_trades
+
+WORKFLOW CHECKLIST (complete ALL steps in order):
+[ ] 1. Token balances: get_account_tokens
+[ ] 2. Native balance: get_account_balance
+[ ] 3. Prices: ONE get_token_prices_batch call for all tokens
+[ ] 4. Portfolio value and current allocation: balance_usd = balance * price; build current_portfolio
+[ ] 5. Rebalancing actions: calculate_rebalancing
+[ ] 6. Gas fees: estimate_gas_fees
+[ ] 7. Trades: suggest_rebalancing_trades
+[ ] 8. Final recommendation with summary
+Steps already completed by data in the user message count as checked.
+Do not stop, and do not say "Task finished", "No action needed" or "Thinking completed", until ALL items are checked.
+After each step provide the checklist with [x] for completed steps.
+
+RULES:
+- Suggest rebalancing only if deviation from target allocation exceeds the threshold (usually 5%)
+- Always verify that expected rebalancing benefits exceed gas fees
+- Provide clear recommendations with specific amounts in USD
+- Consultation mode (analysis only): don't suggest automatic execution
+- Autonomous mode: suggest specific transactions for execution
+
+RESPONSE FORMAT:
+- Brief summary of current portfolio status and total value
+- Current vs target allocation percentages
+- Deviations and whether rebalancing is needed
+- Suggested trades with amounts (if rebalancing is needed)
+- Total gas cost and expected benefit
+- Clear recommendation
+
+Always respond in the same language the user is using.
+"""
+
+
+def _render_risk_tolerance() -> str:
+    """Раздел RISK TOLERANCE системного промпта из _RISK_TOLERANCE и _TOKEN_CATEGORIES"""
+    lines = ["RISK TOLERANCE (share of portfolio in risky assets / stablecoins / conservative cryptocurrencies):"]
+    for level, ranges in _RISK_TOLERANCE.items():
+        lines.append(f"- {level}: " + " / ".join(f"{low}-{high}%" for low, high in ranges))
+    lines.append(" ".join(f"{category}: {', '.join(symbols)}." for category, symbols in _TOKEN_CATEGORIES.items()))
+    return "\n".join(lines)
+
+
+# Промпт рендерится один раз при импорте (через replace, а не format: в тексте
+# есть фигурные скобки JSON-примеров) и дальше не меняется
+_SYSTEM_PROMPT: Final[str] = _SYSTEM_PROMPT_TEMPLATE.replace(
+    "{risk_tolerance}", _render_risk_tolerance()
+).replace(
+    "{chain_ids}", ", ".join(f"{chain}={chain_id}" for chain, chain_id in _CHAIN_ID_MAP.items())
+)
+
+
+class PortfolioRebalancerAgent(ToolCallAgent):
+    """AI-агент для автоматической ребалансировки криптопортфеля"""
+    name: str = "portfolio_rebalancer_agent"
+    description: str = "AI агент для мониторинга и ребалансировки криптопортфеля на основе рыночных условий и допустимого уровня риска"
+
+    system_prompt: str = _SYSTEM_PROMPT
+
+    # Общий ToolManager для всех экземпляров: инструменты создаются при первом
+    # создании агента, а не при импорте модуля
+    _tool_manager: ClassVar[Optional[ToolManager]] = None
+
+    @classmethod
+    def _get_tool_manager(cls) -> ToolManager:
+        """Возвращает общий ToolManager, создавая его при первом вызове"""
+        if PortfolioRebalancerAgent._tool_manager is None:
+            PortfolioRebalancerAgent._tool_manager = ToolManager(_build_tools())
+        return PortfolioRebalancerAgent._tool_manager
     
     def __init__(self, **kwargs):
+        # Передаем ToolManager явно: значение по умолчанию pydantic копировал бы
+        # (deepcopy) для каждого экземпляра
+        if "available_tools" not in kwargs:
+            kwargs["available_tools"] = type(self)._get_tool_manager()
         super().__init__(**kwargs)
         self.max_steps = 30  # Увеличено для полного анализа портфеля
         self.mode: str = "consultation"  # "consultation" или "autonomous"
         self.target_allocation: Optional[Dict[str, float]] = None
+        self._target_allocation_json: Optional[str] = None
         self.min_profit_threshold_usd: float = 50.0
-        # Трекинг выполненных шагов для проверки завершения
-        self._required_steps = {
-            "get_balances": False,
-            "get_prices": False,
-            "calculate_rebalancing": False,
-            "estimate_gas": False,
-            "suggest_trades": False
-        }
+        # output_queue читает только run_stream: без активного стрима события
+        # не публикуются, а то, что кладет think() базового агента, удаляется
+        self._streaming: bool = False
 
     def set_mode(self, mode: str):
         """Устанавливает режим работы: 'consultation' или 'autonomous'"""
@@ -172,46 +467,202 @@ class PortfolioRebalancerAgent(ToolCallAgent):
     def set_target_allocation(self, allocation: Dict[str, float]):
         """Устанавливает целевое распределение портфеля"""
         self.target_allocation = allocation
+        self._target_allocation_json = _dump_allocation(allocation) if allocation else None
 
     def set_min_profit(self, min_profit: float):
         """Устанавливает минимальную прибыль для выполнения ребалансировки"""
         self.min_profit_threshold_usd = min_profit
     
-    def _check_completion_criteria(self, conversation_history: List[Any]) -> bool:
+    async def act(self) -> str:
         """
-        Проверяет, выполнены ли все необходимые шаги для завершения анализа портфеля.
-        Агент может остановиться только если все критерии выполнены.
+        Выполняет tool_calls одного ответа LLM параллельно.
+        
+        Вызовы внутри одного сообщения ассистента независимы (например,
+        get_account_tokens и get_account_balance для одного кошелька), поэтому
+        их запускаем через asyncio.gather, а tool-сообщения добавляем в память
+        в исходном порядке, как того требует API провайдера.
         """
-        # Сбрасываем трекинг при новом запросе
-        if not hasattr(self, '_current_task_steps'):
-            self._current_task_steps = {
-                "get_balances": False,
-                "get_prices": False,
-                "calculate_rebalancing": False,
-                "estimate_gas": False,
-                "suggest_trades": False,
-                "recommendation": False
-            }
+        if len(self.tool_calls) < 2:
+            result = await super().act()
+            if self.tool_calls:
+                self._emit_tool_result(self.tool_calls[0].function.name, result)
+            return result
         
-        # Проверяем историю разговора на наличие вызовов инструментов
-        tool_calls_found = {
-            "get_account_tokens": False,
-            "get_account_balance": False,
-            "get_token_prices": False,
-            "calculate_rebalancing": False,
-            "estimate_gas_fees": False,
-            "suggest_rebalancing_trades": False
-        }
+        async def _execute(tool_call) -> str:
+            try:
+                result = await self.execute_tool(tool_call)
+                if isinstance(result, str) and (
+                    "not healthy" in result.lower() or "execution failed" in result.lower()
+                ):
+                    self.last_tool_error = result
+                return result
+            except Exception as e:
+                logger.error(f"Tool {tool_call.function.name} execution failed: {e}")
+                self.last_tool_error = str(e)
+                return f"Error executing tool {tool_call.function.name}: {str(e)}"
         
-        # Анализируем последние сообщения для определения выполненных шагов
-        # Это используется как дополнительная проверка, основная логика в system_prompt
+        results = await asyncio.gather(*(_execute(tc) for tc in self.tool_calls))
         
-        # Для анализа портфеля требуется минимум: балансы, цены, расчет ребалансировки
-        # Но мы полагаемся на system_prompt для контроля, так как ToolCallAgent
-        # сам управляет остановкой на основе ответов LLM
+        for tool_call, result in zip(self.tool_calls, results):
+            await self.add_message("tool", result, tool_call_id=tool_call.id, tool_name=tool_call.function.name)
+            self._emit_tool_result(tool_call.function.name, result)
+        return "\n\n".join(str(r) for r in results)
+    
+    def reset_conversation(self) -> None:
+        """Очищает историю диалога и состояние, сохраняя настройки агента"""
+        # clear() сбрасывает state в IDLE — для выполняющегося агента это сломало бы run()
+        if self.state != AgentState.IDLE:
+            raise RuntimeError(f"Agent {self.name} is busy - another run() operation is in progress")
+        self.clear()
+    
+    def _emit_tool_result(self, tool_name: str, result: Any) -> None:
+        """Публикует результат инструмента в output_queue, если его читает run_stream"""
+        if self._streaming and self.output_queue is not None:
+            self.output_queue.put_nowait({"tool_name": tool_name, "tool_result": result})
+    
+    def _drain_output_queue(self) -> None:
+        """Удаляет непрочитанные события из output_queue"""
+        queue = self.output_queue
+        if queue is None:
+            return
+        while not queue.empty():
+            queue.get_nowait()
+    
+    async def run(self, request: Optional[str] = None) -> str:
+        """
+        run() базового агента без накопления событий в output_queue
         
-        return False  # Всегда возвращаем False, чтобы полагаться на system_prompt
+        Агенты кэшируются по пользователю, и при вызовах без стриминга
+        (ChatService.send_message) очередь никто не читает — без очистки
+        она росла бы с каждым запросом.
+        """
+        try:
+            return await super().run(request)
+        finally:
+            if not self._streaming:
+                self._drain_output_queue()
     
+    async def run_stream(self, request: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Выполняет run() и отдает промежуточные события по мере их появления
+        
+        Yields:
+            {"type": "content" | "tool_calls" | "tool_result", ...} для каждого шага
+            и в конце {"type": "final", "content": <ответ run()>}
+        """
+        queue = self.output_queue
+        # События прошлых запусков без стриминга никто не прочитал
+        self._drain_output_queue()
+        
+        self._streaming = True
+        run_task = asyncio.create_task(self.run(request))
+        try:
+            while True:
+                get_task = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get_task, run_task}, return_when=asyncio.FIRST_COMPLETED)
+                if get_task not in done:
+                    get_task.cancel()
+                    break
+                event = _stream_event(get_task.result())
+                if event is not None:
+                    yield event
+            
+            while not queue.empty():
+                event = _stream_event(queue.get_nowait())
+                if event is not None:
+                    yield event
+            
+            yield {"type": "final", "content": await run_task}
+        finally:
+            self._streaming = False
+            if not run_task.done():
+                run_task.cancel()
+            self._drain_output_queue()
+    
+    async def _prefetch_portfolio_data(self, wallets: list, tokens: list, chain_id: int) -> Dict[str, Any]:
+        """
+        Параллельно загружает балансы всех кошельков и цены токенов (STEP 1-3)
+        и считает current_portfolio (STEP 4).
+        
+        Детерминированный сбор данных выполняется без LLM через asyncio.gather,
+        поэтому общая задержка равна самому долгому запросу, а не их сумме.
+        Арифметику считаем в Python: LLM делает ее медленно и с ошибками.
+        
+        Returns:
+            Dict вида {"wallets": {address: {...}}, "prices": {"ETH-USDT": {...}},
+            "current_portfolio": {"total_balances": {...}}}
+        """
+        semaphore = asyncio.Semaphore(_PREFETCH_CONCURRENCY)
+        
+        async def _limited(coro):
+            async with semaphore:
+                return await coro
+        
+        results = await asyncio.gather(
+            *(_limited(_get_tokens_tool.execute(chain_id=chain_id, address=w)) for w in wallets),
+            *(_limited(_get_balance_tool.execute(chain_id=chain_id, address=w)) for w in wallets),
+            return_exceptions=True,
+        )
+        tokens_results, balance_results = results[:len(wallets)], results[len(wallets):]
+        
+        native_symbol = _NATIVE_SYMBOLS.get(chain_id, "ETH")
+        prefetched: Dict[str, Any] = {"wallets": {}, "prices": {}}
+        symbols: Dict[str, None] = dict.fromkeys(t.strip().upper() for t in tokens or [] if t)
+        
+        for wallet, tokens_result, balance_result in zip(wallets, tokens_results, balance_results):
+            if isinstance(tokens_result, Exception):
+                tokens_result = {"error": str(tokens_result)}
+            if isinstance(balance_result, Exception):
+                balance_result = {"error": str(balance_result)}
+            
+            processed = self.process_token_balances(tokens_result)
+            wallet_data: Dict[str, Any] = {
+                "tokens": {
+                    symbol: {
+                        "balance": data["balance"],
+                        "balance_usd": data["balance_usd"],
+                        "decimals": data["decimals"],
+                    }
+                    for symbol, data in processed["tokens"].items()
+                },
+            }
+            if processed["error"]:
+                wallet_data["tokens_error"] = processed["error"]
+            if "error" in balance_result:
+                wallet_data["native_balance_error"] = balance_result["error"]
+            else:
+                wallet_data["native_balance"] = convert_hex_balance_to_float(balance_result.get("data", "0x0"), 18)
+            
+            prefetched["wallets"][wallet] = wallet_data
+            symbols.update(dict.fromkeys(processed["tokens"]))
+            if wallet_data.get("native_balance", 0.0) > 0:
+                symbols[native_symbol] = None
+        
+        # Цена запрашивается один раз на базовый токен; стейблкоины не запрашиваются
+        pairs = list(dict.fromkeys(
+            f"{aggregation_symbol}-USDT"
+            for aggregation_symbol in map(_aggregation_symbol, symbols)
+            if aggregation_symbol not in _STABLECOINS
+        ))
+        if pairs:
+            async with semaphore:
+                prices_result = await _batch_prices_tool.execute(symbols=pairs)
+            prefetched["prices"] = prices_result.output or {}
+        
+        prefetched["current_portfolio"] = _build_current_portfolio(
+            prefetched["wallets"], prefetched["prices"], native_symbol
+        )
+        return prefetched
+
+    @staticmethod
+    def _format_prefetched(prefetched: Dict[str, Any]) -> str:
+        """Формирует блок промпта с предзагруженными данными"""
+        return _PREFETCHED_DATA_PROMPT.format(
+            wallets=orjson.dumps(prefetched["wallets"], default=str).decode(),
+            prices=orjson.dumps(prefetched["prices"], default=str).decode(),
+            current_portfolio=orjson.dumps(prefetched["current_portfolio"]).decode(),
+        )
+
     @staticmethod
     def process_token_balances(tokens_result: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -241,191 +692,144 @@ class PortfolioRebalancerAgent(ToolCallAgent):
         
         data = tokens_result.get("data", [])
         
-        for token_data in data:
-            symbol = token_data.get("symbol", "").strip().upper()
-            
-            # Пропускаем некорректные токены
-            if not symbol or "|" in symbol or len(symbol) > 20:
-                continue
-            
-            decimals = token_data.get("decimals", 18)
-            raw_balance = token_data.get("balance", "0x0")
-            
-            # Конвертируем hex баланс в число
-            balance = convert_hex_balance_to_float(raw_balance, decimals)
-            
-            if balance <= 0:
-                continue
-            
-            # Получаем баланс в USD
-            balance_usd = float(token_data.get("balance_usd", 0) or 0)
-            
-            # Если balance_usd не указан, но есть current_usd_price, вычисляем
-            if balance_usd == 0:
-                current_price = float(token_data.get("current_usd_price", 0) or 0)
-                if current_price > 0:
-                    balance_usd = balance * current_price
-            
-            processed["tokens"][symbol] = {
+        if len(data) >= _VECTORIZE_MIN_TOKENS:
+            processed["tokens"], processed["total_value_usd"] = _process_tokens_vectorized(data)
+            return processed
+        
+        entries = [entry for entry in map(_token_entry, data) if entry is not None]
+        processed["tokens"] = {
+            symbol: {
                 "balance": balance,
                 "balance_usd": balance_usd,
-                "decimals": decimals,
-                "raw_balance": raw_balance,
+                "decimals": token_data.get("decimals", 18),
+                "raw_balance": token_data.get("balance", "0x0"),
                 "contract_address": token_data.get("contract_address"),
                 "name": token_data.get("name")
             }
-            
-            processed["total_value_usd"] += balance_usd
+            for symbol, balance, balance_usd, token_data in entries
+        }
+        processed["total_value_usd"] = math.fsum(entry[2] for entry in entries)
         
         return processed
 
-    async def analyze_portfolio(self, wallets: list, tokens: list, chain: str = "ethereum") -> Dict[str, Any]:
-        """Анализирует текущее состояние портфеля"""
+    async def analyze_portfolio(self, wallets: list, tokens: list, chain: str = "ethereum",
+                                prefetched: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Анализирует текущее состояние портфеля
+        
+        prefetched — уже загруженный результат _prefetch_portfolio_data для тех же
+        wallets/tokens/chain (см. analyze_and_check)
+        """
+        # Без кошельков LLM впустую прокрутит до max_steps шагов
+        if not wallets:
+            return {"error": "No wallets provided"}
+        
         # Определяем chain_id для инструментов
-        chain_id_map = {
-            "ethereum": 1,
-            "polygon": 137,
-            "arbitrum": 42161,
-            "optimism": 10,
-            "bsc": 56
-        }
-        chain_id = chain_id_map.get(chain.lower(), 1)
+        chain_id = _CHAIN_ID_MAP.get(chain.lower(), 1)
         
-        prompt = f"""
-Analyze portfolio. Execute tools in order:
-
-1. Call get_account_tokens for wallet {wallets[0]} with chain_id={chain_id}
-2. Call get_account_balance for wallet {wallets[0]} with chain_id={chain_id}
-3. Call get_token_prices for each token using format "TOKEN-USDT" (with dash, not slash)
-   Tokens to check: {', '.join(tokens) if tokens else 'all tokens from step 1'}
-   Example: get_token_prices(symbol="ETH-USDT"), get_token_prices(symbol="BTC-USDT")
-4. Calculate total value and allocation percentages
-5. Provide summary with portfolio value and token allocations
-
-Start by calling get_account_tokens now.
+        if prefetched is None:
+            prefetched = await self._prefetch_portfolio_data(wallets, tokens, chain_id)
+        # Промпт самодостаточен: история прошлых запросов только увеличит контекст
+        self.reset_conversation()
+        prompt = self._format_prefetched(prefetched) + """Analyze portfolio of all wallets above:
+
+1. Calculate total value and allocation percentages from current_portfolio
+2. Provide summary with portfolio value and token allocations
 """
         response = await self.run(prompt)
         return {"analysis": response}
 
     async def check_rebalancing(self, wallets: list, tokens: list, 
                                 target_allocation: Dict[str, float],
-                                chain: str = "ethereum") -> Dict[str, Any]:
+                                chain: str = "ethereum",
+                                prefetched: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Проверяет необходимость ребалансировки и предлагает действия"""
+        response = None
+        async for event in self.check_rebalancing_stream(wallets, tokens, target_allocation, chain, prefetched):
+            if event["type"] == "error":
+                return {"error": event["content"]}
+            if event["type"] == "final":
+                response = event["content"]
+        return {"recommendation": response, "mode": self.mode}
+
+    async def check_rebalancing_stream(self, wallets: list, tokens: list,
+                                       target_allocation: Dict[str, float],
+                                       chain: str = "ethereum",
+                                       prefetched: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Проверка ребалансировки с отдачей промежуточных результатов
+        
+        prefetched — как в analyze_portfolio
+        
+        Yields:
+            События run_stream(); при ошибке входных данных — {"type": "error", "content": ...}
+        """
         if not target_allocation:
             target_allocation = self.target_allocation or {}
         
         if not target_allocation:
-            return {"error": "Target allocation is not set"}
+            yield {"type": "error", "content": "Target allocation is not set"}
+            return
+        
+        if not wallets:
+            yield {"type": "error", "content": "No wallets provided"}
+            return
         
         # Определяем chain_id для инструментов
-        chain_id_map = {
-            "ethereum": 1,
-            "polygon": 137,
-            "arbitrum": 42161,
-            "optimism": 10,
-            "bsc": 56
-        }
-        chain_id = chain_id_map.get(chain.lower(), 1)
-        wallet_address = wallets[0] if wallets else ""
-        
-        prompt = f"""Analyze portfolio rebalancing. You MUST complete ALL 8 steps below. Do not stop early.
-
-STEP 1: Get token balances
-Call: get_account_tokens(chain_id={chain_id}, address="{wallet_address}")
-After getting result, extract token symbols and balances. Convert hex balances using decimals.
-
-STEP 2: Get native balance  
-Call: get_account_balance(chain_id={chain_id}, address="{wallet_address}")
-Convert wei to ETH (divide by 1e18).
-
-STEP 3: Get prices for tokens (do not stop after this step)
-For each token found in STEP 1, call: get_token_prices(symbol="TOKEN-USDT")
-- Focus on main tokens: WBTC, ETH, USDT, ARB (skip aArb* wrapped tokens if prices not found)
-- If price is 0 or error, use current_usd_price from token data if available (e.g., USDT has current_usd_price: 1962.04)
-- For wrapped tokens (aArbWBTC, aArbWETH, aArbUSDT), skip if price not found or use underlying token price
-- IMPORTANT: After getting prices, you MUST continue to STEP 4. Do not stop here.
-
-STEP 4: Calculate portfolio value and current allocation (REQUIRED - do not skip)
-Process data from STEP 1 and STEP 3:
-- For each token from STEP 1 result:
-  * Extract: symbol (e.g., "WBTC"), balance (hex like "0x8edc"), decimals (e.g., 8), current_usd_price (if available)
-  * Convert hex balance: if balance="0x8edc" and decimals=8, then: 0x8edc (hex) = 36572 (decimal), balance = 36572 / 10^8 = 0.00036572
-  * Get price: use price from STEP 3 if found, otherwise use current_usd_price from token data
-  * Calculate balance_usd: balance_usd = balance * price
-  * Example: WBTC balance=0.00036572, price=116676 (from STEP 3), balance_usd = 0.00036572 * 116676 = 42.67
-- Create current_portfolio object for calculate_rebalancing tool:
-  current_portfolio = {{"total_balances": {{"WBTC": 42.67, "USDT": 1962.04, ...}}}}
-- Only include tokens with valid balance_usd > 0
-- This step is REQUIRED - you must create the current_portfolio object before proceeding
-
-STEP 5: Calculate rebalancing needs (REQUIRED - do not skip)
-Call: calculate_rebalancing(
-  current_portfolio={{current_portfolio from STEP 4}},
-  target_allocation={json.dumps(target_allocation, ensure_ascii=False)},
-  threshold_percent=5.0
-)
-This will return rebalancing_actions with list of actions needed.
-
-STEP 6: Estimate gas fees (REQUIRED - do not skip)
-Count number of actions from STEP 5 result.
-Call: estimate_gas_fees(chain="{chain}", num_transactions=number_of_actions)
-
-STEP 7: Suggest trades (REQUIRED - do not skip)
-Call: suggest_rebalancing_trades(
-  rebalancing_actions={{result from STEP 5}},
-  gas_fees={{result from STEP 6}},
-  min_profit_threshold_usd={self.min_profit_threshold_usd}
-)
-
-STEP 8: Provide final recommendation (REQUIRED - do not skip)
-Summarize:
-- Current portfolio value
-- Current vs target allocation
-- Whether rebalancing is needed
-- Suggested trades with amounts
-- Total gas cost and expected benefit
-- Clear recommendation
-
-Target allocation: {json.dumps(target_allocation, ensure_ascii=False)}
-
-BEFORE STOPPING - VERIFY ALL STEPS COMPLETED:
-✓ STEP 1: get_account_tokens called
-✓ STEP 2: get_account_balance called
-✓ STEP 3: get_token_prices called for tokens
-✓ STEP 4: Portfolio value calculated, current_portfolio object created
-✓ STEP 5: calculate_rebalancing tool called
-✓ STEP 6: estimate_gas_fees tool called
-✓ STEP 7: suggest_rebalancing_trades tool called
-✓ STEP 8: Final recommendation provided
-
-ONLY after ALL 8 steps above are completed, you can say the task is finished.
-If any step is missing, you MUST continue and complete it.
-
-CRITICAL STOPPING RULES:
-You can ONLY stop and say "Task finished" when you have completed ALL of these:
-✓ Called get_account_tokens (STEP 1)
-✓ Called get_account_balance (STEP 2)
-✓ Called get_token_prices for tokens (STEP 3)
-✓ Calculated portfolio value and created current_portfolio object (STEP 4)
-✓ Called calculate_rebalancing tool (STEP 5) - REQUIRED
-✓ Called estimate_gas_fees tool (STEP 6) - REQUIRED
-✓ Called suggest_rebalancing_trades tool (STEP 7) - REQUIRED
-✓ Provided final recommendation with summary (STEP 8) - REQUIRED
-
-DO NOT STOP if any step above is missing. Continue until ALL steps are complete.
-
-OTHER INSTRUCTIONS:
-- Complete ALL 8 steps. NEVER stop after STEP 3 (getting prices).
-- After STEP 3, you MUST proceed to STEP 4 (calculations), then STEP 5, 6, 7, 8.
-- If some prices are missing, continue with available data. Use current_usd_price from token data when available.
-- Always call calculate_rebalancing (STEP 5), estimate_gas_fees (STEP 6), and suggest_rebalancing_trades (STEP 7).
-- Do not use get_strategies, get_strategy_details, or find_strategy tools.
-- Do not say "Task finished", "No action needed", or "Thinking completed" until you complete STEP 8.
-- Start with STEP 1 immediately.
-"""
+        chain_id = _CHAIN_ID_MAP.get(chain.lower(), 1)
+        wallet_address = wallets[0]
         
-        response = await self.run(prompt)
-        return {"recommendation": response, "mode": self.mode}
+        # Для целевого распределения агента используем сериализацию из set_target_allocation
+        if target_allocation is self.target_allocation and self._target_allocation_json is not None:
+            target_allocation_json = self._target_allocation_json
+        else:
+            target_allocation_json = _dump_allocation(target_allocation)
+        
+        # STEP 1-4 выполняем сами, LLM начинает с calculate_rebalancing
+        if prefetched is None:
+            prefetched = await self._prefetch_portfolio_data(wallets, tokens, chain_id)
+        prompt = self._format_prefetched(prefetched) + _CHECK_REBALANCING_PROMPT.format(
+            chain_id=chain_id,
+            wallet_address=wallet_address,
+            chain=chain,
+            target_allocation=target_allocation_json,
+            min_profit_threshold_usd=self.min_profit_threshold_usd,
+            first_step=5,
+        )
+        
+        self.reset_conversation()
+        async for event in self.run_stream(prompt):
+            yield event
+
+    def _spawn(self) -> "PortfolioRebalancerAgent":
+        """Создает агента с теми же настройками и отдельной историей сообщений"""
+        agent = type(self)(llm=self.llm)
+        agent.set_mode(self.mode)
+        if self.target_allocation:
+            agent.set_target_allocation(self.target_allocation)
+        agent.set_min_profit(self.min_profit_threshold_usd)
+        return agent
+
+    async def analyze_and_check(self, wallets: list, tokens: list,
+                                target_allocation: Dict[str, float],
+                                chain: str = "ethereum") -> Dict[str, Any]:
+        """
+        Анализ портфеля и проверка ребалансировки одновременно.
+        
+        run() агента не реентерабелен (общая память и состояние), поэтому
+        проверка ребалансировки выполняется на копии агента с теми же настройками.
+        Данные портфеля загружаются один раз и передаются обоим.
+        """
+        if not wallets:
+            return {"error": "No wallets provided"}
+        
+        chain_id = _CHAIN_ID_MAP.get(chain.lower(), 1)
+        prefetched = await self._prefetch_portfolio_data(wallets, tokens, chain_id)
+        analysis, recommendation = await asyncio.gather(
+            self.analyze_portfolio(wallets, tokens, chain, prefetched),
+            self._spawn().check_rebalancing(wallets, tokens, target_allocation, chain, prefetched),
+        )
+        return {**analysis, **recommendation}
 
     async def rebalance_portfolio(self, wallets: list, tokens: list,
                                   target_allocation: Dict[str, float],
@@ -435,9 +839,12 @@ OTHER INSTRUCTIONS:
         if self.mode == "consultation" and auto_execute:
             return {"error": "Automatic execution is not available in consultation mode"}
         
+        if not wallets:
+            return {"error": "No wallets provided"}
+        
         result = await self.check_rebalancing(wallets, tokens, target_allocation, chain)
         
-        if auto_execute and self.mode == "autonomous":
+        if auto_execute and self.mode == "autonomous" and "error" not in result:
             # В реальной реализации здесь бы выполнялись транзакции
             result["execution_status"] = "simulated"
             result["note"] = "В демо-режиме транзакции не выполняются. В production здесь бы выполнялись реальные сделки."
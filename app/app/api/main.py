@@ -1,11 +1,16 @@
 """
 Главный файл FastAPI приложения
 """
-import os
 import asyncio
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
+from app.api.middleware import ETagMiddleware
 from app.api.routes import wallets, strategies, recommendations, chat, agent, token_balances
 from app.core.logging_config import setup_logging, get_logger
 
@@ -13,10 +18,82 @@ from app.core.logging_config import setup_logging, get_logger
 setup_logging()
 logger = get_logger(__name__)
 
+# Результат /health кэшируется на 1 секунду: пробы балансировщика
+# не должны каждый раз ходить в БД
+_HEALTH_TTL_SECONDS = 1.0
+_last_health: tuple[float, dict] = (0.0, {})
+_health_lock = asyncio.Lock()
+
+
+async def _ping_db() -> None:
+    """Проверяет подключение к БД"""
+    from app.db import get_async_engine
+    from sqlalchemy import text
+    async with get_async_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _on_monitor_done(task: asyncio.Task) -> None:
+    """Логирует ошибку запуска мониторинга сразу, а не при остановке приложения"""
+    if task.cancelled() or task.exception() is None:
+        return
+    logger.error("❌ Ошибка запуска мониторинга стратегий", exc_info=task.exception())
+    from app.services.strategy_monitor_service import StrategyMonitorService
+    # Иначе повторный start_monitoring_async() ничего не сделает
+    StrategyMonitorService._running = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запуск и остановка приложения"""
+    logger.info("🚀 Запуск API сервера ребалансировки портфеля...")
+    monitor_started = False
+    
+    # Проверка подключения к БД (миграции применяются отдельным контейнером)
+    try:
+        await _ping_db()
+        logger.info("✅ Подключение к базе данных успешно")
+        from app.db import get_async_engine
+        logger.debug(f"Пул соединений БД: {get_async_engine().pool.status()}")
+        
+        # Запускаем мониторинг стратегий в фоне
+        # (каждая стратегия проверяется каждые 10 минут)
+        from app.services.strategy_monitor_service import StrategyMonitorService
+        monitor_task = asyncio.create_task(StrategyMonitorService.start_monitoring_async())
+        monitor_task.add_done_callback(_on_monitor_done)
+        monitor_started = True
+        logger.info("✅ Мониторинг стратегий запущен")
+    except Exception as e:
+        logger.warning(f"⚠️  Предупреждение при подключении к БД: {e}")
+        logger.warning("   Убедитесь, что PostgreSQL запущен и миграции применены")
+    
+    yield
+    
+    from app.services.task_service import TaskService
+    from app.utils.http import close_http_client
+    from app.db import dispose_engine
+    try:
+        if monitor_started:
+            # Ошибка запуска уже залогирована в _on_monitor_done
+            await asyncio.gather(monitor_task, return_exceptions=True)
+            await StrategyMonitorService.stop_monitoring()
+    finally:
+        # Каждый шаг остановки выполняется, даже если предыдущий упал
+        try:
+            await TaskService.shutdown()
+        finally:
+            try:
+                await close_http_client()
+            finally:
+                await dispose_engine()
+
+
 app = FastAPI(
     title="Portfolio Rebalancer API",
     description="REST API для агента автоматической ребалансировки криптопортфеля с управлением кошельками и стратегиями",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Настройка CORS
@@ -28,6 +105,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ETag/304 для JSON-ответов GET (повторные опросы списков без тела)
+app.add_middleware(ETagMiddleware)
+
+# Сжатие ответов от 1 КБ (списки, история чата). Добавляется после ETag,
+# то есть снаружи: ETag считается по несжатому телу. SSE не сжимается
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Подключение роутов
 app.include_router(wallets.router)
 app.include_router(strategies.router)
@@ -37,29 +121,18 @@ app.include_router(agent.router)
 app.include_router(token_balances.router)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Событие при запуске приложения"""
-    logger.info("🚀 Запуск API сервера ребалансировки портфеля...")
-    
-    # Проверка подключения к БД (миграции применяются отдельным контейнером)
-    try:
-        from app.db import get_engine, get_db
-        from sqlalchemy import text
-        engine = get_engine()
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        logger.info("✅ Подключение к базе данных успешно")
-        
-        # Запускаем мониторинг стратегий в фоне
-        from app.services.strategy_monitor_service import StrategyMonitorService
-        # Запускаем в фоне (каждая стратегия проверяется каждые 10 минут)
-        # Используем get_db() внутри мониторинга для получения сессии
-        asyncio.create_task(StrategyMonitorService.start_monitoring_async())
-        logger.info("✅ Мониторинг стратегий запущен")
-    except Exception as e:
-        logger.warning(f"⚠️  Предупреждение при подключении к БД: {e}")
-        logger.warning("   Убедитесь, что PostgreSQL запущен и миграции применены")
+def _check_unique_routes(app: FastAPI) -> None:
+    """Проверяет, что роутер не подключен дважды (одинаковые метод и путь)"""
+    seen = set()
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ("*",):
+            key = (method, route.path)
+            if key in seen:
+                raise RuntimeError(f"Маршрут {method} {route.path} зарегистрирован дважды")
+            seen.add(key)
+
+
+_check_unique_routes(app)
 
 
 @app.get("/")
@@ -86,20 +159,28 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Проверка здоровья сервиса"""
-    try:
-        from app.db import get_engine
-        from sqlalchemy import text
-        engine = get_engine()
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        return {
-            "status": "healthy",
-            "database": "connected"
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e)
-        }
-
+    global _last_health
+    checked_at, result = _last_health
+    if time.monotonic() - checked_at < _HEALTH_TTL_SECONDS:
+        return result
+    
+    # Одновременные пробы ждут одну проверку БД вместо запроса на каждую
+    async with _health_lock:
+        checked_at, result = _last_health
+        if time.monotonic() - checked_at < _HEALTH_TTL_SECONDS:
+            return result
+        
+        try:
+            await _ping_db()
+            result = {
+                "status": "healthy",
+                "database": "connected"
+            }
+        except Exception as e:
+            result = {
+                "status": "unhealthy",
+                "database": "disconnected",
+                "error": str(e)
+            }
+        _last_health = (time.monotonic(), result)
+        return result
@@ -0,0 +1,18 @@
+"""
+Ответы из готовых моделей без повторной валидации FastAPI
+"""
+from fastapi import Response
+from pydantic import BaseModel
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """
+    Сериализует модель ответа сервиса сразу в JSON
+
+    Сервисы уже возвращают модели *Response нужной формы. Если вернуть модель
+    из обработчика, FastAPI выгрузит ее в dict, провалидирует по response_model
+    и сериализует заново; готовый Response он отдает как есть. response_model
+    в декораторе остается только для схемы OpenAPI. status_code декоратора
+    к Response не применяется, поэтому передается явно.
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json", status_code=status_code)
@@ -2,7 +2,7 @@
 Роуты для работы с агентом
 """
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from app.db import get_db, get_user_id
@@ -14,21 +14,27 @@ router = APIRouter(prefix="/api/agent", tags=["agent"])
 
 @router.get("/status")
 async def get_agent_status(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить текущий статус и конфигурацию агента"""
-    return AgentService.get_agent_status(db, user_id)
+    return await AgentService.get_agent_status(db, user_id)
 
 
 @router.post("/configure")
 async def configure_agent(
     request: AgentConfigRequest,
-    db: Session = Depends(get_db)
+    user_id: uuid.UUID = Depends(get_user_id)
 ):
-    """Настроить параметры агента"""
+    """
+    Настроить параметры агента
+    
+    Меняет только агента в памяти процесса: сессия БД не нужна, а в
+    threadpool выносить нечего — обработчик не блокирует event loop.
+    """
     return AgentService.configure_agent(
         mode=request.mode,
-        min_profit_threshold_usd=request.min_profit_threshold_usd
+        min_profit_threshold_usd=request.min_profit_threshold_usd,
+        user_id=user_id
     )
 
@@ -1,57 +1,148 @@
 """
 Роуты для работы с чатом
 """
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import uuid
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, Optional
 import logging
+import orjson
 
 from app.db import get_db, get_user_id
-from app.api.schemas import ChatMessage, ChatResponse, ChatHistoryResponse
+from app.api.schemas import ChatMessage, ChatResponse, ChatHistoryResponse, TaskResponse
+from app.api.responses import model_response
 from app.services.chat_service import ChatService
 from app.services.agent_service import AgentService
+from app.services.task_service import TaskService
+from app.utils.response_cache import cached_response
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+# Сериализатор истории создается один раз; ответ отдается готовыми байтами JSON
+_HISTORY_TA = TypeAdapter(ChatHistoryResponse)
+
+# Интервал keep-alive комментариев в SSE-подписке на новые сообщения
+_KEEPALIVE_SECONDS = 15
+
 
 @router.post("", response_model=ChatResponse)
 async def chat_with_agent(
     message: ChatMessage,
-    db: Session = Depends(get_db),
+    background: bool = Query(False, description="Выполнить в фоне и сразу вернуть task_id"),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
-    """Отправить сообщение агенту"""
-    logger.info(f"Получено сообщение от пользователя {user_id}, strategy_id: {message.strategy_id}")
+    """
+    Отправить сообщение агенту
+    
+    С background=true возвращает 202 и TaskResponse: ответ агента забирается
+    через /api/chat/result/{task_id} или приходит в /api/chat/new-messages/stream.
+    """
+    logger.debug("Получено сообщение от пользователя %s, strategy_id: %s", user_id, message.strategy_id)
+    if background:
+        task = TaskService.submit(
+            user_id, "chat",
+            lambda task_db: ChatService.send_message(task_db, message, user_id, AgentService.get_agent)
+        )
+        return model_response(task, status_code=202)
     try:
         response = await ChatService.send_message(db, message, user_id, AgentService.get_agent)
-        logger.debug(f"Ответ агента отправлен пользователю {user_id}, message_id: {response.message_id}")
-        return response
+        logger.debug("Ответ агента отправлен пользователю %s, message_id: %s", user_id, response.message_id)
+        return model_response(response)
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения от пользователя {user_id}: {e}", exc_info=True)
         raise
 
 
+@router.get("/result/{task_id}", response_model=TaskResponse)
+async def get_chat_result(
+    task_id: str,
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """Получить состояние фоновой отправки сообщения"""
+    return model_response(TaskService.get_task(task_id, user_id, "chat"))
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    """Форматирует событие агента для text/event-stream"""
+    return f"event: {event['type']}\ndata: {orjson.dumps(event, default=str).decode()}\n\n"
+
+
+@router.post("/stream")
+async def chat_with_agent_stream(
+    message: ChatMessage,
+    db: AsyncSession = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """Отправить сообщение агенту и получать шаги ответа через Server-Sent Events"""
+    logger.debug("Получено сообщение (stream) от пользователя %s, strategy_id: %s", user_id, message.strategy_id)
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in ChatService.stream_message(db, message, user_id, AgentService.get_agent):
+                yield _sse(event)
+        except HTTPException as e:
+            yield _sse({"type": "error", "status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Ошибка при обработке сообщения от пользователя {user_id}: {e}", exc_info=True)
+            yield _sse({"type": "error", "status_code": 500, "detail": str(e)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.get("/history", response_model=ChatHistoryResponse)
 async def get_chat_history(
     strategy_id: Optional[str] = Query(None, description="Фильтр по ID стратегии"),
     limit: int = Query(50, description="Максимальное количество сообщений"),
-    db: Session = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить историю чата пользователя"""
-    return ChatService.get_chat_history(db, user_id, limit, strategy_id)
+    history = await cached_response(
+        "chat_history", user_id, (strategy_id, limit),
+        lambda db: ChatService.get_chat_history(db, user_id, limit, strategy_id)
+    )
+    return Response(content=_HISTORY_TA.dump_json(history), media_type="application/json")
 
 
 @router.get("/new-messages", response_model=ChatHistoryResponse)
 async def get_new_messages(
     strategy_id: Optional[str] = Query(None, description="ID стратегии"),
     after_message_id: Optional[str] = Query(None, description="Получить сообщения после этого ID"),
-    db: Session = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить новые сообщения в чате (для polling)"""
-    return ChatService.get_new_messages(db, user_id, strategy_id, after_message_id)
+    messages = await cached_response(
+        "chat_new_messages", user_id, (strategy_id, after_message_id),
+        lambda db: ChatService.get_new_messages(db, user_id, strategy_id, after_message_id)
+    )
+    return Response(content=_HISTORY_TA.dump_json(messages), media_type="application/json")
 
+
+@router.get("/new-messages/stream")
+async def stream_new_messages(
+    strategy_id: Optional[str] = Query(None, description="ID стратегии"),
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """
+    Подписка на новые сообщения в чате через Server-Sent Events
+    
+    Заменяет polling /new-messages: сообщение отправляется клиенту сразу после
+    сохранения, без запросов к БД на каждый опрос.
+    """
+    async def events() -> AsyncIterator[str]:
+        async with ChatService.subscribe(user_id, strategy_id) as queue:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse({"type": "message", "message": message})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -2,46 +2,78 @@
 Роуты для работы с рекомендациями
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from app.db import get_db, get_user_id
-from app.api.schemas import RecommendationRequest, RecommendationResponse
+from app.api.schemas import RecommendationRequest, RecommendationResponse, TaskResponse
+from app.api.responses import model_response
 from app.services.recommendation_service import RecommendationService
+from app.services.task_service import TaskService
+from app.utils.response_cache import cached_response
 
 router = APIRouter(prefix="/api/recommendations", tags=["recommendations"])
 
+# Сериализатор списка создается один раз; ответ отдается готовыми байтами JSON
+_RECOMMENDATION_LIST_TA = TypeAdapter(List[RecommendationResponse])
+
 
 @router.post("", response_model=RecommendationResponse, status_code=201)
 async def create_recommendation(
     request: RecommendationRequest,
-    db: Session = Depends(get_db),
+    background: bool = Query(False, description="Выполнить в фоне и сразу вернуть task_id"),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
-    """Получить рекомендацию по ребалансировке для стратегии"""
-    return await RecommendationService.create_recommendation(
+    """
+    Получить рекомендацию по ребалансировке для стратегии
+    
+    С background=true возвращает 202 и TaskResponse, рекомендация забирается
+    через /api/recommendations/result/{task_id}.
+    """
+    if background:
+        task = TaskService.submit(
+            user_id, "recommendation",
+            lambda task_db: RecommendationService.create_recommendation(task_db, request, user_id)
+        )
+        return model_response(task, status_code=202)
+    recommendation = await RecommendationService.create_recommendation(
         db, request, user_id, get_agent_func=None  # Graph System используется вместо агента
     )
+    return model_response(recommendation, status_code=201)
+
+
+@router.get("/result/{task_id}", response_model=TaskResponse)
+async def get_recommendation_result(
+    task_id: str,
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """Получить состояние фоновой генерации рекомендации"""
+    return model_response(TaskService.get_task(task_id, user_id, "recommendation"))
 
 
 @router.get("/{recommendation_id}", response_model=RecommendationResponse)
 async def get_recommendation(
-    recommendation_id: str,
-    db: Session = Depends(get_db),
+    recommendation_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить конкретную рекомендацию по ID"""
-    return RecommendationService.get_recommendation(db, recommendation_id, user_id)
+    return model_response(await RecommendationService.get_recommendation(db, recommendation_id, user_id))
 
 
 @router.get("", response_model=List[RecommendationResponse])
 async def get_recommendations(
     strategy_id: Optional[str] = None,
     limit: int = 50,
-    db: Session = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить историю рекомендаций пользователя"""
-    return RecommendationService.get_recommendations(db, user_id, strategy_id, limit)
+    recommendations = await cached_response(
+        "recommendations", user_id, (strategy_id, limit),
+        lambda db: RecommendationService.get_recommendations(db, user_id, strategy_id, limit)
+    )
+    return Response(content=_RECOMMENDATION_LIST_TA.dump_json(recommendations), media_type="application/json")
 
@@ -2,62 +2,70 @@
 Роуты для работы со стратегиями
 """
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 import logging
 from app.db import get_db, get_user_id
 from app.api.schemas import StrategyCreate, StrategyUpdate, StrategyResponse
+from app.api.responses import model_response
 from app.services.strategy_service import StrategyService
+from app.utils.response_cache import cached_response
 
 router = APIRouter(prefix="/api/strategies", tags=["strategies"])
 
 logger = logging.getLogger(__name__)
+
+# Сериализатор списка создается один раз; ответ отдается готовыми байтами JSON
+_STRATEGY_LIST_TA = TypeAdapter(List[StrategyResponse])
+
+
 @router.get("", response_model=List[StrategyResponse])
 async def get_strategies(
-    db: Session = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить список всех стратегий пользователя"""
-    return StrategyService.get_strategies(db, user_id)
+    strategies = await cached_response("strategies", user_id, (), lambda db: StrategyService.get_strategies(db, user_id))
+    return Response(content=_STRATEGY_LIST_TA.dump_json(strategies), media_type="application/json")
 
 
 @router.post("", response_model=StrategyResponse, status_code=201)
 async def create_strategy(
     strategy: StrategyCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Создать новую стратегию"""
-    return await StrategyService.create_strategy(db, strategy, user_id)
+    return model_response(await StrategyService.create_strategy(db, strategy, user_id), status_code=201)
 
 
 @router.get("/{strategy_id}", response_model=StrategyResponse)
 async def get_strategy(
-    strategy_id: str,
-    db: Session = Depends(get_db),
+    strategy_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить стратегию по ID"""
-    logger.info("Getting strategy: %s", strategy_id)
-    return StrategyService.get_strategy(db, strategy_id, user_id)
+    logger.debug("Getting strategy: %s", strategy_id)
+    return model_response(await StrategyService.get_strategy(db, strategy_id, user_id))
 
 
 @router.put("/{strategy_id}", response_model=StrategyResponse)
 async def update_strategy(
-    strategy_id: str,
+    strategy_id: uuid.UUID,
     strategy_update: StrategyUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Обновить стратегию"""
-    return await StrategyService.update_strategy(db, strategy_id, strategy_update, user_id)
+    return model_response(await StrategyService.update_strategy(db, strategy_id, strategy_update, user_id))
 
 
 @router.delete("/{strategy_id}", status_code=204)
 async def delete_strategy(
-    strategy_id: str,
-    db: Session = Depends(get_db),
+    strategy_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Удалить стратегию"""
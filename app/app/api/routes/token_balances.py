@@ -2,69 +2,104 @@
 Роуты для работы с балансами токенов в кошельках
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from app.db import get_db, get_user_id
 from app.api.schemas import (
     WalletTokenBalanceCreate,
     WalletTokenBalanceUpdate,
-    WalletTokenBalanceResponse
+    WalletTokenBalanceResponse,
+    TokenBalanceTotalResponse
 )
+from app.api.responses import model_response
 from app.services.token_balance_service import TokenBalanceService
+from app.utils.response_cache import cached_response
 
 router = APIRouter(prefix="/api/wallet-token-balances", tags=["token-balances"])
 
+# Сериализатор списка создается один раз; ответ отдается готовыми байтами JSON
+_BALANCE_LIST_TA = TypeAdapter(List[WalletTokenBalanceResponse])
+_TOTALS_TA = TypeAdapter(List[TokenBalanceTotalResponse])
+
 
 @router.get("", response_model=List[WalletTokenBalanceResponse])
 async def get_balances(
-    wallet_id: Optional[str] = Query(None, description="Фильтр по ID кошелька"),
-    db: Session = Depends(get_db),
+    wallet_id: Optional[uuid.UUID] = Query(None, description="Фильтр по ID кошелька"),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить список балансов токенов пользователя"""
-    return TokenBalanceService.get_balances(db, user_id, wallet_id)
+    balances = await cached_response(
+        "token_balances", user_id, (wallet_id,),
+        lambda db: TokenBalanceService.get_balances(db, user_id, wallet_id)
+    )
+    return Response(content=_BALANCE_LIST_TA.dump_json(balances), media_type="application/json")
 
 
 @router.post("", response_model=WalletTokenBalanceResponse, status_code=201)
 async def create_balance(
     balance: WalletTokenBalanceCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Создать или обновить запись о балансе токена"""
-    return TokenBalanceService.create_balance(db, balance, user_id)
+    return model_response(await TokenBalanceService.create_balance(db, balance, user_id), status_code=201)
+
+
+@router.post("/bulk", response_model=List[WalletTokenBalanceResponse], status_code=201)
+async def upsert_balances(
+    balances: List[WalletTokenBalanceCreate],
+    db: AsyncSession = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """Создать или обновить записи о балансах нескольких токенов одним запросом"""
+    saved = await TokenBalanceService.upsert_balances(db, balances, user_id)
+    return Response(content=_BALANCE_LIST_TA.dump_json(saved), media_type="application/json", status_code=201)
+
+
+@router.get("/totals", response_model=List[TokenBalanceTotalResponse])
+async def get_totals(
+    wallet_id: Optional[uuid.UUID] = Query(None, description="Фильтр по ID кошелька"),
+    user_id: uuid.UUID = Depends(get_user_id)
+):
+    """Получить суммарные балансы пользователя по токенам"""
+    totals = await cached_response(
+        "token_balances", user_id, ("totals", wallet_id),
+        lambda db: TokenBalanceService.get_totals(db, user_id, wallet_id)
+    )
+    return Response(content=_TOTALS_TA.dump_json(totals), media_type="application/json")
 
 
 @router.get("/{balance_id}", response_model=WalletTokenBalanceResponse)
 async def get_balance(
-    balance_id: str,
-    db: Session = Depends(get_db),
+    balance_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Получить баланс токена по ID"""
-    return TokenBalanceService.get_balance(db, balance_id, user_id)
+    return model_response(await TokenBalanceService.get_balance(db, balance_id, user_id))
 
 
 @router.put("/{balance_id}", response_model=WalletTokenBalanceResponse)
 async def update_balance(
-    balance_id: str,
+    balance_id: uuid.UUID,
     balance_update: WalletTokenBalanceUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Обновить баланс токена"""
-    return TokenBalanceService.update_balance(db, balance_id, balance_update, user_id)
+    return model_response(await TokenBalanceService.update_balance(db, balance_id, balance_update, user_id))
 
 
 @router.delete("/{balance_id}", status_code=204)
 async def delete_balance(
-    balance_id: str,
-    db: Session = Depends(get_db),
+    balance_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
     user_id: uuid.UUID = Depends(get_user_id)
 ):
     """Удалить запись о балансе токена"""
-    TokenBalanceService.delete_balance(db, balance_id, user_id)
+    await TokenBalanceService.delete_balance(db, balance_id, user_id)
     return None
 
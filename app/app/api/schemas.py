@@ -1,8 +1,16 @@
 """
 Pydantic схемы для API
 """
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from decimal import Decimal
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Dict, Optional, Any, Literal
+
+# Поддерживаемые блокчейны кошельков и балансов токенов (chain_enum в БД)
+ChainName = Literal["ethereum", "polygon", "arbitrum", "optimism", "bsc"]
+
+# Конфигурация моделей ответов: создаются сервисами и только сериализуются.
+# frozen защищает экземпляры, которые разделяются через кэш ответов
+RESPONSE_MODEL_CONFIG = ConfigDict(from_attributes=True, extra="ignore", frozen=True)
 
 
 # ==================== WALLET SCHEMAS ====================
@@ -10,20 +18,22 @@ from typing import List, Dict, Optional, Any
 class WalletCreate(BaseModel):
     """Модель для создания кошелька"""
     address: str = Field(..., description="Адрес кошелька")
-    chain: str = Field(..., description="Блокчейн (ethereum, arbitrum, polygon)")
+    chain: ChainName = Field(..., description="Блокчейн (ethereum, polygon, arbitrum, optimism, bsc)")
     label: Optional[str] = Field(None, description="Название/метка кошелька")
     tokens: Optional[List[str]] = Field(default=[], description="Список токенов для отслеживания")
 
 
 class WalletUpdate(BaseModel):
     """Модель для обновления кошелька"""
-    chain: Optional[str] = Field(None, description="Блокчейн")
+    chain: Optional[ChainName] = Field(None, description="Блокчейн")
     label: Optional[str] = Field(None, description="Название/метка кошелька")
     tokens: Optional[List[str]] = Field(None, description="Список токенов для отслеживания")
 
 
 class WalletResponse(BaseModel):
     """Модель ответа с информацией о кошельке"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     id: str
     address: str
     chain: str
@@ -51,6 +61,8 @@ class StrategyUpdate(BaseModel):
 
 class StrategyResponse(BaseModel):
     """Модель ответа с информацией о стратегии"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     id: str
     name: str
     description: str
@@ -68,6 +80,8 @@ class RecommendationRequest(BaseModel):
 
 class RecommendationResponse(BaseModel):
     """Модель ответа с рекомендацией"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     id: str
     strategy_id: str
     recommendation: str
@@ -86,6 +100,8 @@ class ChatMessage(BaseModel):
 
 class ChatResponse(BaseModel):
     """Модель ответа чата"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     message_id: str
     user_message: str
     agent_response: str
@@ -94,10 +110,24 @@ class ChatResponse(BaseModel):
 
 class ChatHistoryResponse(BaseModel):
     """Модель истории чата"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     messages: List[ChatResponse]
     total: int
 
 
+# ==================== TASK SCHEMAS ====================
+
+class TaskResponse(BaseModel):
+    """Модель состояния фоновой задачи"""
+    model_config = RESPONSE_MODEL_CONFIG
+
+    task_id: str
+    status: Literal["pending", "running", "done", "error"]
+    result: Optional[Dict[str, Any]] = Field(None, description="Ответ эндпоинта после завершения задачи")
+    error: Optional[Dict[str, Any]] = Field(None, description="status_code и detail, если задача завершилась ошибкой")
+
+
 # ==================== AGENT SCHEMAS ====================
 
 class AgentConfigRequest(BaseModel):
@@ -107,23 +137,29 @@ class AgentConfigRequest(BaseModel):
 
 # ==================== WALLET TOKEN BALANCE SCHEMAS ====================
 
+# Пределы колонок wallet_token_balances: balance NUMERIC(78, 18),
+# balance_usd NUMERIC(24, 8) — больше 16 цифр целой части не помещается
+BALANCE_USD_LIMIT = 1e16
+
 class WalletTokenBalanceCreate(BaseModel):
     """Модель для создания записи о балансе токена"""
     wallet_id: str = Field(..., description="ID кошелька")
     token_symbol: str = Field(..., description="Символ токена (BTC, ETH, USDC и т.д.)")
-    balance: str = Field(..., description="Баланс в виде строки")
-    balance_usd: Optional[float] = Field(None, description="Баланс в USD")
-    chain: str = Field(..., description="Блокчейн")
+    balance: Decimal = Field(..., max_digits=78, decimal_places=18, description="Баланс токена (десятичное число или строка)")
+    balance_usd: Optional[float] = Field(None, gt=-BALANCE_USD_LIMIT, lt=BALANCE_USD_LIMIT, description="Баланс в USD")
+    chain: ChainName = Field(..., description="Блокчейн (ethereum, polygon, arbitrum, optimism, bsc)")
 
 
 class WalletTokenBalanceUpdate(BaseModel):
     """Модель для обновления записи о балансе токена"""
-    balance: Optional[str] = Field(None, description="Баланс в виде строки")
-    balance_usd: Optional[float] = Field(None, description="Баланс в USD")
+    balance: Optional[Decimal] = Field(None, max_digits=78, decimal_places=18, description="Баланс токена (десятичное число или строка)")
+    balance_usd: Optional[float] = Field(None, gt=-BALANCE_USD_LIMIT, lt=BALANCE_USD_LIMIT, description="Баланс в USD")
 
 
 class WalletTokenBalanceResponse(BaseModel):
     """Модель ответа с информацией о балансе токена"""
+    model_config = RESPONSE_MODEL_CONFIG
+
     id: str
     wallet_id: str
     user_id: str
@@ -134,3 +170,12 @@ class WalletTokenBalanceResponse(BaseModel):
     created_at: str
     updated_at: str
 
+
+class TokenBalanceTotalResponse(BaseModel):
+    """Модель ответа с суммарным балансом токена по кошелькам пользователя"""
+    model_config = RESPONSE_MODEL_CONFIG
+
+    token_symbol: str
+    balance: str
+    balance_usd: Optional[float]
+
@@ -1,11 +1,17 @@
 """
 Configuration for application logging
 """
+import atexit
 import logging
+import queue
 import sys
 import os
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Optional
+
+# Background thread that writes queued records to the real handlers
+_listener: Optional[QueueListener] = None
 
 
 def setup_logging(
@@ -16,6 +22,10 @@ def setup_logging(
     """
     Setup application logging configuration
     
+    Request code only puts records on an in-memory queue; console and file
+    output happens in a QueueListener thread, so slow stdout or disk writes
+    never stall the event loop.
+    
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
                   Defaults to INFO or from LOG_LEVEL env variable
@@ -49,29 +59,38 @@ def setup_logging(
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
+    global _listener
+    
     # Root logger configuration
     root_logger = logging.getLogger()
     root_logger.setLevel(numeric_level)
     
-    # Remove existing handlers
+    # Remove existing handlers (and stop the previous listener on re-setup)
     root_logger.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
     
     # Console handler (stdout)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(numeric_level)
     console_handler.setFormatter(simple_formatter)
-    root_logger.addHandler(console_handler)
     
-    # File handler with rotation
+    # File handler with rotation; the file is opened on the first record
     file_handler = RotatingFileHandler(
         log_file_path,
         maxBytes=10 * 1024 * 1024,  # 10MB
         backupCount=5,
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True
     )
     file_handler.setLevel(numeric_level)
     file_handler.setFormatter(detailed_formatter)
-    root_logger.addHandler(file_handler)
+    
+    # Root logger only enqueues; the listener thread does the I/O
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
     
     # Set levels for third-party libraries
     logging.getLogger("uvicorn").setLevel(logging.WARNING)
@@ -85,6 +104,17 @@ def setup_logging(
     logging.info(f"Logging configured: level={log_level}, file={log_file_path}")
 
 
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
 def get_logger(name: str) -> logging.Logger:
     """
     Get a logger instance for a module
@@ -2,7 +2,16 @@
 Database module
 """
 from app.db.models import Base, User, Wallet, Strategy, StrategyWallet, Recommendation, ChatMessageDB, WalletTokenBalance
-from app.db.session import get_db, get_user_id, get_engine, get_database_url, get_session_local
+from app.db.session import (
+    USER_1_ID,
+    get_db,
+    get_user_id,
+    get_engine,
+    get_async_engine,
+    get_database_url,
+    get_session_local,
+    dispose_engine,
+)
 
 __all__ = [
     "Base",
@@ -13,10 +22,13 @@ __all__ = [
     "Recommendation",
     "ChatMessageDB",
     "WalletTokenBalance",
+    "USER_1_ID",
     "get_db",
     "get_user_id",
     "get_engine",
+    "get_async_engine",
     "get_database_url",
     "get_session_local",
+    "dispose_engine",
 ]
 
@@ -0,0 +1,87 @@
+"""
+Кэш метаданных схемы для миграций Alembic
+
+Один Inspector на соединение миграции: результаты get_table_names/get_indexes/
+get_columns кэшируются им и переиспользуются всеми ревизиями в рамках
+одного запуска `alembic upgrade`, вместо отдельного чтения pg_catalog
+в каждой ревизии.
+
+Индексы и колонки читаются сразу для всех таблиц через get_multi_indexes/
+get_multi_columns (SQLAlchemy 2.0) — один запрос к каталогу вместо
+запроса на каждую таблицу.
+
+Ревизия, которая меняет проверяемую ей схему (создает таблицы, индексы,
+удаляет колонки), должна вызвать invalidate() после изменений.
+"""
+from typing import Dict, Optional, Set
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Inspector
+
+_inspector: Optional[Inspector] = None
+_indexes: Optional[Dict[str, Set[str]]] = None
+_columns: Optional[Dict[str, Set[str]]] = None
+
+
+def bind(connection: Connection) -> Inspector:
+    """Привязывает кэш к соединению миграции (вызывается из env.py)"""
+    global _inspector
+    if _inspector is None or _inspector.bind is not connection:
+        _inspector = sa.inspect(connection)
+        _reset()
+    return _inspector
+
+
+def _get_inspector() -> Inspector:
+    from alembic import op
+    return bind(op.get_bind())
+
+
+def table_names() -> Set[str]:
+    """Множество существующих таблиц"""
+    return set(_get_inspector().get_table_names())
+
+
+def table_exists(table_name: str) -> bool:
+    """Проверяет существование таблицы"""
+    return table_name in table_names()
+
+
+def index_names(table_name: str) -> Set[str]:
+    """Множество имен индексов таблицы"""
+    global _indexes
+    if _indexes is None:
+        _indexes = {
+            table: {idx['name'] for idx in indexes}
+            for (_, table), indexes in _get_inspector().get_multi_indexes().items()
+        }
+    return _indexes.get(table_name, set())
+
+
+def index_exists(table_name: str, index_name: str) -> bool:
+    """Проверяет существование индекса на таблице"""
+    return table_exists(table_name) and index_name in index_names(table_name)
+
+
+def column_names(table_name: str) -> Set[str]:
+    """Множество имен колонок таблицы"""
+    global _columns
+    if _columns is None:
+        _columns = {
+            table: {col['name'] for col in columns}
+            for (_, table), columns in _get_inspector().get_multi_columns().items()
+        }
+    return _columns.get(table_name, set())
+
+
+def _reset() -> None:
+    global _indexes, _columns
+    _indexes = None
+    _columns = None
+
+
+def invalidate() -> None:
+    """Сбрасывает кэш после изменения схемы"""
+    _reset()
+    if _inspector is not None:
+        _inspector.clear_cache()
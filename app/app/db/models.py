@@ -1,78 +1,96 @@
 """
 Модели базы данных для Portfolio Rebalancer
 """
-from sqlalchemy import Column, String, Float, DateTime, Text, JSON, ForeignKey
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
-from datetime import datetime
-import uuid
+from sqlalchemy import Column, String, Numeric, DateTime, Text, ForeignKey, FetchedValue, Enum, func, text
+from sqlalchemy.orm import configure_mappers, relationship
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 
 from app.db.base import Base
 
+# Поддерживаемые блокчейны (тип chain_enum в БД, общий для кошельков и балансов)
+CHAINS = ("ethereum", "polygon", "arbitrum", "optimism", "bsc")
+CHAIN_ENUM = Enum(*CHAINS, name="chain_enum")
+
+# id, created_at и updated_at выставляет PostgreSQL и возвращает через
+# RETURNING того же INSERT/UPDATE (eager_defaults; для INSERT это поведение
+# по умолчанию), поэтому после commit не нужен refresh.
+#
+# statement_timestamp() — время самого INSERT/UPDATE: now() вернул бы начало
+# транзакции, и сообщение, сохраненное после долгого ответа LLM, получило бы
+# время раньше уже видимых клиентам записей (курсор /api/chat/new-messages
+# идет по created_at)
+
+# UUID версии 7 (функция из миграции 0021): ключи растут со временем, и новые
+# строки попадают в правую страницу B-tree индекса первичного ключа
+UUID7_DEFAULT = text("uuid_generate_v7()")
+
 
 class User(Base):
     """Модель пользователя"""
     __tablename__ = "users"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
     username = Column(String(255), nullable=False, unique=True)
     email = Column(String(255), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), onupdate=func.statement_timestamp(), nullable=False)
     
     # Связи
-    wallets = relationship("Wallet", back_populates="user", cascade="all, delete-orphan")
-    strategies = relationship("Strategy", back_populates="user", cascade="all, delete-orphan")
-    recommendations = relationship("Recommendation", back_populates="user", cascade="all, delete-orphan")
-    chat_messages = relationship("ChatMessageDB", back_populates="user", cascade="all, delete-orphan")
-    token_balances = relationship("WalletTokenBalance", back_populates="user", cascade="all, delete-orphan")
+    wallets = relationship("Wallet", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    strategies = relationship("Strategy", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    recommendations = relationship("Recommendation", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    chat_messages = relationship("ChatMessageDB", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    token_balances = relationship("WalletTokenBalance", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Wallet(Base):
     """Модель кошелька"""
     __tablename__ = "wallets"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     address = Column(String(255), nullable=False)
-    chain = Column(String(50), nullable=False)
+    chain = Column(CHAIN_ENUM, nullable=False)
     label = Column(String(255), nullable=True)
-    tokens = Column(JSON, nullable=False, default=list)  # Список токенов
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    tokens = Column(JSONB, nullable=False, default=list)  # Список токенов
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), onupdate=func.statement_timestamp(), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="wallets")
-    strategies = relationship("StrategyWallet", back_populates="wallet", cascade="all, delete-orphan")
-    token_balances = relationship("WalletTokenBalance", back_populates="wallet", cascade="all, delete-orphan")
+    strategies = relationship("StrategyWallet", back_populates="wallet", cascade="all, delete-orphan", passive_deletes=True)
+    token_balances = relationship("WalletTokenBalance", back_populates="wallet", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Strategy(Base):
     """Модель стратегии"""
     __tablename__ = "strategies"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=False)
-    last_checked_at = Column(DateTime, nullable=True)  # Дата последней проверки стратегии
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)  # Дата последней проверки стратегии
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), onupdate=func.statement_timestamp(), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="strategies")
-    wallet_links = relationship("StrategyWallet", back_populates="strategy", cascade="all, delete-orphan")
-    recommendations = relationship("Recommendation", back_populates="strategy", cascade="all, delete-orphan")
+    wallet_links = relationship("StrategyWallet", back_populates="strategy", cascade="all, delete-orphan", passive_deletes=True)
+    recommendations = relationship("Recommendation", back_populates="strategy", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class StrategyWallet(Base):
     """Связующая таблица между стратегиями и кошельками (many-to-many)"""
     __tablename__ = "strategy_wallets"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id"), nullable=False)
-    wallet_id = Column(UUID(as_uuid=True), ForeignKey("wallets.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id", ondelete="CASCADE"), nullable=False)
+    wallet_id = Column(UUID(as_uuid=True), ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
     
     # Связи
     strategy = relationship("Strategy", back_populates="wallet_links")
@@ -83,12 +101,12 @@ class Recommendation(Base):
     """Модель рекомендации"""
     __tablename__ = "recommendations"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id", ondelete="CASCADE"), nullable=False)
     recommendation = Column(Text, nullable=False)
-    analysis = Column(JSON, nullable=True)  # Дополнительные данные анализа
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    analysis = Column(JSONB, nullable=True)  # Дополнительные данные анализа
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="recommendations")
@@ -99,13 +117,13 @@ class ChatMessageDB(Base):
     """Модель сообщения в чате"""
     __tablename__ = "chat_messages"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     user_message = Column(Text, nullable=False)
     agent_response = Column(Text, nullable=False)
-    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id"), nullable=True)
-    wallet_ids = Column(JSON, nullable=True)  # Список UUID кошельков
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    strategy_id = Column(UUID(as_uuid=True), ForeignKey("strategies.id", ondelete="SET NULL"), nullable=True)
+    wallet_ids = Column(JSONB, nullable=True)  # Список UUID кошельков
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="chat_messages")
@@ -115,18 +133,25 @@ class ChatMessageDB(Base):
 class WalletTokenBalance(Base):
     """Модель баланса токенов в кошельке"""
     __tablename__ = "wallet_token_balances"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    wallet_id = Column(UUID(as_uuid=True), ForeignKey("wallets.id"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=UUID7_DEFAULT)
+    wallet_id = Column(UUID(as_uuid=True), ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     token_symbol = Column(String(50), nullable=False)  # BTC, ETH, USDC и т.д.
-    balance = Column(String(255), nullable=False)  # Баланс в виде строки (для точности больших чисел)
-    balance_usd = Column(Float, nullable=True)  # Баланс в USD
-    chain = Column(String(50), nullable=False)  # Блокчейн
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    balance = Column(Numeric(78, 18), nullable=False)  # Баланс токена (точное десятичное число)
+    balance_usd = Column(Numeric(24, 8), nullable=True)  # Баланс в USD
+    chain = Column(CHAIN_ENUM, nullable=False)  # Блокчейн
+    created_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), nullable=False)
+    # При UPDATE значение выставляет триггер trg_wtb_touch в БД
+    updated_at = Column(DateTime(timezone=True), server_default=func.statement_timestamp(), server_onupdate=FetchedValue(), nullable=False)
     
     # Связи
     wallet = relationship("Wallet", back_populates="token_balances")
     user = relationship("User", back_populates="token_balances")
 
+
+# Связи между моделями заданы строками ("Wallet", "Strategy") и иначе
+# разрешаются при первом запросе под блокировкой реестра мапперов.
+# Все модели уже объявлены — настраиваем мапперы один раз при импорте
+configure_mappers()
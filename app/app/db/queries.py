@@ -0,0 +1,48 @@
+"""
+Заранее построенные запросы для часто выполняемых выборок
+
+Конструкции select() создаются один раз при импорте, значения передаются
+через bindparam при выполнении. SQL компилируется один раз и дальше
+берется из кэша скомпилированных запросов engine (query_cache_size).
+"""
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import raiseload, selectinload
+
+from app.db.models import Recommendation, Strategy, StrategyWallet, Wallet, WalletTokenBalance
+
+# Стратегия пользователя по ID: {"strategy_id", "user_id"}
+STRATEGY_BY_ID = select(Strategy).where(
+    Strategy.id == bindparam("strategy_id"),
+    Strategy.user_id == bindparam("user_id"),
+)
+
+# Стратегии пользователя вместе со связями с кошельками: {"user_id"}.
+# Связи всех стратегий загружаются вторым запросом WHERE strategy_id IN (...),
+# а не отдельным запросом на каждую стратегию. Остальные связи под raiseload:
+# обращение к ним падает сразу, а не тихо добавляет запрос на каждую строку
+STRATEGIES_WITH_LINKS = select(Strategy).where(
+    Strategy.user_id == bindparam("user_id"),
+).options(selectinload(Strategy.wallet_links), raiseload("*"))
+
+# Кошелек пользователя по ID: {"wallet_id", "user_id"}
+WALLET_BY_ID = select(Wallet).where(
+    Wallet.id == bindparam("wallet_id"),
+    Wallet.user_id == bindparam("user_id"),
+)
+
+# Связи стратегии с кошельками: {"strategy_id"}
+STRATEGY_WALLET_LINKS = select(StrategyWallet).where(
+    StrategyWallet.strategy_id == bindparam("strategy_id"),
+)
+
+# Баланс токена пользователя по ID: {"balance_id", "user_id"}
+TOKEN_BALANCE_BY_ID = select(WalletTokenBalance).where(
+    WalletTokenBalance.id == bindparam("balance_id"),
+    WalletTokenBalance.user_id == bindparam("user_id"),
+)
+
+# Рекомендация пользователя по ID: {"recommendation_id", "user_id"}
+RECOMMENDATION_BY_ID = select(Recommendation).where(
+    Recommendation.id == bindparam("recommendation_id"),
+    Recommendation.user_id == bindparam("user_id"),
+)
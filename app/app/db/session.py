@@ -1,62 +1,163 @@
 """
 Настройка подключения к БД и зависимости для FastAPI
 """
+import functools
 import os
 import uuid
+from typing import AsyncGenerator, Optional
 from fastapi import Depends
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from app.db.base import Base
 
-# Фиксированный UUID для пользователя 1
+# Фиксированный UUID для пользователя 1. Код вне запросов (инструменты
+# агента) берет его напрямую, не вызывая зависимость get_user_id
 USER_1_ID = uuid.UUID('00000000-0000-0000-0000-000000000001')
 
 
+@functools.lru_cache(maxsize=1)
 def get_database_url():
-    """Получает URL подключения к БД из переменных окружения"""
+    """
+    Получает URL подключения к БД из переменных окружения
+    
+    Окружение читается один раз за процесс; если переменные DB_* меняются
+    во время работы (например, в тестах), нужен get_database_url.cache_clear().
+    """
     db_user = os.getenv("DB_USER", "postgres")
     db_password = os.getenv("DB_PASSWORD", "postgres")
     db_host = os.getenv("DB_HOST", "localhost")
     db_port = os.getenv("DB_PORT", "5432")
     db_name = os.getenv("DB_NAME", "portfolio_rebalancer")
-    
+
     return f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
 
-def get_engine():
-    """Создает engine для подключения к БД"""
-    database_url = get_database_url()
-    return create_engine(database_url, echo=os.getenv("DB_ECHO", "False").lower() == "true")
+def get_async_database_url():
+    """URL подключения к БД для асинхронного драйвера asyncpg"""
+    return get_database_url().replace("postgresql://", "postgresql+asyncpg://", 1)
 
 
-def get_session_local():
-    """Создает SessionLocal для работы с БД"""
-    engine = get_engine()
-    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine и фабрика сессий создаются лениво при первом использовании
+# и дальше переиспользуются: каждый create_engine — отдельный пул соединений
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+_SessionLocal: Optional[async_sessionmaker[AsyncSession]] = None
 
 
-# SessionLocal будет создан лениво при первом использовании
-_SessionLocal = None
+def get_engine() -> Engine:
+    """Возвращает общий синхронный engine (для служебных скриптов)"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            get_database_url(),
+            pool_pre_ping=True,
+            echo=os.getenv("DB_ECHO", "False").lower() == "true",
+        )
+    return _engine
 
 
-def get_db():
-    """Dependency для получения сессии БД"""
+def _pool_kwargs() -> dict:
+    """
+    Параметры пула соединений
+    
+    По умолчанию пул рассчитан на 20 постоянных соединений плюс 10 сверх лимита;
+    при исчерпании запрос ждет свободное соединение не дольше 5 секунд и
+    получает ошибку, а не зависает. Соединения выдаются в порядке LIFO: под
+    небольшой нагрузкой работают несколько "горячих" соединений, а лишние
+    простаивают и закрываются по pool_recycle. Запрос дольше
+    DB_STATEMENT_TIMEOUT_MS (по умолчанию 5 секунд, 0 — без ограничения)
+    прерывается сервером. Каждое соединение держит до DB_STATEMENT_CACHE_SIZE
+    (по умолчанию 1024) подготовленных запросов: повторный запрос того же
+    текста выполняется без разбора и планирования на сервере. Стандартных
+    100 мест asyncpg не хватает на все запросы приложения с разными
+    размерами IN (...) и пачек upsert.
+    
+    Если перед БД стоит PgBouncer в режиме transaction (DB_PGBOUNCER=true),
+    пулом управляет он: соединения приложения не удерживаются, а кэш prepared
+    statements asyncpg отключается. statement_timeout в этом режиме задается
+    в настройках PgBouncer/роли — стартовые параметры он не пропускает.
+    """
+    if os.getenv("DB_PGBOUNCER", "False").lower() == "true":
+        return {
+            "poolclass": NullPool,
+            "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+        }
+    statement_cache_size = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "1024"))
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_use_lifo": True,
+        "connect_args": {
+            "server_settings": {"statement_timeout": os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000")},
+            # Кэш prepared statements самого asyncpg и адаптера SQLAlchemy
+            "statement_cache_size": statement_cache_size,
+            "prepared_statement_cache_size": statement_cache_size,
+        },
+    }
+
+
+def get_async_engine() -> AsyncEngine:
+    """Возвращает общий асинхронный engine приложения"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            get_async_database_url(),
+            pool_pre_ping=True,
+            # Кэш скомпилированных запросов (по умолчанию 500 записей)
+            query_cache_size=1200,
+            echo=os.getenv("DB_ECHO", "False").lower() == "true",
+            **_pool_kwargs(),
+        )
+    return _async_engine
+
+
+def get_session_local() -> async_sessionmaker[AsyncSession]:
+    """Возвращает фабрику асинхронных сессий"""
     global _SessionLocal
     if _SessionLocal is None:
-        _SessionLocal = get_session_local()
-    db = _SessionLocal()
-    try:
+        # expire_on_commit=False: после commit атрибуты не перечитываются
+        # неявно (в async-режиме ленивая загрузка недоступна). Объект после
+        # commit хранит значения своей транзакции: если его нужно изменить
+        # снова с учетом чужих изменений, строку следует выбрать заново
+        _SessionLocal = async_sessionmaker(
+            bind=get_async_engine(),
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _SessionLocal
+
+
+async def dispose_engine() -> None:
+    """Закрывает соединения пула (вызывается при остановке приложения)"""
+    global _engine, _async_engine, _SessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _SessionLocal = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency для получения сессии БД"""
+    async with get_session_local()() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_user_id() -> uuid.UUID:
+async def get_user_id() -> uuid.UUID:
     """
     Dependency для получения ID пользователя.
     Пока возвращает фиксированный ID пользователя 1.
     В будущем здесь можно добавить логику получения user_id из токена/сессии.
+    
+    Объявлена как async: синхронные зависимости FastAPI выполняет в пуле
+    потоков, а эта вызывается в каждом запросе. В пределах запроса
+    результат кэшируется FastAPI (use_cache), поэтому при появлении
+    проверки токена она выполнится один раз на запрос.
     """
     return USER_1_ID
-
@@ -2,9 +2,13 @@
 Graph System для определения ребалансировки портфеля
 Использует StateGraph для структурированного выполнения workflow ребалансировки
 """
-import json
+import asyncio
 import logging
-from typing import TypedDict, Dict, Any, Optional, List, Annotated
+import re
+from collections import defaultdict, deque
+from typing import TypedDict, Deque, Dict, Any, Optional, List, Tuple, Annotated
+
+import orjson
 from spoon_ai.graph.builder import (
     DeclarativeGraphBuilder,
     GraphTemplate,
@@ -21,12 +25,50 @@ from app.tools.rebalancer_tools import (
     SuggestRebalancingTradesTool,
 )
 from app.tools.chainbase_tools import GetAccountTokensTool, GetAccountBalanceTool
+from app.tools.price_tools import CachedGetTokenPriceTool
 from spoon_ai.tools.crypto_tools import get_crypto_tools
-from spoon_toolkits.crypto.crypto_data_tools.price_data import GetTokenPriceTool
+from spoon_ai.tools.base import ToolResult
 from app.utils.helpers import convert_hex_balance_to_float
 
 logger = logging.getLogger(__name__)
 
+# Максимум записей в execution_log: старые записи вытесняются
+_EXECUTION_LOG_MAXLEN = 1024
+
+# Инструменты не хранят состояния между вызовами, поэтому создаются один раз
+# на процесс, а не в каждом узле при каждом запуске графа
+_get_tokens_tool = GetAccountTokensTool()
+_get_balance_tool = GetAccountBalanceTool()
+# Общий на процесс TTL-кэш цен (app.utils.price_cache): повторные анализы
+# и одновременные запросы одной пары не обращаются к провайдеру заново
+_price_tool = CachedGetTokenPriceTool()
+_calculate_rebalancing_tool = CalculateRebalancingTool()
+_estimate_gas_fees_tool = EstimateGasFeesTool()
+_suggest_trades_tool = SuggestRebalancingTradesTool()
+
+# Стейблкоины: цена всегда $1
+_STABLECOINS = frozenset({"USDT", "USDC", "DAI", "BUSD", "TUSD"})
+
+# Базовые токены, для которых распознается AAVE токен с префиксом "a" (aUSDT, aWBTC)
+_KNOWN_UNDERLYING = frozenset({"USDT", "USDC", "WBTC", "WETH", "ETH", "BTC", "DAI", "BUSD", "TUSD"})
+
+
+def _extract_underlying_from_upper(symbol_upper: str) -> Optional[str]:
+    """
+    Извлекает базовый токен из AAVE токена (None, если это не AAVE токен)
+
+    Символ должен быть уже в верхнем регистре: символы нормализуются один раз
+    при разборе ответа Chainbase, ключи token_balances и total_balances хранятся
+    в этом виде.
+    """
+    # AAVE токены на Arbitrum: aArbUSDT -> USDT, aArbWBTC -> WBTC, aArbWETH -> WETH
+    if symbol_upper.startswith("AARB"):
+        return symbol_upper[4:] or None
+    # AAVE токены на других сетях: aUSDT -> USDT, aWBTC -> WBTC
+    if len(symbol_upper) > 1 and symbol_upper[0] == "A" and symbol_upper[1:] in _KNOWN_UNDERLYING:
+        return symbol_upper[1:]
+    return None
+
 
 # ==================== STATE DEFINITION ====================
 
@@ -56,11 +98,123 @@ class RebalancingState(TypedDict, total=False):
     # Финальный результат
     rebalancing_needed: bool  # Нужна ли ребалансировка
     recommendation: str  # Текстовое описание рекомендации
-    execution_log: List[str]  # Лог выполнения
+    execution_log: Deque[str]  # Лог выполнения (ограниченный deque, передается между узлами по ссылке)
 
 
 # ==================== NODE FUNCTIONS ====================
 
+async def _fetch_native_balances(
+    balance_tool: GetAccountBalanceTool,
+    chain_id: int,
+    wallets: List[str]
+) -> List[Any]:
+    """
+    Нативные балансы кошельков в порядке wallets
+
+    Если для сети задан RPC_URL_<chain_id> — одним JSON-RPC батчем eth_getBalance;
+    без настроенного узла или если узел не принимает батчи — отдельным запросом
+    Chainbase на каждый кошелек.
+    Адреса, для которых узел вернул ошибку внутри батча, тоже запрашиваются
+    через Chainbase.
+    """
+    try:
+        results = await balance_tool.execute_batch(chain_id=chain_id, addresses=wallets)
+    except Exception as e:
+        # Без RPC_URL_<chain_id> батч выключен — это штатный путь, не логируем
+        if not isinstance(e, NotImplementedError):
+            logger.info(f"Батч нативных балансов недоступен ({e}), запрашиваем по кошелькам")
+        return await asyncio.gather(
+            *(balance_tool.execute(chain_id=chain_id, address=w) for w in wallets),
+            return_exceptions=True,
+        )
+    
+    failed = [i for i, result in enumerate(results) if "error" in result]
+    if failed:
+        logger.info(f"Ошибки в батче нативных балансов для {len(failed)} кошельков, запрашиваем по кошелькам")
+        retried = await asyncio.gather(
+            *(balance_tool.execute(chain_id=chain_id, address=wallets[i]) for i in failed),
+            return_exceptions=True,
+        )
+        for i, result in zip(failed, retried):
+            results[i] = result
+    return results
+
+
+def _process_token(token_data: Dict[str, Any]) -> Optional[Tuple[str, str, float, float, Dict[str, Any]]]:
+    """
+    Разбирает один токен из ответа GetAccountTokensTool
+
+    Каждое поле token_data читается один раз. Возвращает (symbol,
+    aggregation_symbol, balance, balance_usd, детали для token_balances) или None,
+    если токен пропускается (некорректный символ или нулевой баланс).
+    """
+    symbol = (token_data.get("symbol") or "").strip().upper()
+    
+    # Пропускаем токены без символа или с некорректными символами
+    if not symbol or "|" in symbol or len(symbol) > 20:
+        logger.debug(f"Пропуск токена с некорректным символом: {symbol}")
+        return None
+    
+    # Получаем decimals (по умолчанию 18 для большинства токенов)
+    decimals = token_data.get("decimals", 18)
+    
+    # Конвертируем баланс из hex строки в число
+    raw_balance = token_data.get("balance", "0x0")
+    balance = convert_hex_balance_to_float(raw_balance, decimals)
+    logger.info("token %s, balance: %s, decimals: %s, raw_balance: %s", symbol, balance, decimals, raw_balance)
+    # Пропускаем токены с нулевым балансом
+    if balance <= 0:
+        return None
+    
+    # Определяем, является ли это AAVE токеном (делаем это ДО расчета balance_usd)
+    underlying_token = _extract_underlying_from_upper(symbol)
+    aggregation_symbol = underlying_token or symbol
+    is_stablecoin = aggregation_symbol in _STABLECOINS
+    
+    # Получаем баланс в USD (если есть)
+    balance_usd = float(token_data.get("balance_usd", 0) or 0)
+    
+    # Если balance_usd не указан, пробуем использовать current_usd_price, но с проверкой разумности
+    # Проверяем разумность для базового токена (aggregation_symbol), а не для оригинального символа
+    if balance_usd == 0:
+        current_price = float(token_data.get("current_usd_price", 0) or 0)
+        
+        if current_price > 0:
+            # Для стейблкоинов: если цена больше $2, считаем неправильной и используем $1
+            if is_stablecoin and current_price > 2.0:
+                logger.debug(f"Неправильная цена для {symbol} ({current_price}), используем $1.00")
+                current_price = 1.0
+            # Для других токенов: цена от 1000000 — ошибка источника
+            elif not is_stablecoin and current_price >= 1000000:
+                logger.debug(f"Неправильная цена для {symbol} ({current_price}), пропускаем")
+                current_price = 0.0
+            balance_usd = balance * current_price
+    
+    # Цена не найдена: для стейблкоинов используем $1, для остальных оставляем 0
+    # и пересчитываем позже с актуальными ценами
+    if balance_usd == 0 and is_stablecoin:
+        balance_usd = balance * 1.0
+        logger.debug(f"Используем дефолтную цену $1.00 для {symbol} (баланс={balance})")
+    
+    details = {
+        "balance": balance,
+        "balance_usd": balance_usd,
+        "decimals": decimals,
+        "raw_balance": raw_balance,
+        "contract_address": token_data.get("contract_address"),
+        "name": token_data.get("name"),
+        "is_aave": underlying_token is not None,
+        "underlying_token": underlying_token
+    }
+    
+    if underlying_token:
+        logger.info(f"Обработан AAVE токен {symbol} -> {aggregation_symbol}: баланс={balance}, USD={balance_usd}")
+    else:
+        logger.debug(f"Обработан токен {symbol}: баланс={balance}, USD={balance_usd}")
+    
+    return symbol, aggregation_symbol, balance, balance_usd, details
+
+
 async def fetch_portfolio_balances(
     state: RebalancingState,
     config: Optional[Dict[str, Any]] = None
@@ -72,7 +226,6 @@ async def fetch_portfolio_balances(
     
     wallets = state.get("wallets", [])
     chain_id = state.get("chain_id", 1) # arbitrum
-    tokens = state.get("tokens", [])
     
     if not wallets:
         return {
@@ -80,43 +233,30 @@ async def fetch_portfolio_balances(
             "error": "No wallets provided"
         }
     
-    # Инструменты для получения балансов
-    get_tokens_tool = GetAccountTokensTool()
-    get_balance_tool = GetAccountBalanceTool()
-    
-    token_balances = {}
+    token_balances: Dict[str, Dict[str, Any]] = defaultdict(dict)
     native_balances = {}
-    total_balances_usd = {}
-    
-    # Функция для извлечения базового токена из AAVE токена
-    def extract_underlying_token(aave_token: str) -> Optional[str]:
-        """Извлекает базовый токен из AAVE токена"""
-        # AAVE токены на Arbitrum: aArbUSDT -> USDT, aArbWBTC -> WBTC, aArbWETH -> WETH
-        token_upper = aave_token.upper()
-        if token_upper.startswith("AARB"):
-            return token_upper[4:]  # Убираем префикс "AARB"
-        elif token_upper.startswith("A") and len(token_upper) > 1:
-            underlying = token_upper[1:]
-            # Проверяем, что это известный токен
-            if underlying in ["USDT", "USDC", "WBTC", "WETH", "ETH", "BTC", "DAI", "BUSD", "TUSD"]:
-                return underlying
-        return None
+    total_balances_usd: Dict[str, float] = defaultdict(float)
     
     try:
-        # Получаем балансы для каждого кошелька
-        for wallet_address in wallets:
-            # Получаем ERC20 токены
-            tokens_result = await get_tokens_tool.execute(
-                chain_id=chain_id,
-                address=wallet_address,
-                limit=100
-            )
-            logger.info("chain_id: %s", chain_id)
-            # Получаем нативный баланс (ETH, MATIC и т.д.)
-            balance_result = await get_balance_tool.execute(
-                chain_id=chain_id,
-                address=wallet_address
-            )
+        # ERC20 токены и нативный баланс (ETH, MATIC и т.д.) всех кошельков
+        # запрашиваем одновременно: задержка равна самому долгому запросу,
+        # а не сумме по кошелькам. Ошибка одного запроса не прерывает остальные
+        logger.info("chain_id: %s", chain_id)
+        tokens_results, balance_results = await asyncio.gather(
+            asyncio.gather(
+                *(_get_tokens_tool.execute(chain_id=chain_id, address=w, limit=100) for w in wallets),
+                return_exceptions=True,
+            ),
+            _fetch_native_balances(_get_balance_tool, chain_id, wallets),
+        )
+        
+        # Разбираем ответы после завершения всех запросов
+        for wallet_address, tokens_result, balance_result in zip(wallets, tokens_results, balance_results):
+            if isinstance(tokens_result, Exception):
+                tokens_result = {"error": str(tokens_result)}
+            if isinstance(balance_result, Exception):
+                logger.warning(f"Ошибка при получении нативного баланса для {wallet_address}: {balance_result}")
+                balance_result = {"error": str(balance_result)}
 
             logger.debug("tokens_result: %s", tokens_result)
             logger.debug("balance_result: %s", balance_result)
@@ -131,95 +271,20 @@ async def fetch_portfolio_balances(
                     logger.debug(f"Обработка {len(token_list)} токенов для кошелька {wallet_address}")
                     
                     for token_data in token_list:
-                        symbol = token_data.get("symbol", "").strip().upper()
-                        
-                        # Пропускаем токены без символа или с некорректными символами
-                        if not symbol or "|" in symbol or len(symbol) > 20:
-                            logger.debug(f"Пропуск токена с некорректным символом: {symbol}")
-                            continue
-                        
-                        # Получаем decimals (по умолчанию 18 для большинства токенов)
-                        decimals = token_data.get("decimals", 18)
-                        
-                        # Конвертируем баланс из hex строки в число используя convert_hex_balance_to_float
-                        raw_balance = token_data.get("balance", "0x0")
-                        balance = convert_hex_balance_to_float(raw_balance, decimals)
-                        logger.info("token %s, balance: %s, decimals: %s, raw_balance: %s", symbol, balance, decimals, raw_balance)
-                        # Пропускаем токены с нулевым балансом
-                        if balance <= 0:
+                        processed = _process_token(token_data)
+                        if processed is None:
                             continue
+                        symbol, aggregation_symbol, balance, balance_usd, details = processed
                         
-                        # Определяем, является ли это AAVE токеном (делаем это ДО расчета balance_usd)
-                        underlying_token = extract_underlying_token(symbol)
-                        aggregation_symbol = underlying_token if underlying_token else symbol
-                        
-                        # Получаем баланс в USD (если есть)
-                        balance_usd = float(token_data.get("balance_usd", 0) or 0)
-                        
-                        # Если balance_usd не указан, пробуем использовать current_usd_price, но с проверкой разумности
-                        # Проверяем разумность для базового токена (aggregation_symbol), а не для оригинального символа
-                        if balance_usd == 0 and balance > 0:
-                            current_price = float(token_data.get("current_usd_price", 0) or 0)
-                            
-                            # Проверяем разумность цены перед использованием
-                            if current_price > 0:
-                                # Для стейблкоинов: если цена больше $2, считаем неправильной
-                                if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                    if current_price <= 2.0:
-                                        balance_usd = balance * current_price
-                                    else:
-                                        # Используем дефолтную цену $1 для стейблкоинов
-                                        balance_usd = balance * 1.0
-                                        logger.debug(f"Неправильная цена для {symbol} ({current_price}), используем $1.00")
-                                else:
-                                    # Для других токенов: если цена не слишком завышена, используем
-                                    # Проверяем, что цена не больше 1000000 (защита от ошибок)
-                                    if current_price < 1000000:
-                                        balance_usd = balance * current_price
-                                    else:
-                                        logger.debug(f"Неправильная цена для {symbol} ({current_price}), пропускаем")
-                                        balance_usd = 0
+                        # Агрегируем балансы по базовому токену
+                        total_balances_usd[aggregation_symbol] += balance_usd
+                        # Сохраняем информацию о токене (сохраняем оригинальный символ для деталей)
+                        token_balances[wallet_address][symbol] = details
                         
-                        # Сохраняем информацию о токене
-                        if symbol:
-                            # Если balance_usd = 0, но баланс > 0, это означает, что цена не найдена
-                            # В этом случае мы все равно должны учесть токен, но balance_usd будет пересчитан позже
-                            # Для стейблкоинов используем дефолтную цену $1
-                            if balance_usd == 0 and balance > 0:
-                                if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                    balance_usd = balance * 1.0
-                                    logger.debug(f"Используем дефолтную цену $1.00 для {symbol} (баланс={balance})")
-                                # Для других токенов оставляем 0, пересчитаем позже с актуальными ценами
-                            
-                            # Агрегируем балансы по базовому токену
-                            if aggregation_symbol not in total_balances_usd:
-                                total_balances_usd[aggregation_symbol] = 0.0
-                            total_balances_usd[aggregation_symbol] += balance_usd
-                            
-                            # Логируем агрегацию для отладки
-                            if underlying_token:
-                                logger.info(f"Агрегация AAVE токена {symbol} -> {aggregation_symbol}: баланс={balance}, balance_usd={balance_usd}, total={total_balances_usd[aggregation_symbol]}")
-                            elif balance_usd > 0:
-                                logger.debug(f"Агрегация токена {symbol}: баланс={balance}, balance_usd={balance_usd}, total={total_balances_usd[aggregation_symbol]}")
-                            
-                            # Сохраняем информацию о токене (сохраняем оригинальный символ для деталей)
-                            if wallet_address not in token_balances:
-                                token_balances[wallet_address] = {}
-                            token_balances[wallet_address][symbol] = {
-                                "balance": balance,
-                                "balance_usd": balance_usd,
-                                "decimals": decimals,
-                                "raw_balance": raw_balance,
-                                "contract_address": token_data.get("contract_address"),
-                                "name": token_data.get("name"),
-                                "is_aave": underlying_token is not None,
-                                "underlying_token": underlying_token
-                            }
-                            
-                            if underlying_token:
-                                logger.info(f"Обработан AAVE токен {symbol} -> {aggregation_symbol}: баланс={balance}, USD={balance_usd}")
-                            else:
-                                logger.debug(f"Обработан токен {symbol}: баланс={balance}, USD={balance_usd}")
+                        if details["is_aave"]:
+                            logger.info(f"Агрегация AAVE токена {symbol} -> {aggregation_symbol}: баланс={balance}, balance_usd={balance_usd}, total={total_balances_usd[aggregation_symbol]}")
+                        elif balance_usd > 0:
+                            logger.debug(f"Агрегация токена {symbol}: баланс={balance}, balance_usd={balance_usd}, total={total_balances_usd[aggregation_symbol]}")
                 else:
                     logger.warning(f"Неуспешный ответ от GetAccountTokensTool для {wallet_address}: code={code}")
             else:
@@ -234,9 +299,8 @@ async def fetch_portfolio_balances(
                     if isinstance(data, str):
                         # Если data - это hex строка, конвертируем её
                         try:
-                            # Убираем префикс 0x если есть
-                            hex_balance = data.replace("0x", "") if data.startswith("0x") else data
-                            native_balance_wei = int(hex_balance, 16)
+                            # int(..., 16) сам принимает префикс 0x
+                            native_balance_wei = int(data, 16)
                         except (ValueError, AttributeError):
                             logger.warning(f"Не удалось конвертировать hex баланс: {data}")
                             native_balance_wei = 0
@@ -246,8 +310,7 @@ async def fetch_portfolio_balances(
                         if isinstance(balance_value, str):
                             # Если balance - hex строка
                             try:
-                                hex_balance = balance_value.replace("0x", "") if balance_value.startswith("0x") else balance_value
-                                native_balance_wei = int(hex_balance, 16)
+                                native_balance_wei = int(balance_value, 16)
                             except (ValueError, AttributeError):
                                 native_balance_wei = float(balance_value) if balance_value else 0
                         else:
@@ -268,17 +331,15 @@ async def fetch_portfolio_balances(
                 logger.warning(f"GetAccountBalanceTool вернул строку вместо словаря: {balance_result}")
                 try:
                     # Пытаемся распарсить как JSON
-                    import json
-                    balance_result = json.loads(balance_result)
+                    balance_result = orjson.loads(balance_result)
                     # Повторяем обработку
                     if isinstance(balance_result, dict) and balance_result.get("code") == 0:
                         data = balance_result.get("data")
                         if isinstance(data, str):
-                            hex_balance = data.replace("0x", "") if data.startswith("0x") else data
-                            native_balance_wei = int(hex_balance, 16)
+                            native_balance_wei = int(data, 16)
                             native_balance = native_balance_wei / 1e18
                             native_balances[wallet_address] = native_balance
-                except (json.JSONDecodeError, ValueError, AttributeError):
+                except (orjson.JSONDecodeError, ValueError, AttributeError):
                     logger.error(f"Не удалось обработать результат баланса: {balance_result}")
         
         execution_log.append(f"✅ Retrieved balances for {len(wallets)} wallets")
@@ -289,11 +350,12 @@ async def fetch_portfolio_balances(
             if total_usd > 0:
                 logger.info(f"  {agg_symbol}: ${total_usd:,.2f}")
         
+        # В состояние графа — обычные dict, без автосоздания ключей
         return {
-            "token_balances": token_balances,
+            "token_balances": dict(token_balances),
             "native_balances": native_balances,
             "current_portfolio": {
-                "total_balances": total_balances_usd,
+                "total_balances": dict(total_balances_usd),
                 "wallets": wallets
             },
             "execution_log": execution_log
@@ -308,6 +370,67 @@ async def fetch_portfolio_balances(
         }
 
 
+# Сколько запросов цен выполняется одновременно (ограничение провайдера)
+_PRICE_FETCH_CONCURRENCY = 20
+
+# Число в ответе инструмента цены (включая научную нотацию)
+_PRICE_RE = re.compile(r'(\d+[.,]?\d*(?:[eE][+-]?\d+)?)')
+
+
+def _parse_price(result: Any) -> Optional[float]:
+    """Извлекает цену из ответа GetTokenPriceTool (ToolResult, dict, число или строка)"""
+    if isinstance(result, ToolResult):
+        if result.error:
+            return None
+        result = result.output
+    
+    if isinstance(result, dict):
+        # Проверяем разные возможные ключи
+        result = next((result[key] for key in ("price", "Price", "value") if key in result), None)
+    
+    if isinstance(result, (int, float)):
+        return float(result)
+    if isinstance(result, str):
+        # Число в строке, в том числе внутри текста
+        price_match = _PRICE_RE.search(result)
+        return float(price_match.group(1).replace(',', '')) if price_match else None
+    return None
+
+
+def _is_sane_price(price: Optional[float]) -> bool:
+    """Цена получена и в разумных пределах"""
+    return price is not None and 0 < price < 1e15
+
+
+def _price_from_balances(token: str, balance_usd: float, token_balances: Dict[str, Any]) -> Optional[float]:
+    """Цена из баланса USD / суммарное количество токена по кошелькам; None, если не вычисляется"""
+    if not balance_usd or balance_usd <= 0:
+        return None
+    
+    total_amount = 0.0
+    for wallet_balances in (token_balances or {}).values():
+        if isinstance(wallet_balances, dict) and token in wallet_balances:
+            balance_data = wallet_balances[token]
+            if isinstance(balance_data, dict):
+                total_amount += balance_data.get("balance", 0)
+            elif isinstance(balance_data, (int, float)):
+                total_amount += balance_data
+    
+    return balance_usd / total_amount if total_amount > 0 else None
+
+
+async def _fetch_price(price_tool: CachedGetTokenPriceTool, semaphore: asyncio.Semaphore, symbol: str) -> Optional[float]:
+    """Запрашивает цену пары (например, ETH-USDT); None, если цену получить не удалось"""
+    try:
+        async with semaphore:
+            result = await price_tool.execute(symbol=symbol)
+        logger.info(f"Результат запроса цены для {symbol}: {result} (тип: {type(result)})")
+        return _parse_price(result)
+    except Exception as e:
+        logger.warning(f"Ошибка при получении цены для {symbol}: {e}", exc_info=True)
+        return None
+
+
 async def fetch_token_prices(
     state: RebalancingState,
     config: Optional[Dict[str, Any]] = None
@@ -320,6 +443,7 @@ async def fetch_token_prices(
     try:
         tokens = state.get("tokens", [])
         current_portfolio = state.get("current_portfolio", {})
+        token_balances = state.get("token_balances", {})
         
         if not current_portfolio:
             execution_log.append("⚠️ Portfolio not found, skipping price fetch")
@@ -343,227 +467,89 @@ async def fetch_token_prices(
             }
         
         token_prices = {}
-        price_tool = GetTokenPriceTool()
-        
-        def extract_underlying_token(aave_token: str) -> Optional[str]:
-            """Извлекает базовый токен из AAVE токена"""
-            # AAVE токены на Arbitrum: aArbUSDT -> USDT, aArbWBTC -> WBTC, aArbWETH -> WETH
-            if aave_token.startswith("aArb"):
-                underlying = aave_token[4:]  # Убираем префикс "aArb"
-                return underlying
-            # AAVE токены на других сетях: aUSDT -> USDT, aWBTC -> WBTC
-            elif aave_token.startswith("a") and len(aave_token) > 1:
-                underlying = aave_token[1:]  # Убираем префикс "a"
-                # Проверяем, что это не просто токен, начинающийся с "a"
-                if underlying in ["USDT", "USDC", "WBTC", "WETH", "ETH", "BTC", "DAI"]:
-                    return underlying
-            return None
+        price_tool = _price_tool
         
         # Пытаемся получить цены через инструмент
         if price_tool:
-            for token in all_tokens:
-                try:
-                    price_found = False
-                    underlying_token = extract_underlying_token(token)
-                    
-                    # Если это AAVE токен, сначала пробуем получить цену базового токена
+            semaphore = asyncio.Semaphore(_PRICE_FETCH_CONCURRENCY)
+            underlying_tokens = {token: _extract_underlying_from_upper(token.upper()) for token in all_tokens}
+            
+            # Стейблкоины и AAVE токены на них получают $1 без запросов к провайдеру
+            tokens_to_price = []
+            for token, underlying_token in underlying_tokens.items():
+                if token in _STABLECOINS or underlying_token in _STABLECOINS:
+                    token_prices[token] = 1.0
                     if underlying_token:
-                        logger.debug(f"Обнаружен AAVE токен {token}, базовый токен: {underlying_token}")
-                        # Пробуем получить цену базового токена
-                        base_symbols_to_try = [
-                            f"{underlying_token}-USDT",
-                        ]
-                        
-                        for symbol in base_symbols_to_try:
-                            try:
-                                result = await price_tool.execute(symbol=symbol)
-                                logger.info(f"Результат запроса цены для базового токена {symbol}: {result} (тип: {type(result)})")
-                                
-                                # Обрабатываем разные форматы ответа
-                                base_price = None
-                                
-                                if isinstance(result, dict):
-                                    # Проверяем разные возможные ключи
-                                    if "price" in result:
-                                        base_price = result["price"]
-                                    elif "Price" in result:
-                                        base_price = result["Price"]
-                                    elif "value" in result:
-                                        base_price = result["value"]
-                                    
-                                    # Если base_price - строка, пытаемся распарсить
-                                    if base_price is not None:
-                                        try:
-                                            base_price = float(base_price)
-                                        except (ValueError, TypeError):
-                                            # Если не число, пытаемся извлечь из строки
-                                            if isinstance(base_price, str):
-                                                import re
-                                                price_match = re.search(r'(\d+[.,]?\d*(?:[eE][+-]?\d+)?)', str(base_price))
-                                                if price_match:
-                                                    base_price = float(price_match.group(1).replace(',', ''))
-                                                else:
-                                                    base_price = None
-                                            else:
-                                                base_price = None
-                                
-                                elif isinstance(result, str):
-                                    # Пытаемся извлечь цену из строки
-                                    import re
-                                    # Ищем числа (включая научную нотацию)
-                                    price_match = re.search(r'(\d+[.,]?\d*(?:[eE][+-]?\d+)?)', result)
-                                    if price_match:
-                                        base_price = float(price_match.group(1).replace(',', ''))
-                                
-                                # Проверяем разумность цены и сохраняем
-                                if base_price is not None:
-                                    # Для стейблкоинов принудительно используем цену $1
-                                    if underlying_token in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                        base_price = 1.0
-                                    
-                                    # Проверяем, что цена разумная (не слишком большая или маленькая)
-                                    if 0 < base_price < 1e15:  # Максимальная разумная цена
-                                        # Используем цену базового токена для AAVE токена
-                                        token_prices[token] = base_price
-                                        token_prices[underlying_token] = base_price  # Сохраняем и для базового токена
-                                        price_found = True
-                                        logger.info(f"Использована цена базового токена {underlying_token} ({base_price}) для AAVE токена {token}")
-                                        break
-                                    else:
-                                        logger.warning(f"Неразумная цена для базового токена {underlying_token}: {base_price}, пропускаем")
-                            except Exception as e:
-                                logger.warning(f"Ошибка при получении цены для базового токена {symbol}: {e}", exc_info=True)
-                                continue
-                    
-                    # Если не нашли цену через базовый токен (или это не AAVE токен), пробуем напрямую
-                    if not price_found:
-                        symbols_to_try = [
-                            f"{token}-USDT",
-                        ]
-                        
-                        for symbol in symbols_to_try:
-                            try:
-                                result = await price_tool.execute(symbol=symbol)
-                                logger.info(f"Результат запроса цены для {symbol}: {result} (тип: {type(result)})")
-                                
-                                # Обрабатываем разные форматы ответа
-                                price_value = None
-                                
-                                if isinstance(result, dict):
-                                    # Проверяем разные возможные ключи
-                                    if "price" in result:
-                                        price_value = result["price"]
-                                    elif "Price" in result:
-                                        price_value = result["Price"]
-                                    elif "value" in result:
-                                        price_value = result["value"]
-                                    
-                                    # Если price_value - строка, пытаемся распарсить
-                                    if price_value is not None:
-                                        try:
-                                            price_value = float(price_value)
-                                        except (ValueError, TypeError):
-                                            # Если не число, пытаемся извлечь из строки
-                                            if isinstance(price_value, str):
-                                                import re
-                                                price_match = re.search(r'(\d+[.,]?\d*(?:[eE][+-]?\d+)?)', str(price_value))
-                                                if price_match:
-                                                    price_value = float(price_match.group(1).replace(',', ''))
-                                                else:
-                                                    price_value = None
-                                            else:
-                                                price_value = None
-                                
-                                elif isinstance(result, str):
-                                    # Пытаемся извлечь цену из строки
-                                    import re
-                                    # Ищем числа (включая научную нотацию)
-                                    price_match = re.search(r'(\d+[.,]?\d*(?:[eE][+-]?\d+)?)', result)
-                                    if price_match:
-                                        price_value = float(price_match.group(1).replace(',', ''))
-                                
-                                # Проверяем разумность цены и сохраняем
-                                if price_value is not None:
-                                    # Для стейблкоинов принудительно используем цену $1
-                                    if token in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                        price_value = 1.0
-                                    elif underlying_token and underlying_token in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                        price_value = 1.0
-                                    
-                                    # Проверяем, что цена разумная (не слишком большая или маленькая)
-                                    if 0 < price_value < 1e15:  # Максимальная разумная цена
-                                        token_prices[token] = price_value
-                                        price_found = True
-                                        logger.info(f"Сохранена цена для {token}: {price_value}")
-                                        
-                                        # Если это базовый токен для AAVE, сохраняем и для базового токена
-                                        if underlying_token and underlying_token not in token_prices:
-                                            # Для стейблкоинов принудительно используем цену $1
-                                            if underlying_token in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-                                                token_prices[underlying_token] = 1.0
-                                            else:
-                                                token_prices[underlying_token] = price_value
-                                            logger.info(f"Также сохранена цена для базового токена {underlying_token}: {token_prices[underlying_token]}")
-                                        break
-                                    else:
-                                        logger.warning(f"Неразумная цена для {token}: {price_value}, пропускаем")
-                            except Exception as e:
-                                logger.warning(f"Ошибка при получении цены для {symbol}: {e}", exc_info=True)
-                                continue
-                    
-                    # Если не нашли цену через API, используем баланс USD / количество
-                    if not price_found and token in total_balances:
-                        balance_usd = total_balances[token]
-                        # Пытаемся получить количество из балансов
-                        total_amount = 0.0
-                        token_balances = state.get("token_balances", {})
-                        if token_balances:
-                            for wallet_balances in token_balances.values():
-                                if isinstance(wallet_balances, dict) and token in wallet_balances:
-                                    balance_data = wallet_balances[token]
-                                    if isinstance(balance_data, dict):
-                                        total_amount += balance_data.get("balance", 0)
-                                    elif isinstance(balance_data, (int, float)):
-                                        total_amount += balance_data
-                        
-                        if total_amount > 0 and balance_usd > 0:
-                            calculated_price = balance_usd / total_amount
-                            token_prices[token] = calculated_price
-                            logger.debug(f"Calculated price for {token} from balance: {calculated_price}")
-                            
-                            # Если это AAVE токен и мы не нашли цену базового токена, сохраняем и для базового
-                            if underlying_token and underlying_token not in token_prices:
-                                token_prices[underlying_token] = calculated_price
-                                logger.debug(f"Также сохранена цена для базового токена {underlying_token}: {calculated_price}")
+                        token_prices[underlying_token] = 1.0
+                else:
+                    tokens_to_price.append(token)
+            
+            async def fetch_prices(symbols) -> Dict[str, Optional[float]]:
+                """Запрашивает цены одновременно, каждую пару — один раз"""
+                unique_symbols = list(dict.fromkeys(symbols))
+                prices = await asyncio.gather(
+                    *(_fetch_price(price_tool, semaphore, symbol) for symbol in unique_symbols)
+                )
+                return dict(zip(unique_symbols, prices))
+            
+            # Для AAVE токенов сначала пробуем цену базового токена, для остальных — напрямую.
+            # Пара строится по базовому активу в верхнем регистре: aArbWETH, aWETH, WETH
+            # и weth оцениваются одним запросом WETH-USDT, цена раздается всем им
+            pair_by_token = {
+                token: f"{underlying_tokens[token] or token.upper()}-USDT" for token in tokens_to_price
+            }
+            prices = await fetch_prices(pair_by_token.values())
+            # AAVE токены без цены базового токена пробуем по собственному символу
+            retry_pair_by_token = {
+                token: f"{token.upper()}-USDT" for token in tokens_to_price
+                if underlying_tokens[token] and not _is_sane_price(prices[pair_by_token[token]])
+            }
+            if retry_pair_by_token:
+                prices.update(await fetch_prices(retry_pair_by_token.values()))
+            
+            # Разбираем результаты после завершения всех запросов
+            for token in tokens_to_price:
+                underlying_token = underlying_tokens[token]
+                
+                # AAVE токен: сначала цена базового токена
+                if underlying_token:
+                    base_price = prices[pair_by_token[token]]
+                    if _is_sane_price(base_price):
+                        token_prices[token] = base_price
+                        token_prices[underlying_token] = base_price  # Сохраняем и для базового токена
+                        logger.info(f"Использована цена базового токена {underlying_token} ({base_price}) для AAVE токена {token}")
+                        continue
+                    logger.debug(f"Нет разумной цены базового токена {underlying_token} для AAVE токена {token}: {base_price}")
                 
-                except Exception as e:
-                    logger.warning(f"Failed to get price for {token}: {e}")
-                    continue
+                # Цена по собственному символу, иначе — из баланса USD / количество
+                price_value = prices.get(retry_pair_by_token.get(token, pair_by_token[token]))
+                if not _is_sane_price(price_value):
+                    if price_value is not None:
+                        logger.warning(f"Неразумная цена для {token}: {price_value}, пропускаем")
+                    price_value = _price_from_balances(token, total_balances.get(token, 0), token_balances)
+                    if price_value is None:
+                        continue
+                    logger.debug(f"Calculated price for {token} from balance: {price_value}")
+                
+                token_prices[token] = price_value
+                logger.info(f"Сохранена цена для {token}: {price_value}")
+                # Для AAVE токена без цены базового токена сохраняем и для базового
+                if underlying_token and underlying_token not in token_prices:
+                    token_prices[underlying_token] = price_value
         
         # Для стейблкоинов принудительно устанавливаем цену $1
-        for stablecoin in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+        for stablecoin in _STABLECOINS:
             if stablecoin in all_tokens or stablecoin in total_balances:
                 token_prices[stablecoin] = 1.0
                 logger.info(f"Установлена цена $1.00 для стейблкоина {stablecoin}")
         
         # Если не нашли инструмент или не получили цены, используем значения из балансов
         if not token_prices and total_balances:
-            token_balances = state.get("token_balances", {})
             for token, balance_usd in total_balances.items():
-                if token not in token_prices and balance_usd > 0:
-                    total_amount = 0.0
-                    if token_balances:
-                        for wallet_balances in token_balances.values():
-                            if isinstance(wallet_balances, dict) and token in wallet_balances:
-                                balance_data = wallet_balances[token]
-                                if isinstance(balance_data, dict):
-                                    total_amount += balance_data.get("balance", 0)
-                                elif isinstance(balance_data, (int, float)):
-                                    total_amount += balance_data
-                    
-                    if total_amount > 0:
-                        token_prices[token] = balance_usd / total_amount
-                        logger.debug(f"Calculated price for {token} from balance (fallback): {token_prices[token]}")
+                price_value = _price_from_balances(token, balance_usd, token_balances)
+                if price_value is not None:
+                    token_prices[token] = price_value
+                    logger.debug(f"Calculated price for {token} from balance (fallback): {price_value}")
         
         execution_log.append(f"✅ Retrieved prices for {len(token_prices)} tokens")
         
@@ -620,18 +606,6 @@ async def calculate_current_allocation(
                 recalculated_balances_usd = dict(original_total_balances)
                 logger.info(f"Использованы исходные балансы: {recalculated_balances_usd}")
         
-        # Функция для извлечения базового токена из AAVE токена
-        def extract_underlying_token(aave_token: str) -> Optional[str]:
-            """Извлекает базовый токен из AAVE токена"""
-            token_upper = aave_token.upper()
-            if token_upper.startswith("AARB"):
-                return token_upper[4:]  # Убираем префикс "AARB"
-            elif token_upper.startswith("A") and len(token_upper) > 1:
-                underlying = token_upper[1:]
-                if underlying in ["USDT", "USDC", "WBTC", "WETH", "ETH", "BTC", "DAI", "BUSD", "TUSD"]:
-                    return underlying
-            return None
-        
         # Обрабатываем ERC20 токены
         # Обрабатываем даже если token_prices пустой - используем сохраненные значения с проверкой
         if token_balances:
@@ -641,11 +615,11 @@ async def calculate_current_allocation(
                         if isinstance(token_data, dict):
                             balance = token_data.get("balance", 0)
                             if balance > 0:
-                                # Определяем, является ли это AAVE токеном
-                                underlying = extract_underlying_token(symbol)
+                                # Базовый токен AAVE определен при разборе ответа Chainbase (_process_token)
+                                underlying = token_data.get("underlying_token")
                                 
                                 # Для агрегации используем базовый токен, если это AAVE токен
-                                aggregation_symbol = underlying if underlying else symbol
+                                aggregation_symbol = underlying or symbol
                                 
                                 # Используем актуальную цену из token_prices для базового токена
                                 price = 0
@@ -669,7 +643,7 @@ async def calculate_current_allocation(
                                         calculated_price = saved_balance_usd / balance if balance > 0 else 0
                                         
                                         # Для стейблкоинов: если цена больше $2, считаем неправильной
-                                        if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+                                        if aggregation_symbol in _STABLECOINS:
                                             if calculated_price <= 2.0:
                                                 balance_usd = saved_balance_usd
                                             else:
@@ -685,16 +659,14 @@ async def calculate_current_allocation(
                                                 balance_usd = 0
                                     else:
                                         # Если сохраненное значение тоже 0, но баланс > 0, используем дефолт для стейблкоинов
-                                        if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+                                        if aggregation_symbol in _STABLECOINS:
                                             balance_usd = balance * 1.0
                                             logger.debug(f"Используем дефолтную цену $1.00 для {symbol} (баланс={balance})")
                                         else:
                                             balance_usd = 0
                                 
                                 # Агрегируем по базовому токену (даже если balance_usd = 0, чтобы не потерять токен)
-                                if aggregation_symbol not in recalculated_balances_usd:
-                                    recalculated_balances_usd[aggregation_symbol] = 0.0
-                                recalculated_balances_usd[aggregation_symbol] += balance_usd
+                                recalculated_balances_usd[aggregation_symbol] = recalculated_balances_usd.get(aggregation_symbol, 0.0) + balance_usd
                                 
                                 if underlying:
                                     logger.info(f"Пересчет AAVE токена {symbol} -> {aggregation_symbol}: баланс={balance}, цена={price}, USD={balance_usd}")
@@ -721,9 +693,7 @@ async def calculate_current_allocation(
                 if native_balance > 0:
                     if native_price > 0:
                         native_balance_usd = native_balance * native_price
-                        if native_symbol not in recalculated_balances_usd:
-                            recalculated_balances_usd[native_symbol] = 0.0
-                        recalculated_balances_usd[native_symbol] += native_balance_usd
+                        recalculated_balances_usd[native_symbol] = recalculated_balances_usd.get(native_symbol, 0.0) + native_balance_usd
                         logger.debug(f"Нативный баланс {native_symbol}: {native_balance}, цена={native_price}, USD={native_balance_usd}")
         
         # Если после пересчета балансы пустые, используем исходные total_balances
@@ -804,14 +774,13 @@ async def calculate_rebalancing_needs(
                 "execution_log": execution_log
             }
         
-        tool = CalculateRebalancingTool()
-        result_str = await tool.execute(
+        result_str = await _calculate_rebalancing_tool.execute(
             current_portfolio=current_portfolio,
             target_allocation=target_allocation,
             threshold_percent=threshold_percent
         )
         
-        result = json.loads(result_str) if isinstance(result_str, str) else result_str
+        result = orjson.loads(result_str) if isinstance(result_str, str) else result_str
         
         if "error" in result:
             execution_log.append(f"⚠️ Calculation error: {result['error']}")
@@ -872,13 +841,12 @@ async def estimate_transaction_costs(
     num_transactions = len(actions) if actions else 1
     
     try:
-        tool = EstimateGasFeesTool()
-        result_str = await tool.execute(
+        result_str = await _estimate_gas_fees_tool.execute(
             chain=chain_name,
             num_transactions=num_transactions
         )
         
-        result = json.loads(result_str) if isinstance(result_str, str) else result_str
+        result = orjson.loads(result_str) if isinstance(result_str, str) else result_str
         
         if "error" in result:
             execution_log.append(f"⚠️ Failed to estimate gas fees: {result['error']}")
@@ -923,14 +891,13 @@ async def suggest_trades(
     min_profit_threshold = state.get("min_profit_threshold_usd", 50.0)
     
     try:
-        tool = SuggestRebalancingTradesTool()
-        result_str = await tool.execute(
+        result_str = await _suggest_trades_tool.execute(
             rebalancing_actions=rebalancing_actions,
             gas_fees=gas_fees,
             min_profit_threshold_usd=min_profit_threshold
         )
         
-        result = json.loads(result_str) if isinstance(result_str, str) else result_str
+        result = orjson.loads(result_str) if isinstance(result_str, str) else result_str
         
         if "error" in result:
             execution_log.append(f"❌ Error: {result['error']}")
@@ -985,18 +952,6 @@ async def generate_recommendation(
     recommendation_parts.append("=" * 60)
     recommendation_parts.append(f"\n💰 Total portfolio value: ${total_portfolio_value:,.2f}")
     
-    # Функция для извлечения базового токена из AAVE токена
-    def extract_underlying_token(aave_token: str) -> Optional[str]:
-        """Извлекает базовый токен из AAVE токена"""
-        token_upper = aave_token.upper()
-        if token_upper.startswith("AARB"):
-            return token_upper[4:]  # Убираем префикс "AARB"
-        elif token_upper.startswith("A") and len(token_upper) > 1:
-            underlying = token_upper[1:]
-            if underlying in ["USDT", "USDC", "WBTC", "WETH", "ETH", "BTC", "DAI", "BUSD", "TUSD"]:
-                return underlying
-        return None
-    
     # Подсчитываем количество токенов и их детали
     total_balances = current_portfolio.get("total_balances", {})
     unique_tokens = set()
@@ -1015,8 +970,8 @@ async def generate_recommendation(
                         balance = token_data.get("balance", 0)
                         if balance > 0:
                             # Определяем базовый токен для агрегации
-                            underlying = extract_underlying_token(symbol)
-                            aggregation_symbol = underlying if underlying else symbol
+                            underlying = token_data.get("underlying_token")
+                            aggregation_symbol = underlying or symbol
                             
                             # Получаем цену для базового токена
                             price = token_prices.get(aggregation_symbol, 0)
@@ -1024,7 +979,7 @@ async def generate_recommendation(
                                 price = token_prices.get(symbol, 0)
                             
                             # Для стейблкоинов принудительно используем цену $1
-                            if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+                            if aggregation_symbol in _STABLECOINS:
                                 price = 1.0
                             
                             # Пересчитываем balance_usd используя актуальную цену
@@ -1034,7 +989,7 @@ async def generate_recommendation(
                                 # Fallback: используем сохраненное значение
                                 balance_usd = token_data.get("balance_usd", 0) or 0
                                 # Для стейблкоинов пересчитываем с ценой $1
-                                if balance_usd == 0 and aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+                                if balance_usd == 0 and aggregation_symbol in _STABLECOINS:
                                     balance_usd = balance * 1.0
                             
                             if balance_usd > 0:
@@ -1072,7 +1027,7 @@ async def generate_recommendation(
         
         # Вычисляем среднюю цену
         # Для стейблкоинов принудительно используем цену $1
-        if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+        if aggregation_symbol in _STABLECOINS:
             avg_price = 1.0
         else:
             avg_price = total_balance_usd / total_balance if total_balance > 0 else 0
@@ -1096,7 +1051,7 @@ async def generate_recommendation(
             regular_balance_usd = total_balance_usd - aave_balance_usd
             
             # Для стейблкоинов принудительно используем цену $1
-            if aggregation_symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+            if aggregation_symbol in _STABLECOINS:
                 regular_price = 1.0
                 # Пересчитываем balance_usd с правильной ценой
                 if regular_balance > 0 and regular_balance_usd != regular_balance:
@@ -1138,7 +1093,7 @@ async def generate_recommendation(
                     if isinstance(wallet_balances, dict):
                         for token_symbol, token_data in wallet_balances.items():
                             if isinstance(token_data, dict):
-                                underlying = extract_underlying_token(token_symbol)
+                                underlying = token_data.get("underlying_token")
                                 if underlying == symbol:
                                     has_aave_tokens = True
                                     break
@@ -1154,8 +1109,8 @@ async def generate_recommendation(
                     if isinstance(wallet_balances, dict):
                         for token_symbol, token_data in wallet_balances.items():
                             if isinstance(token_data, dict):
-                                underlying = extract_underlying_token(token_symbol)
-                                aggregation_symbol = underlying if underlying else token_symbol
+                                underlying = token_data.get("underlying_token")
+                                aggregation_symbol = underlying or token_symbol
                                 
                                 # Если это токен для нашего базового символа
                                 if aggregation_symbol == symbol:
@@ -1167,7 +1122,7 @@ async def generate_recommendation(
             elif balance == 0 and balance_usd > 0:
                 # Если цена не найдена, но есть balance_usd, используем его
                 # Для стейблкоинов используем дефолтную цену $1
-                if symbol in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+                if symbol in _STABLECOINS:
                     balance = balance_usd / 1.0
                     price = 1.0
             
@@ -1193,7 +1148,7 @@ async def generate_recommendation(
         total_aave_balance_usd = sum(a["balance_usd"] for a in aave_list)
         
         # Для стейблкоинов принудительно используем цену $1
-        if underlying in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+        if underlying in _STABLECOINS:
             avg_price = 1.0
         else:
             avg_price = total_aave_balance_usd / total_aave_balance if total_aave_balance > 0 else 0
@@ -1457,7 +1412,7 @@ async def run_rebalancing_analysis(
         "target_allocation": target_allocation,
         "threshold_percent": threshold_percent,
         "min_profit_threshold_usd": min_profit_threshold_usd,
-        "execution_log": []
+        "execution_log": deque(maxlen=_EXECUTION_LOG_MAXLEN)
     }
     
     # Запускаем выполнение графа
@@ -1465,12 +1420,13 @@ async def run_rebalancing_analysis(
     state_dict = dict(initial_state)
     result = await compiled.invoke(state_dict)
     
+    # Результат сохраняется в JSON (Recommendation.analysis) — deque в список
+    result["execution_log"] = list(result.get("execution_log", ()))
+    
     return result
 
 
 if __name__ == "__main__":
-    import asyncio
-    
     async def test():
         result = await run_rebalancing_analysis(
             wallets=["0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"],  # vitalik.eth
@@ -2,40 +2,85 @@
 Сервис для работы с агентом
 """
 import os
-from typing import Optional
-from sqlalchemy.orm import Session
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.agents.portfolio_rebalancer_agent import PortfolioRebalancerAgent
 from spoon_ai.chat import ChatBot
 from app.db.models import Wallet, Strategy, Recommendation, ChatMessageDB
 
+# Максимум агентов в памяти (по одному на пользователя)
+MAX_CACHED_AGENTS = 256
+
 
 class AgentService:
     """Сервис для управления агентом"""
     
-    _agent: Optional[PortfolioRebalancerAgent] = None
+    # Агенты пользователей в порядке последнего обращения (LRU)
+    _agents: "OrderedDict[Optional[uuid.UUID], PortfolioRebalancerAgent]" = OrderedDict()
+    # Настройки из configure_agent (mode, min_profit_threshold_usd) хранятся
+    # отдельно от агентов: вытеснение агента из LRU их не сбрасывает
+    _settings: Dict[Optional[uuid.UUID], Dict[str, Any]] = {}
+    _llm: Optional[ChatBot] = None
     
     @classmethod
-    def get_agent(cls) -> PortfolioRebalancerAgent:
-        """Получает или создает экземпляр агента"""
-        if cls._agent is None:
-            cls._agent = PortfolioRebalancerAgent(
-                llm=ChatBot(
-                    llm_provider=os.getenv("LLM_PROVIDER", "openrouter"),
-                    model_name=os.getenv("LLM_MODEL", "qwen/qwen3-coder:free")
-                )
+    def _get_llm(cls) -> ChatBot:
+        """Общий LLM-клиент для всех агентов"""
+        if cls._llm is None:
+            cls._llm = ChatBot(
+                llm_provider=os.getenv("LLM_PROVIDER", "openrouter"),
+                model_name=os.getenv("LLM_MODEL", "qwen/qwen3-coder:free")
             )
-        return cls._agent
+        return cls._llm
+    
+    @classmethod
+    def get_agent(cls, user_id: Optional[uuid.UUID] = None) -> PortfolioRebalancerAgent:
+        """
+        Получает или создает агента пользователя
+        
+        Агент (настройки и история диалога) переиспользуется между запросами
+        пользователя; при превышении MAX_CACHED_AGENTS вытесняется агент,
+        к которому дольше всего не обращались. Вместе с вытесненным агентом
+        теряется только история диалога: новый агент создается с настройками
+        пользователя из _settings. Создание синхронное, поэтому одновременные
+        первые запросы не создадут двух агентов.
+        """
+        agent = cls._agents.get(user_id)
+        if agent is not None:
+            cls._agents.move_to_end(user_id)
+            return agent
+        
+        agent = PortfolioRebalancerAgent(llm=cls._get_llm())
+        settings = cls._settings.get(user_id, {})
+        if "mode" in settings:
+            agent.set_mode(settings["mode"])
+        if "min_profit_threshold_usd" in settings:
+            agent.set_min_profit(settings["min_profit_threshold_usd"])
+        cls._agents[user_id] = agent
+        if len(cls._agents) > MAX_CACHED_AGENTS:
+            cls._agents.popitem(last=False)
+        return agent
     
     @staticmethod
-    def get_agent_status(db: Session, user_id) -> dict:
+    async def get_agent_status(db: AsyncSession, user_id) -> dict:
         """Получить текущий статус и конфигурацию агента"""
         try:
-            agent = AgentService.get_agent()
-            wallets_count = db.query(Wallet).filter(Wallet.user_id == user_id).count()
-            strategies_count = db.query(Strategy).filter(Strategy.user_id == user_id).count()
-            recommendations_count = db.query(Recommendation).filter(Recommendation.user_id == user_id).count()
-            chat_messages_count = db.query(ChatMessageDB).filter(ChatMessageDB.user_id == user_id).count()
+            agent = AgentService.get_agent(user_id)
+            wallets_count = await db.scalar(
+                select(func.count()).select_from(Wallet).where(Wallet.user_id == user_id)
+            )
+            strategies_count = await db.scalar(
+                select(func.count()).select_from(Strategy).where(Strategy.user_id == user_id)
+            )
+            recommendations_count = await db.scalar(
+                select(func.count()).select_from(Recommendation).where(Recommendation.user_id == user_id)
+            )
+            chat_messages_count = await db.scalar(
+                select(func.count()).select_from(ChatMessageDB).where(ChatMessageDB.user_id == user_id)
+            )
             
             return {
                 "success": True,
@@ -58,15 +103,19 @@ class AgentService:
     
     @staticmethod
     def configure_agent(mode: Optional[str] = None, 
-                       min_profit_threshold_usd: Optional[float] = None) -> dict:
+                       min_profit_threshold_usd: Optional[float] = None,
+                       user_id: Optional[uuid.UUID] = None) -> dict:
         """Настроить параметры агента"""
         try:
-            agent = AgentService.get_agent()
+            agent = AgentService.get_agent(user_id)
+            settings = AgentService._settings.setdefault(user_id, {})
             
             if mode:
                 agent.set_mode(mode)
+                settings["mode"] = agent.mode
             if min_profit_threshold_usd is not None:
                 agent.set_min_profit(min_profit_threshold_usd)
+                settings["min_profit_threshold_usd"] = agent.min_profit_threshold_usd
             
             return {
                 "success": True,
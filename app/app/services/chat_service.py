@@ -1,34 +1,143 @@
 """
 Сервис для работы с чатом
 """
+import asyncio
 import uuid
 import json
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from datetime import datetime
 import logging
 
-from app.db.models import ChatMessageDB, Strategy, Wallet, StrategyWallet
+from app.db.models import ChatMessageDB, Strategy, Wallet
+from app.db.queries import STRATEGY_BY_ID, WALLET_BY_ID, STRATEGY_WALLET_LINKS
+from app.utils.response_cache import invalidate
 from app.api.schemas import ChatMessage, ChatResponse, ChatHistoryResponse
 from app.services.strategy_service import StrategyService
 
 logger = logging.getLogger(__name__)
 
+# Сколько неотправленных сообщений держим для медленного подписчика
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Колонки сообщения, нужные ChatResponse. Списки истории выбираются кортежами
+# строк: без создания ORM-объектов, identity map и отслеживания состояния,
+# и без wallet_ids/strategy_id, которые в ответ не попадают
+_MESSAGE_COLUMNS = (
+    ChatMessageDB.id,
+    ChatMessageDB.user_message,
+    ChatMessageDB.agent_response,
+    ChatMessageDB.created_at,
+)
+
 
 class ChatService:
     """Сервис для управления чатом"""
     
+    # Очереди подписчиков на новые сообщения: (user_id, strategy_id или None)
+    _subscribers: Dict[Tuple[uuid.UUID, Optional[str]], Set[asyncio.Queue]] = {}
+    
+    @classmethod
+    @asynccontextmanager
+    async def subscribe(
+        cls,
+        user_id: uuid.UUID,
+        strategy_id: Optional[str] = None
+    ) -> AsyncIterator[asyncio.Queue]:
+        """
+        Подписка на новые сообщения чата пользователя
+        
+        Yields:
+            Очередь, в которую попадают ChatResponse.model_dump() новых сообщений
+            (всех сообщений пользователя, если strategy_id не указан)
+        """
+        key = (user_id, strategy_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        cls._subscribers.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = cls._subscribers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del cls._subscribers[key]
+    
+    @classmethod
+    def _broadcast(
+        cls,
+        user_id: uuid.UUID,
+        strategy_id: Optional[uuid.UUID],
+        message: Dict[str, Any]
+    ) -> None:
+        """Рассылает новое сообщение подписчикам пользователя и его стратегии"""
+        keys = [(user_id, None)]
+        if strategy_id is not None:
+            keys.append((user_id, str(strategy_id)))
+        for key in keys:
+            for queue in cls._subscribers.get(key, ()):
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    logger.warning(f"Очередь подписчика чата {user_id} переполнена, сообщение пропущено")
+    
     @staticmethod
     async def send_message(
-        db: Session,
+        db: AsyncSession,
         message: ChatMessage,
         user_id: uuid.UUID,
         get_agent_func
     ) -> ChatResponse:
         """Отправить сообщение агенту"""
-        agent = get_agent_func()
+        agent = get_agent_func(user_id)
+        prompt, strategy, strategy_uuid, is_first_message = await ChatService._prepare_message(db, message, user_id)
+        
+        # Получаем ответ от агента
+        response = await agent.run(prompt)
+        
+        return await ChatService._save_message(
+            db, message, user_id, strategy, strategy_uuid, is_first_message, response
+        )
+    
+    @staticmethod
+    async def stream_message(
+        db: AsyncSession,
+        message: ChatMessage,
+        user_id: uuid.UUID,
+        get_agent_func
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Отправить сообщение агенту с потоковой отдачей промежуточных шагов
         
+        Yields:
+            События агента (content, tool_calls, tool_result) и в конце
+            {"type": "done", "message": <ChatResponse>} после сохранения в БД
+        """
+        agent = get_agent_func(user_id)
+        prompt, strategy, strategy_uuid, is_first_message = await ChatService._prepare_message(db, message, user_id)
+        
+        response = None
+        async for event in agent.run_stream(prompt):
+            if event["type"] == "final":
+                response = event["content"]
+            else:
+                yield event
+        
+        chat_response = await ChatService._save_message(
+            db, message, user_id, strategy, strategy_uuid, is_first_message, response
+        )
+        yield {"type": "done", "message": chat_response.model_dump()}
+    
+    @staticmethod
+    async def _prepare_message(
+        db: AsyncSession,
+        message: ChatMessage,
+        user_id: uuid.UUID
+    ) -> Tuple[str, Optional[Strategy], Optional[uuid.UUID], bool]:
+        """Определяет стратегию и формирует промпт для агента"""
         # Формируем контекст
         context_parts = []
         strategy_uuid = None
@@ -38,9 +147,9 @@ class ChatService:
         # Если нет - создаем новую из первого сообщения
         if not message.strategy_id:
             # Проверяем, есть ли уже активные стратегии у пользователя
-            existing_strategy = db.query(Strategy).filter(
+            existing_strategy = await db.scalar(select(Strategy).where(
                 Strategy.user_id == user_id
-            ).first()
+            ).limit(1))
             
             if not existing_strategy:
                 # Создаем новую стратегию из первого сообщения
@@ -54,10 +163,7 @@ class ChatService:
                     for wallet_id in message.wallet_ids:
                         try:
                             wallet_uuid = uuid.UUID(wallet_id)
-                            wallet = db.query(Wallet).filter(
-                                Wallet.id == wallet_uuid,
-                                Wallet.user_id == user_id
-                            ).first()
+                            wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_uuid, "user_id": user_id})
                             if wallet:
                                 wallet_uuids.append(wallet_uuid)
                         except ValueError:
@@ -82,35 +188,27 @@ class ChatService:
         else:
             try:
                 strategy_uuid = uuid.UUID(message.strategy_id)
-                strategy = db.query(Strategy).filter(
-                    Strategy.id == strategy_uuid,
-                    Strategy.user_id == user_id
-                ).first()
+                strategy = await db.scalar(STRATEGY_BY_ID, {"strategy_id": strategy_uuid, "user_id": user_id})
                 if not strategy:
                     raise HTTPException(status_code=404, detail="Стратегия не найдена")
             except ValueError:
                 raise HTTPException(status_code=400, detail="Неверный формат ID стратегии")
         
         # Получаем информацию о стратегии
-        strategy = db.query(Strategy).filter(
-            Strategy.id == strategy_uuid,
-            Strategy.user_id == user_id
-        ).first()
+        strategy = await db.scalar(STRATEGY_BY_ID, {"strategy_id": strategy_uuid, "user_id": user_id})
         
         if strategy:
             context_parts.append(f"Strategy: {strategy.name}")
             context_parts.append(f"Current description: {strategy.description}")
             
             # Получаем кошельки стратегии
-            wallet_links = db.query(StrategyWallet).filter(
-                StrategyWallet.strategy_id == strategy.id
-            ).all()
+            wallet_links = (await db.scalars(STRATEGY_WALLET_LINKS, {"strategy_id": strategy.id})).all()
             if wallet_links:
                 wallet_ids_list = [str(sw.wallet_id) for sw in wallet_links]
-                wallets = db.query(Wallet).filter(
+                wallets = (await db.scalars(select(Wallet).where(
                     Wallet.id.in_([sw.wallet_id for sw in wallet_links]),
                     Wallet.user_id == user_id
-                ).all()
+                ))).all()
                 wallet_info = [f"{w.label or w.address} ({w.chain})" for w in wallets]
                 if wallet_info:
                     context_parts.append(f"Wallets: {', '.join(wallet_info)}")
@@ -121,10 +219,7 @@ class ChatService:
             for wallet_id in message.wallet_ids:
                 try:
                     wallet_uuid = uuid.UUID(wallet_id)
-                    wallet = db.query(Wallet).filter(
-                        Wallet.id == wallet_uuid,
-                        Wallet.user_id == user_id
-                    ).first()
+                    wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_uuid, "user_id": user_id})
                     if wallet:
                         wallet_info.append(f"{wallet.label or wallet.address} ({wallet.chain})")
                 except ValueError:
@@ -146,9 +241,25 @@ class ChatService:
             else:
                 prompt = message.message
         
-        # Получаем ответ от агента
-        response = await agent.run(prompt)
+        # Завершаем транзакцию чтения до вызова агента: иначе соединение пула
+        # простаивает idle in transaction все время ответа LLM. Загруженные
+        # объекты остаются доступны (expire_on_commit=False), запись в
+        # _save_message получит соединение заново
+        await db.commit()
         
+        return prompt, strategy, strategy_uuid, is_first_message
+    
+    @staticmethod
+    async def _save_message(
+        db: AsyncSession,
+        message: ChatMessage,
+        user_id: uuid.UUID,
+        strategy: Optional[Strategy],
+        strategy_uuid: Optional[uuid.UUID],
+        is_first_message: bool,
+        response: str
+    ) -> ChatResponse:
+        """Обновляет стратегию по запросу пользователя и сохраняет сообщение в БД"""
         # Если пользователь обновил описание стратегии, обновляем стратегию
         if strategy and not is_first_message:
             # Проверяем, хочет ли пользователь обновить стратегию
@@ -159,14 +270,14 @@ class ChatService:
                 if len(message.message) > 20 and "?" not in message.message:
                     from app.api.schemas import StrategyUpdate
                     strategy_update = StrategyUpdate(description=message.message)
-                    await StrategyService.update_strategy(db, str(strategy.id), strategy_update, user_id)
+                    await StrategyService.update_strategy(db, strategy.id, strategy_update, user_id)
         
         # Сохраняем в БД
         wallet_ids_for_db = None
         if message.wallet_ids:
             wallet_ids_for_db = [str(wid) for wid in message.wallet_ids]
         elif strategy:
-            wallet_links = db.query(StrategyWallet).filter(StrategyWallet.strategy_id == strategy.id).all()
+            wallet_links = (await db.scalars(STRATEGY_WALLET_LINKS, {"strategy_id": strategy.id})).all()
             wallet_ids_for_db = [str(sw.wallet_id) for sw in wallet_links]
         
         db_chat = ChatMessageDB(
@@ -177,93 +288,99 @@ class ChatService:
             wallet_ids=wallet_ids_for_db
         )
         db.add(db_chat)
-        db.commit()
-        db.refresh(db_chat)
+        await db.commit()
+        invalidate(user_id, "chat_history", "chat_new_messages")
         
-        return ChatResponse(
+        chat_response = ChatResponse(
             message_id=str(db_chat.id),
             user_message=db_chat.user_message,
             agent_response=db_chat.agent_response,
             timestamp=db_chat.created_at.isoformat()
         )
+        ChatService._broadcast(user_id, strategy_uuid, chat_response.model_dump())
+        return chat_response
     
     @staticmethod
-    def get_chat_history(
-        db: Session,
+    async def get_chat_history(
+        db: AsyncSession,
         user_id: uuid.UUID,
         limit: int = 50,
         strategy_id: Optional[str] = None
     ) -> ChatHistoryResponse:
         """Получить историю чата пользователя"""
-        query = db.query(ChatMessageDB).filter(ChatMessageDB.user_id == user_id)
+        query = select(*_MESSAGE_COLUMNS).where(ChatMessageDB.user_id == user_id)
         
         if strategy_id:
             try:
                 strategy_uuid = uuid.UUID(strategy_id)
-                query = query.filter(ChatMessageDB.strategy_id == strategy_uuid)
+                query = query.where(ChatMessageDB.strategy_id == strategy_uuid)
             except ValueError:
                 pass
         
-        chat_messages = query.order_by(ChatMessageDB.created_at.desc()).limit(limit).all()
+        rows = (await db.execute(
+            query.order_by(ChatMessageDB.created_at.desc()).limit(limit)
+        )).all()
         
         messages = [
             ChatResponse(
-                message_id=str(msg.id),
-                user_message=msg.user_message,
-                agent_response=msg.agent_response,
-                timestamp=msg.created_at.isoformat()
+                message_id=str(message_id),
+                user_message=user_message,
+                agent_response=agent_response,
+                timestamp=created_at.isoformat()
             )
-            for msg in chat_messages
+            for message_id, user_message, agent_response, created_at in rows
         ]
         
         # Переворачиваем список, чтобы старые сообщения были первыми
         messages.reverse()
         
-        total = query.count()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
         
         return ChatHistoryResponse(messages=messages, total=total)
     
     @staticmethod
-    def get_new_messages(
-        db: Session,
+    async def get_new_messages(
+        db: AsyncSession,
         user_id: uuid.UUID,
         strategy_id: Optional[str] = None,
         after_message_id: Optional[str] = None
     ) -> ChatHistoryResponse:
         """Получить новые сообщения после указанного ID"""
-        query = db.query(ChatMessageDB).filter(ChatMessageDB.user_id == user_id)
+        query = select(*_MESSAGE_COLUMNS).where(ChatMessageDB.user_id == user_id)
         
         if strategy_id:
             try:
                 strategy_uuid = uuid.UUID(strategy_id)
-                query = query.filter(ChatMessageDB.strategy_id == strategy_uuid)
+                query = query.where(ChatMessageDB.strategy_id == strategy_uuid)
             except ValueError:
                 pass
         
         if after_message_id:
             try:
                 after_uuid = uuid.UUID(after_message_id)
-                after_message = db.query(ChatMessageDB).filter(
+                after_created_at = await db.scalar(select(ChatMessageDB.created_at).where(
                     ChatMessageDB.id == after_uuid
-                ).first()
-                if after_message:
-                    query = query.filter(ChatMessageDB.created_at > after_message.created_at)
+                ))
+                if after_created_at is not None:
+                    query = query.where(ChatMessageDB.created_at > after_created_at)
             except ValueError:
                 pass
         
-        chat_messages = query.order_by(ChatMessageDB.created_at.asc()).all()
+        rows = (await db.execute(
+            query.order_by(ChatMessageDB.created_at.asc())
+        )).all()
         
         messages = [
             ChatResponse(
-                message_id=str(msg.id),
-                user_message=msg.user_message,
-                agent_response=msg.agent_response,
-                timestamp=msg.created_at.isoformat()
+                message_id=str(message_id),
+                user_message=user_message,
+                agent_response=agent_response,
+                timestamp=created_at.isoformat()
             )
-            for msg in chat_messages
+            for message_id, user_message, agent_response, created_at in rows
         ]
         
-        total = query.count()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
         
         return ChatHistoryResponse(messages=messages, total=total)
 
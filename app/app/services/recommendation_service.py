@@ -3,11 +3,15 @@
 """
 import uuid
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 from fastapi import HTTPException
 import logging
 
-from app.db.models import Recommendation, Strategy, StrategyWallet, Wallet
+from app.db.models import Recommendation, StrategyWallet, Wallet
+from app.db.queries import STRATEGY_BY_ID, RECOMMENDATION_BY_ID
+from app.utils.response_cache import invalidate
 from app.api.schemas import RecommendationRequest, RecommendationResponse
 from app.services.strategy_service import StrategyService
 from app.graphs.rebalancing_graph import run_rebalancing_analysis
@@ -20,7 +24,7 @@ class RecommendationService:
     
     @staticmethod
     async def create_recommendation(
-        db: Session,
+        db: AsyncSession,
         request: RecommendationRequest,
         user_id: uuid.UUID,
         get_agent_func=None  # Оставлен для обратной совместимости, но не используется
@@ -31,23 +35,21 @@ class RecommendationService:
         except ValueError:
             raise HTTPException(status_code=400, detail="Неверный формат ID стратегии")
         
-        strategy = db.query(Strategy).filter(
-            Strategy.id == strategy_uuid,
-            Strategy.user_id == user_id
-        ).first()
+        strategy = await db.scalar(STRATEGY_BY_ID, {"strategy_id": strategy_uuid, "user_id": user_id})
         
         if not strategy:
             raise HTTPException(status_code=404, detail="Стратегия не найдена")
         
         # Получаем кошельки стратегии
-        wallet_links = db.query(StrategyWallet).filter(StrategyWallet.strategy_id == strategy.id).all()
-        wallet_ids = [sw.wallet_id for sw in wallet_links]
+        wallet_ids = (await db.scalars(
+            select(StrategyWallet.wallet_id).where(StrategyWallet.strategy_id == strategy.id)
+        )).all()
         
         # Собираем информацию о кошельках
-        wallets = db.query(Wallet).filter(
+        wallets = (await db.scalars(select(Wallet).where(
             Wallet.id.in_(wallet_ids),
             Wallet.user_id == user_id
-        ).all()
+        ))).all()
         
         if not wallets:
             raise HTTPException(status_code=400, detail="Нет доступных кошельков для стратегии")
@@ -62,6 +64,11 @@ class RecommendationService:
             if chain is None:
                 chain = str(wallet.chain)
         
+        # Завершаем транзакцию чтения до разбора описания и анализа графом:
+        # соединение возвращается в пул на время долгих внешних вызовов,
+        # сохранение рекомендации получит его заново (expire_on_commit=False)
+        await db.commit()
+        
         # Парсим описание стратегии для получения целевого распределения
         strategy_description = str(strategy.description)
         target_allocation = await StrategyService.parse_strategy_description(strategy_description)
@@ -105,8 +112,8 @@ class RecommendationService:
             analysis=result  # Сохраняем весь результат анализа
         )
         db.add(db_recommendation)
-        db.commit()
-        db.refresh(db_recommendation)
+        await db.commit()
+        invalidate(user_id, "recommendations")
         logger.info(f"Рекомендация создана: {db_recommendation.id} для стратегии {strategy.id}")
         
         return RecommendationResponse(
@@ -118,21 +125,13 @@ class RecommendationService:
         )
     
     @staticmethod
-    def get_recommendation(
-        db: Session,
-        recommendation_id: str,
+    async def get_recommendation(
+        db: AsyncSession,
+        recommendation_id: uuid.UUID,
         user_id: uuid.UUID
     ) -> RecommendationResponse:
         """Получить конкретную рекомендацию по ID"""
-        try:
-            recommendation_uuid = uuid.UUID(recommendation_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        recommendation = db.query(Recommendation).filter(
-            Recommendation.id == recommendation_uuid,
-            Recommendation.user_id == user_id
-        ).first()
+        recommendation = await db.scalar(RECOMMENDATION_BY_ID, {"recommendation_id": recommendation_id, "user_id": user_id})
         
         if not recommendation:
             raise HTTPException(status_code=404, detail="Рекомендация не найдена")
@@ -146,23 +145,25 @@ class RecommendationService:
         )
     
     @staticmethod
-    def get_recommendations(
-        db: Session,
+    async def get_recommendations(
+        db: AsyncSession,
         user_id: uuid.UUID,
         strategy_id: Optional[str] = None,
         limit: int = 50
     ) -> List[RecommendationResponse]:
         """Получить историю рекомендаций пользователя"""
-        query = db.query(Recommendation).filter(Recommendation.user_id == user_id)
+        query = select(Recommendation).where(Recommendation.user_id == user_id)
         
         if strategy_id:
             try:
                 strategy_uuid = uuid.UUID(strategy_id)
-                query = query.filter(Recommendation.strategy_id == strategy_uuid)
+                query = query.where(Recommendation.strategy_id == strategy_uuid)
             except ValueError:
                 raise HTTPException(status_code=400, detail="Неверный формат ID стратегии")
         
-        recommendations = query.order_by(Recommendation.created_at.desc()).limit(limit).all()
+        recommendations = (await db.scalars(
+            query.options(raiseload("*")).order_by(Recommendation.created_at.desc()).limit(limit)
+        )).all()
         
         return [
             RecommendationResponse(
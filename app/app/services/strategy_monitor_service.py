@@ -5,10 +5,13 @@ import asyncio
 import logging
 import uuid
 from typing import Optional, Dict
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
 
-from app.db.models import Strategy, StrategyWallet, Wallet, Recommendation
+from app.db.models import Strategy, Wallet, Recommendation
+from app.db.queries import STRATEGY_WALLET_LINKS
+from app.utils.response_cache import invalidate
 from app.services.strategy_service import StrategyService
 from app.services.recommendation_service import RecommendationService
 from app.graphs.rebalancing_graph import run_rebalancing_analysis
@@ -34,16 +37,20 @@ class StrategyMonitorService:
         cls._running = True
         
         # Загружаем все стратегии и планируем проверки
-        from app.db import get_db
-        db = next(get_db())
+        from app.db import get_session_local
+        db = get_session_local()()
         try:
-            strategies = db.query(Strategy).all()
-            logger.info(f"Найдено {len(strategies)} стратегий для мониторинга")
+            # Сначала самые давно проверявшиеся: порядок совпадает с индексом
+            # ix_strategies_last_checked (last_checked_at ASC NULLS FIRST)
+            strategy_ids = (await db.scalars(
+                select(Strategy.id).order_by(Strategy.last_checked_at.asc().nulls_first())
+            )).all()
+            logger.info(f"Найдено {len(strategy_ids)} стратегий для мониторинга")
             
-            for strategy in strategies:
-                await cls.schedule_strategy_check(strategy.id)
+            for strategy_id in strategy_ids:
+                await cls.schedule_strategy_check(strategy_id)
         finally:
-            db.close()
+            await db.close()
         
         logger.info(f"✅ Мониторинг стратегий запущен (интервал: {CHECK_INTERVAL_SECONDS} сек для каждой стратегии)")
     
@@ -59,18 +66,18 @@ class StrategyMonitorService:
                 pass
         
         async def strategy_monitor_loop():
-            from app.db import get_db
+            from app.db import get_session_local
             while cls._running:
                 try:
-                    db = next(get_db())
+                    db = get_session_local()()
                     try:
-                        strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
+                        strategy = await db.scalar(select(Strategy).where(Strategy.id == strategy_id))
                         if not strategy:
                             logger.warning(f"Стратегия {strategy_id} не найдена, останавливаем мониторинг")
                             break
                         
                         # Проверяем, нужно ли выполнить проверку сейчас
-                        now = datetime.utcnow()
+                        now = datetime.now(timezone.utc)
                         sleep_time = CHECK_INTERVAL_SECONDS
                         
                         if strategy.last_checked_at is None:
@@ -78,7 +85,7 @@ class StrategyMonitorService:
                             await cls.check_strategy(db, strategy)
                             # Обновляем дату последней проверки
                             strategy.last_checked_at = now
-                            db.commit()
+                            await db.commit()
                             logger.debug(f"Стратегия {strategy_id}: проверка выполнена, следующая через {CHECK_INTERVAL_SECONDS} сек")
                         else:
                             # Проверяем, прошло ли 10 минут с последней проверки
@@ -88,7 +95,7 @@ class StrategyMonitorService:
                                 await cls.check_strategy(db, strategy)
                                 # Обновляем дату последней проверки
                                 strategy.last_checked_at = now
-                                db.commit()
+                                await db.commit()
                                 logger.debug(f"Стратегия {strategy_id}: проверка выполнена, следующая через {CHECK_INTERVAL_SECONDS} сек")
                             else:
                                 # Вычисляем время до следующей проверки
@@ -96,7 +103,7 @@ class StrategyMonitorService:
                                 sleep_time = int(time_until_next.total_seconds())
                                 logger.debug(f"Стратегия {strategy_id}: следующая проверка через {sleep_time} сек")
                     finally:
-                        db.close()
+                        await db.close()
                 except Exception as e:
                     logger.error(f"Ошибка при проверке стратегии {strategy_id}: {e}", exc_info=True)
                 
@@ -138,23 +145,21 @@ class StrategyMonitorService:
             logger.debug(f"Мониторинг стратегии {strategy_id} остановлен")
     
     @staticmethod
-    async def check_strategy(db: Session, strategy: Strategy):
+    async def check_strategy(db: AsyncSession, strategy: Strategy):
         """Проверить конкретную стратегию и создать рекомендацию"""
         
         # Получаем кошельки стратегии
-        wallet_links = db.query(StrategyWallet).filter(
-            StrategyWallet.strategy_id == strategy.id
-        ).all()
+        wallet_links = (await db.scalars(STRATEGY_WALLET_LINKS, {"strategy_id": strategy.id})).all()
         
         if len(wallet_links) == 0:
             logger.debug(f"Стратегия {strategy.id}: нет кошельков для проверки")
             return  # Нет кошельков для проверки
         
         wallet_ids = [sw.wallet_id for sw in wallet_links]
-        wallets = db.query(Wallet).filter(
+        wallets = (await db.scalars(select(Wallet).where(
             Wallet.id.in_(wallet_ids),
             Wallet.user_id == strategy.user_id
-        ).all()
+        ))).all()
         
         if not wallets:
             logger.debug(f"Стратегия {strategy.id}: кошельки не найдены")
@@ -172,6 +177,10 @@ class StrategyMonitorService:
             if chain is None:
                 chain = str(wallet.chain)
         
+        # Завершаем транзакцию чтения до разбора описания и анализа графом:
+        # соединение возвращается в пул на время долгих внешних вызовов
+        await db.commit()
+        
         # Парсим описание стратегии для получения целевого распределения
         strategy_description = str(strategy.description)
         logger.debug(f"Проверка стратегии {strategy.id}: парсинг описания")
@@ -211,7 +220,7 @@ class StrategyMonitorService:
 {recommendation_text}
 
 ---
-*Это автоматическая рекомендация, создана {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC*
+*Это автоматическая рекомендация, создана {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC*
 """
             
             # Создаем рекомендацию в БД
@@ -222,8 +231,8 @@ class StrategyMonitorService:
                 analysis=result  # Сохраняем весь результат анализа
             )
             db.add(recommendation)
-            db.commit()
-            db.refresh(recommendation)
+            await db.commit()
+            invalidate(strategy.user_id, "recommendations")
             
             logger.info(f"✅ Создана рекомендация {recommendation.id} для стратегии {strategy.id} (user_id: {strategy.user_id})")
         else:
@@ -3,11 +3,14 @@
 """
 import uuid
 from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 import logging
 
-from app.db.models import Strategy, Wallet, StrategyWallet
+from app.db.models import Strategy, StrategyWallet
+from app.db.queries import STRATEGY_BY_ID, STRATEGIES_WITH_LINKS, WALLET_BY_ID, STRATEGY_WALLET_LINKS
+from app.utils.response_cache import invalidate
 from app.api.schemas import StrategyCreate, StrategyUpdate, StrategyResponse
 
 logger = logging.getLogger(__name__)
@@ -122,40 +125,30 @@ Return ONLY the JSON object, nothing else."""
             return {"BTC": 40.0, "ETH": 35.0, "USDC": 25.0}
     
     @staticmethod
-    def get_strategies(db: Session, user_id: uuid.UUID) -> List[StrategyResponse]:
+    async def get_strategies(db: AsyncSession, user_id: uuid.UUID) -> List[StrategyResponse]:
         """Получить список всех стратегий пользователя"""
-        strategies = db.query(Strategy).filter(Strategy.user_id == user_id).all()
+        strategies = (await db.scalars(STRATEGIES_WITH_LINKS, {"user_id": user_id})).all()
         result = []
         for s in strategies:
-            wallet_links = db.query(StrategyWallet).filter(StrategyWallet.strategy_id == s.id).all()
-            wallet_ids = [str(sw.wallet_id) for sw in wallet_links]
             result.append(StrategyResponse(
                 id=str(s.id),
                 name=s.name,
                 description=s.description,
-                wallet_ids=wallet_ids,
+                wallet_ids=[str(sw.wallet_id) for sw in s.wallet_links],
                 created_at=s.created_at.isoformat(),
                 updated_at=s.updated_at.isoformat()
             ))
         return result
     
     @staticmethod
-    def get_strategy(db: Session, strategy_id: str, user_id: uuid.UUID) -> StrategyResponse:
+    async def get_strategy(db: AsyncSession, strategy_id: uuid.UUID, user_id: uuid.UUID) -> StrategyResponse:
         """Получить стратегию по ID"""
-        try:
-            strategy_uuid = uuid.UUID(strategy_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        strategy = db.query(Strategy).filter(
-            Strategy.id == strategy_uuid,
-            Strategy.user_id == user_id
-        ).first()
+        strategy = await db.scalar(STRATEGY_BY_ID, {"strategy_id": strategy_id, "user_id": user_id})
         
         if not strategy:
             raise HTTPException(status_code=404, detail="Стратегия не найдена")
         
-        wallet_links = db.query(StrategyWallet).filter(StrategyWallet.strategy_id == strategy.id).all()
+        wallet_links = (await db.scalars(STRATEGY_WALLET_LINKS, {"strategy_id": strategy.id})).all()
         wallet_ids = [str(sw.wallet_id) for sw in wallet_links]
         
         return StrategyResponse(
@@ -169,7 +162,7 @@ Return ONLY the JSON object, nothing else."""
     
     @staticmethod
     async def create_strategy(
-        db: Session,
+        db: AsyncSession,
         strategy: StrategyCreate,
         user_id: uuid.UUID
     ) -> StrategyResponse:
@@ -179,10 +172,7 @@ Return ONLY the JSON object, nothing else."""
         for wallet_id in strategy.wallet_ids:
             try:
                 wallet_uuid = uuid.UUID(wallet_id)
-                wallet = db.query(Wallet).filter(
-                    Wallet.id == wallet_uuid,
-                    Wallet.user_id == user_id
-                ).first()
+                wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_uuid, "user_id": user_id})
                 if not wallet:
                     raise HTTPException(status_code=404, detail=f"Кошелек {wallet_id} не найден")
                 wallet_uuids.append(wallet_uuid)
@@ -196,15 +186,15 @@ Return ONLY the JSON object, nothing else."""
             description=strategy.description,
         )
         db.add(db_strategy)
-        db.commit()
-        db.refresh(db_strategy)
+        await db.commit()
         logger.info(f"Стратегия создана: {db_strategy.id} (name: {strategy.name}, user_id: {user_id})")
         
         # Создаем связи с кошельками
         for wallet_uuid in wallet_uuids:
             link = StrategyWallet(strategy_id=db_strategy.id, wallet_id=wallet_uuid)
             db.add(link)
-        db.commit()
+        await db.commit()
+        invalidate(user_id, "strategies")
         if wallet_uuids:
             logger.debug(f"Стратегия {db_strategy.id} связана с {len(wallet_uuids)} кошельками")
         
@@ -224,41 +214,38 @@ Return ONLY the JSON object, nothing else."""
     
     @staticmethod
     async def update_strategy(
-        db: Session,
-        strategy_id: str,
+        db: AsyncSession,
+        strategy_id: uuid.UUID,
         strategy_update: StrategyUpdate,
         user_id: uuid.UUID
     ) -> StrategyResponse:
         """Обновить стратегию"""
-        try:
-            strategy_uuid = uuid.UUID(strategy_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        strategy = db.query(Strategy).filter(
-            Strategy.id == strategy_uuid,
-            Strategy.user_id == user_id
-        ).first()
+        # Поля стратегии обновляются одним UPDATE ... RETURNING: он же проверяет
+        # существование стратегии и возвращает строку без отдельных SELECT и refresh
+        values = strategy_update.model_dump(include={"name", "description"}, exclude_none=True)
+        if values:
+            strategy = await db.scalar(
+                update(Strategy)
+                .where(Strategy.id == strategy_id, Strategy.user_id == user_id)
+                .values(**values)
+                .returning(Strategy),
+                execution_options={"populate_existing": True}
+            )
+        else:
+            strategy = await db.scalar(STRATEGY_BY_ID, {"strategy_id": strategy_id, "user_id": user_id})
         
         if not strategy:
             raise HTTPException(status_code=404, detail="Стратегия не найдена")
         
-        if strategy_update.name is not None:
-            strategy.name = strategy_update.name
-        if strategy_update.description is not None:
-            strategy.description = strategy_update.description
         if strategy_update.wallet_ids is not None:
             # Удаляем старые связи
-            db.query(StrategyWallet).filter(StrategyWallet.strategy_id == strategy.id).delete()
+            await db.execute(delete(StrategyWallet).where(StrategyWallet.strategy_id == strategy.id))
             # Проверяем и создаем новые связи
             wallet_uuids = []
             for wallet_id in strategy_update.wallet_ids:
                 try:
                     wallet_uuid = uuid.UUID(wallet_id)
-                    wallet = db.query(Wallet).filter(
-                        Wallet.id == wallet_uuid,
-                        Wallet.user_id == user_id
-                    ).first()
+                    wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_uuid, "user_id": user_id})
                     if not wallet:
                         raise HTTPException(status_code=404, detail=f"Кошелек {wallet_id} не найден")
                     wallet_uuids.append(wallet_uuid)
@@ -268,12 +255,13 @@ Return ONLY the JSON object, nothing else."""
             for wallet_uuid in wallet_uuids:
                 link = StrategyWallet(strategy_id=strategy.id, wallet_id=wallet_uuid)
                 db.add(link)
+            wallet_ids = [str(wallet_uuid) for wallet_uuid in wallet_uuids]
+        else:
+            wallet_links = (await db.scalars(STRATEGY_WALLET_LINKS, {"strategy_id": strategy.id})).all()
+            wallet_ids = [str(sw.wallet_id) for sw in wallet_links]
         
-        db.commit()
-        db.refresh(strategy)
-        
-        wallet_links = db.query(StrategyWallet).filter(StrategyWallet.strategy_id == strategy.id).all()
-        wallet_ids = [str(sw.wallet_id) for sw in wallet_links]
+        await db.commit()
+        invalidate(user_id, "strategies")
         
         return StrategyResponse(
             id=str(strategy.id),
@@ -285,25 +273,26 @@ Return ONLY the JSON object, nothing else."""
         )
     
     @staticmethod
-    async def delete_strategy(db: Session, strategy_id: str, user_id: uuid.UUID) -> None:
+    async def delete_strategy(db: AsyncSession, strategy_id: uuid.UUID, user_id: uuid.UUID) -> None:
         """Удалить стратегию"""
-        try:
-            strategy_uuid = uuid.UUID(strategy_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        strategy = db.query(Strategy).filter(
-            Strategy.id == strategy_uuid,
-            Strategy.user_id == user_id
-        ).first()
+        # Один DELETE без загрузки связей и рекомендаций в сессию:
+        # их удаляет ON DELETE CASCADE в БД, у сообщений чата strategy_id
+        # становится NULL
+        deleted = await db.scalar(
+            delete(Strategy)
+            .where(Strategy.id == strategy_id, Strategy.user_id == user_id)
+            .returning(Strategy.id)
+            .execution_options(synchronize_session=False)
+        )
         
-        if not strategy:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Стратегия не найдена")
         
         # Останавливаем мониторинг стратегии
         from app.services.strategy_monitor_service import StrategyMonitorService
-        await StrategyMonitorService.remove_strategy_monitoring(strategy_uuid)
+        await StrategyMonitorService.remove_strategy_monitoring(strategy_id)
         
-        db.delete(strategy)
-        db.commit()
+        await db.commit()
+        # Рекомендации стратегии удаляются каскадно
+        invalidate(user_id, "strategies", "recommendations")
 
@@ -0,0 +1,116 @@
+"""
+Сервис фоновых задач для долгих вызовов LLM и графа анализа
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from app.api.schemas import TaskResponse
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранится результат завершенной задачи (1 час)
+TASK_RESULT_TTL_SECONDS = 3600
+
+# Задача получает собственную сессию БД, а не сессию запроса
+TaskFunc = Callable[[AsyncSession], Awaitable[BaseModel]]
+
+
+class TaskService:
+    """
+    Выполнение задач в фоне процесса приложения
+    
+    Запрос возвращает task_id сразу, а соединение с БД, взятое запросом,
+    освобождается, не дожидаясь многосекундного ответа LLM. Результат
+    забирается по task_id; сообщения чата дополнительно приходят подписчикам
+    SSE /api/chat/new-messages/stream.
+    """
+    
+    # task_id -> состояние задачи
+    _tasks: Dict[str, Dict[str, Any]] = {}
+    # Ссылки на выполняющиеся задачи, чтобы их не собрал сборщик мусора
+    _running: Dict[str, asyncio.Task] = {}
+    
+    @classmethod
+    def submit(cls, user_id: uuid.UUID, kind: str, func: TaskFunc) -> TaskResponse:
+        """Ставит задачу в очередь и возвращает ее начальное состояние"""
+        cls._prune()
+        task_id = str(uuid.uuid4())
+        cls._tasks[task_id] = {
+            "user_id": user_id,
+            "kind": kind,
+            "status": "pending",
+            "result": None,
+            "error": None,
+            "finished_at": None,
+        }
+        cls._running[task_id] = asyncio.create_task(cls._run(task_id, func))
+        logger.info(f"Фоновая задача {kind} {task_id} поставлена для пользователя {user_id}")
+        return cls._to_response(task_id)
+    
+    @classmethod
+    def get_task(cls, task_id: str, user_id: uuid.UUID, kind: str) -> TaskResponse:
+        """Получить состояние задачи пользователя по ID"""
+        state = cls._tasks.get(task_id)
+        if not state or state["user_id"] != user_id or state["kind"] != kind:
+            raise HTTPException(status_code=404, detail="Задача не найдена")
+        return cls._to_response(task_id)
+    
+    @classmethod
+    async def shutdown(cls) -> None:
+        """Отменяет незавершенные задачи при остановке приложения"""
+        tasks = list(cls._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    @classmethod
+    async def _run(cls, task_id: str, func: TaskFunc) -> None:
+        from app.db import get_session_local
+        state = cls._tasks[task_id]
+        state["status"] = "running"
+        try:
+            async with get_session_local()() as db:
+                result = await func(db)
+            state["result"] = result.model_dump()
+            state["status"] = "done"
+        except HTTPException as e:
+            state["error"] = {"status_code": e.status_code, "detail": e.detail}
+            state["status"] = "error"
+        except asyncio.CancelledError:
+            state["error"] = {"status_code": 503, "detail": "Задача отменена"}
+            state["status"] = "error"
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка фоновой задачи {state['kind']} {task_id}: {e}", exc_info=True)
+            state["error"] = {"status_code": 500, "detail": str(e)}
+            state["status"] = "error"
+        finally:
+            state["finished_at"] = time.monotonic()
+            cls._running.pop(task_id, None)
+    
+    @classmethod
+    def _prune(cls) -> None:
+        """Удаляет результаты задач, завершившихся раньше TTL"""
+        deadline = time.monotonic() - TASK_RESULT_TTL_SECONDS
+        expired = [
+            task_id for task_id, state in cls._tasks.items()
+            if state["finished_at"] is not None and state["finished_at"] < deadline
+        ]
+        for task_id in expired:
+            del cls._tasks[task_id]
+    
+    @classmethod
+    def _to_response(cls, task_id: str) -> TaskResponse:
+        state = cls._tasks[task_id]
+        return TaskResponse(
+            task_id=task_id,
+            status=state["status"],
+            result=state["result"],
+            error=state["error"]
+        )
@@ -2,176 +2,191 @@
 Сервис для работы с балансами токенов в кошельках
 """
 import uuid
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Union
+from sqlalchemy import Row, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
-from app.db.models import WalletTokenBalance, Wallet
+from app.db.models import Wallet, WalletTokenBalance
+from app.db.queries import TOKEN_BALANCE_BY_ID
+from app.utils.response_cache import invalidate
 from app.api.schemas import (
     WalletTokenBalanceCreate,
     WalletTokenBalanceUpdate,
-    WalletTokenBalanceResponse
+    WalletTokenBalanceResponse,
+    TokenBalanceTotalResponse
 )
 
 
+def _format_decimal(value: Decimal) -> str:
+    """NUMERIC -> строка без экспоненты и хвостовых нулей ("0", "1.5", "0.000000123")"""
+    return format(value.normalize(), "f")
+
+
 class TokenBalanceService:
     """Сервис для управления балансами токенов"""
     
     @staticmethod
-    def get_balances(
-        db: Session,
+    def _to_response(balance: Union[WalletTokenBalance, Row]) -> WalletTokenBalanceResponse:
+        """Преобразует запись БД или строку Core в модель ответа (NUMERIC -> str/float)"""
+        return WalletTokenBalanceResponse(
+            id=str(balance.id),
+            wallet_id=str(balance.wallet_id),
+            user_id=str(balance.user_id),
+            token_symbol=balance.token_symbol,
+            balance=_format_decimal(balance.balance),
+            balance_usd=float(balance.balance_usd) if balance.balance_usd is not None else None,
+            chain=balance.chain,
+            created_at=balance.created_at.isoformat(),
+            updated_at=balance.updated_at.isoformat()
+        )
+    
+    @staticmethod
+    async def get_balances(
+        db: AsyncSession,
         user_id: uuid.UUID,
-        wallet_id: Optional[str] = None
+        wallet_id: Optional[uuid.UUID] = None
     ) -> List[WalletTokenBalanceResponse]:
         """Получить список балансов токенов пользователя"""
-        query = db.query(WalletTokenBalance).filter(WalletTokenBalance.user_id == user_id)
+        # Список только читается: строки Core с колонками таблицы вместо
+        # ORM-объектов (без identity map и отслеживания состояния)
+        query = select(*WalletTokenBalance.__table__.columns).where(WalletTokenBalance.user_id == user_id)
         
         if wallet_id:
-            try:
-                wallet_uuid = uuid.UUID(wallet_id)
-                query = query.filter(WalletTokenBalance.wallet_id == wallet_uuid)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Неверный формат ID кошелька")
+            query = query.where(WalletTokenBalance.wallet_id == wallet_id)
         
-        balances = query.all()
+        balances = (await db.execute(query)).all()
         
         return [
-            WalletTokenBalanceResponse(
-                id=str(b.id),
-                wallet_id=str(b.wallet_id),
-                user_id=str(b.user_id),
-                token_symbol=b.token_symbol,
-                balance=b.balance,
-                balance_usd=b.balance_usd,
-                chain=b.chain,
-                created_at=b.created_at.isoformat(),
-                updated_at=b.updated_at.isoformat()
-            )
+            TokenBalanceService._to_response(b)
             for b in balances
         ]
     
     @staticmethod
-    def get_balance(
-        db: Session,
-        balance_id: str,
+    async def get_totals(
+        db: AsyncSession,
+        user_id: uuid.UUID,
+        wallet_id: Optional[uuid.UUID] = None
+    ) -> List[TokenBalanceTotalResponse]:
+        """
+        Суммарные балансы пользователя по токенам
+        
+        Суммирование NUMERIC выполняет PostgreSQL (GROUP BY token_symbol):
+        в приложение приходит по строке на токен, а не все записи балансов.
+        """
+        query = (
+            select(
+                WalletTokenBalance.token_symbol,
+                func.sum(WalletTokenBalance.balance),
+                func.sum(WalletTokenBalance.balance_usd),
+            )
+            .where(WalletTokenBalance.user_id == user_id)
+            .group_by(WalletTokenBalance.token_symbol)
+            .order_by(WalletTokenBalance.token_symbol)
+        )
+        if wallet_id:
+            query = query.where(WalletTokenBalance.wallet_id == wallet_id)
+        
+        rows = (await db.execute(query)).all()
+        
+        return [
+            TokenBalanceTotalResponse(
+                token_symbol=token_symbol,
+                balance=_format_decimal(balance),
+                balance_usd=float(balance_usd) if balance_usd is not None else None
+            )
+            for token_symbol, balance, balance_usd in rows
+        ]
+    
+    @staticmethod
+    async def get_balance(
+        db: AsyncSession,
+        balance_id: uuid.UUID,
         user_id: uuid.UUID
     ) -> WalletTokenBalanceResponse:
         """Получить баланс токена по ID"""
-        try:
-            balance_uuid = uuid.UUID(balance_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        balance = db.query(WalletTokenBalance).filter(
-            WalletTokenBalance.id == balance_uuid,
-            WalletTokenBalance.user_id == user_id
-        ).first()
+        balance = await db.scalar(TOKEN_BALANCE_BY_ID, {"balance_id": balance_id, "user_id": user_id})
         
         if not balance:
             raise HTTPException(status_code=404, detail="Баланс токена не найден")
         
-        return WalletTokenBalanceResponse(
-            id=str(balance.id),
-            wallet_id=str(balance.wallet_id),
-            user_id=str(balance.user_id),
-            token_symbol=balance.token_symbol,
-            balance=balance.balance,
-            balance_usd=balance.balance_usd,
-            chain=balance.chain,
-            created_at=balance.created_at.isoformat(),
-            updated_at=balance.updated_at.isoformat()
-        )
+        return TokenBalanceService._to_response(balance)
     
     @staticmethod
-    def create_balance(
-        db: Session,
+    async def create_balance(
+        db: AsyncSession,
         balance: WalletTokenBalanceCreate,
         user_id: uuid.UUID
     ) -> WalletTokenBalanceResponse:
         """Создать или обновить запись о балансе токена"""
-        try:
-            wallet_uuid = uuid.UUID(balance.wallet_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID кошелька")
-        
-        # Проверяем, что кошелек принадлежит пользователю
-        wallet = db.query(Wallet).filter(
-            Wallet.id == wallet_uuid,
+        return (await TokenBalanceService.upsert_balances(db, [balance], user_id))[0]
+    
+    @staticmethod
+    async def upsert_balances(
+        db: AsyncSession,
+        balances: List[WalletTokenBalanceCreate],
+        user_id: uuid.UUID
+    ) -> List[WalletTokenBalanceResponse]:
+        """
+        Создать или обновить пачку записей о балансах токенов
+        
+        Все записи пишутся одним INSERT ... ON CONFLICT (wallet_id, token_symbol)
+        DO UPDATE и одним commit. Если пара кошелек/токен встречается в пачке
+        несколько раз, сохраняется последнее значение.
+        """
+        rows: Dict[Tuple[uuid.UUID, str], dict] = {}
+        for balance in balances:
+            try:
+                wallet_uuid = uuid.UUID(balance.wallet_id)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Неверный формат ID кошелька")
+            rows[(wallet_uuid, balance.token_symbol)] = {
+                "wallet_id": wallet_uuid,
+                "user_id": user_id,
+                "token_symbol": balance.token_symbol,
+                "balance": balance.balance,
+                "balance_usd": balance.balance_usd,
+                "chain": balance.chain,
+            }
+        if not rows:
+            return []
+        
+        # Проверяем, что все кошельки принадлежат пользователю (один запрос)
+        wallet_uuids = {wallet_uuid for wallet_uuid, _ in rows}
+        owned = set((await db.scalars(select(Wallet.id).where(
+            Wallet.id.in_(wallet_uuids),
             Wallet.user_id == user_id
-        ).first()
-        
-        if not wallet:
+        ))).all())
+        if owned != wallet_uuids:
             raise HTTPException(status_code=404, detail="Кошелек не найден")
         
-        # Проверяем, существует ли уже запись для этого кошелька и токена
-        existing = db.query(WalletTokenBalance).filter(
-            WalletTokenBalance.wallet_id == wallet_uuid,
-            WalletTokenBalance.token_symbol == balance.token_symbol,
-            WalletTokenBalance.user_id == user_id
-        ).first()
-        
-        if existing:
-            # Обновляем существующую запись
-            existing.balance = balance.balance
-            existing.balance_usd = balance.balance_usd
-            existing.chain = balance.chain
-            db.commit()
-            db.refresh(existing)
-            
-            return WalletTokenBalanceResponse(
-                id=str(existing.id),
-                wallet_id=str(existing.wallet_id),
-                user_id=str(existing.user_id),
-                token_symbol=existing.token_symbol,
-                balance=existing.balance,
-                balance_usd=existing.balance_usd,
-                chain=existing.chain,
-                created_at=existing.created_at.isoformat(),
-                updated_at=existing.updated_at.isoformat()
-            )
-        else:
-            # Создаем новую запись
-            db_balance = WalletTokenBalance(
-                wallet_id=wallet_uuid,
-                user_id=user_id,
-                token_symbol=balance.token_symbol,
-                balance=balance.balance,
-                balance_usd=balance.balance_usd,
-                chain=balance.chain
-            )
-            db.add(db_balance)
-            db.commit()
-            db.refresh(db_balance)
-            
-            return WalletTokenBalanceResponse(
-                id=str(db_balance.id),
-                wallet_id=str(db_balance.wallet_id),
-                user_id=str(db_balance.user_id),
-                token_symbol=db_balance.token_symbol,
-                balance=db_balance.balance,
-                balance_usd=db_balance.balance_usd,
-                chain=db_balance.chain,
-                created_at=db_balance.created_at.isoformat(),
-                updated_at=db_balance.updated_at.isoformat()
-            )
+        # updated_at при обновлении выставляет триггер trg_wtb_touch
+        stmt = insert(WalletTokenBalance).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WalletTokenBalance.wallet_id, WalletTokenBalance.token_symbol],
+            set_={
+                "balance": stmt.excluded.balance,
+                "balance_usd": stmt.excluded.balance_usd,
+                "chain": stmt.excluded.chain,
+            },
+        ).returning(WalletTokenBalance)
+        saved = (await db.scalars(stmt, execution_options={"populate_existing": True})).all()
+        await db.commit()
+        invalidate(user_id, "token_balances")
+        
+        return [TokenBalanceService._to_response(b) for b in saved]
     
     @staticmethod
-    def update_balance(
-        db: Session,
-        balance_id: str,
+    async def update_balance(
+        db: AsyncSession,
+        balance_id: uuid.UUID,
         balance_update: WalletTokenBalanceUpdate,
         user_id: uuid.UUID
     ) -> WalletTokenBalanceResponse:
         """Обновить баланс токена"""
-        try:
-            balance_uuid = uuid.UUID(balance_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        balance = db.query(WalletTokenBalance).filter(
-            WalletTokenBalance.id == balance_uuid,
-            WalletTokenBalance.user_id == user_id
-        ).first()
+        balance = await db.scalar(TOKEN_BALANCE_BY_ID, {"balance_id": balance_id, "user_id": user_id})
         
         if not balance:
             raise HTTPException(status_code=404, detail="Баланс токена не найден")
@@ -181,37 +196,24 @@ class TokenBalanceService:
         if balance_update.balance_usd is not None:
             balance.balance_usd = balance_update.balance_usd
         
-        db.commit()
-        db.refresh(balance)
+        await db.commit()
+        invalidate(user_id, "token_balances")
         
-        return WalletTokenBalanceResponse(
-            id=str(balance.id),
-            wallet_id=str(balance.wallet_id),
-            user_id=str(balance.user_id),
-            token_symbol=balance.token_symbol,
-            balance=balance.balance,
-            balance_usd=balance.balance_usd,
-            chain=balance.chain,
-            created_at=balance.created_at.isoformat(),
-            updated_at=balance.updated_at.isoformat()
-        )
+        return TokenBalanceService._to_response(balance)
     
     @staticmethod
-    def delete_balance(db: Session, balance_id: str, user_id: uuid.UUID) -> None:
+    async def delete_balance(db: AsyncSession, balance_id: uuid.UUID, user_id: uuid.UUID) -> None:
         """Удалить запись о балансе токена"""
-        try:
-            balance_uuid = uuid.UUID(balance_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        balance = db.query(WalletTokenBalance).filter(
-            WalletTokenBalance.id == balance_uuid,
-            WalletTokenBalance.user_id == user_id
-        ).first()
+        deleted = await db.scalar(
+            delete(WalletTokenBalance)
+            .where(WalletTokenBalance.id == balance_id, WalletTokenBalance.user_id == user_id)
+            .returning(WalletTokenBalance.id)
+            .execution_options(synchronize_session=False)
+        )
         
-        if not balance:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Баланс токена не найден")
         
-        db.delete(balance)
-        db.commit()
+        await db.commit()
+        invalidate(user_id, "token_balances")
 
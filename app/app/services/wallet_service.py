@@ -3,10 +3,14 @@
 """
 import uuid
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 from fastapi import HTTPException
 
 from app.db.models import Wallet
+from app.db.queries import WALLET_BY_ID
+from app.utils.response_cache import invalidate
 from app.api.schemas import WalletCreate, WalletUpdate, WalletResponse
 import logging
 
@@ -16,9 +20,11 @@ class WalletService:
     """Сервис для управления кошельками"""
     
     @staticmethod
-    def get_wallets(db: Session, user_id: uuid.UUID) -> List[WalletResponse]:
+    async def get_wallets(db: AsyncSession, user_id: uuid.UUID) -> List[WalletResponse]:
         """Получить список всех кошельков пользователя"""
-        wallets = db.query(Wallet).filter(Wallet.user_id == user_id).all()
+        wallets = (await db.scalars(
+            select(Wallet).where(Wallet.user_id == user_id).options(raiseload("*"))
+        )).all()
         return [
             WalletResponse(
                 id=str(w.id),
@@ -33,22 +39,13 @@ class WalletService:
         ]
     
     @staticmethod
-    def get_wallet(db: Session, wallet_id: str, user_id: uuid.UUID) -> WalletResponse:
+    async def get_wallet(db: AsyncSession, wallet_id: uuid.UUID, user_id: uuid.UUID) -> WalletResponse:
         """Получить кошелек по ID"""
-        try:
-            wallet_uuid = uuid.UUID(wallet_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        wallet = db.query(Wallet).filter(
-            Wallet.id == wallet_uuid,
-            Wallet.user_id == user_id
-        ).first()
+        wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_id, "user_id": user_id})
         
         if not wallet:
             raise HTTPException(status_code=404, detail="Кошелек не найден")
-        logger.info("Wallet: %s", wallet)
-        wr = WalletResponse(
+        return WalletResponse(
             id=str(wallet.id),
             address=wallet.address,
             chain=wallet.chain,
@@ -57,18 +54,16 @@ class WalletService:
             created_at=wallet.created_at.isoformat(),
             updated_at=wallet.updated_at.isoformat()
         )
-        logger.info("WalletResponse: %s", wr)
-        return wr
     
     @staticmethod
-    def create_wallet(db: Session, wallet: WalletCreate, user_id: uuid.UUID) -> WalletResponse:
+    async def create_wallet(db: AsyncSession, wallet: WalletCreate, user_id: uuid.UUID) -> WalletResponse:
         """Создать новый кошелек"""
-        logger.info("Creating wallet: %s", wallet)
+        logger.debug("Creating wallet address=%s chain=%s", wallet.address, wallet.chain)
         # Проверяем, не существует ли уже кошелек с таким адресом у этого пользователя
-        existing = db.query(Wallet).filter(
+        existing = await db.scalar(select(Wallet).where(
             Wallet.address == wallet.address,
             Wallet.user_id == user_id
-        ).first()
+        ).limit(1))
         
         if existing:
             raise HTTPException(status_code=400, detail="Кошелек с таким адресом уже существует")
@@ -81,8 +76,8 @@ class WalletService:
             tokens=wallet.tokens or []
         )
         db.add(db_wallet)
-        db.commit()
-        db.refresh(db_wallet)
+        await db.commit()
+        invalidate(user_id, "wallets")
         
         return WalletResponse(
             id=str(db_wallet.id),
@@ -95,22 +90,14 @@ class WalletService:
         )
     
     @staticmethod
-    def update_wallet(
-        db: Session, 
-        wallet_id: str, 
+    async def update_wallet(
+        db: AsyncSession, 
+        wallet_id: uuid.UUID, 
         wallet_update: WalletUpdate, 
         user_id: uuid.UUID
     ) -> WalletResponse:
         """Обновить кошелек"""
-        try:
-            wallet_uuid = uuid.UUID(wallet_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        wallet = db.query(Wallet).filter(
-            Wallet.id == wallet_uuid,
-            Wallet.user_id == user_id
-        ).first()
+        wallet = await db.scalar(WALLET_BY_ID, {"wallet_id": wallet_id, "user_id": user_id})
         
         if not wallet:
             raise HTTPException(status_code=404, detail="Кошелек не найден")
@@ -122,8 +109,8 @@ class WalletService:
         if wallet_update.tokens is not None:
             wallet.tokens = wallet_update.tokens
         
-        db.commit()
-        db.refresh(wallet)
+        await db.commit()
+        invalidate(user_id, "wallets")
         
         return WalletResponse(
             id=str(wallet.id),
@@ -136,21 +123,21 @@ class WalletService:
         )
     
     @staticmethod
-    def delete_wallet(db: Session, wallet_id: str, user_id: uuid.UUID) -> None:
+    async def delete_wallet(db: AsyncSession, wallet_id: uuid.UUID, user_id: uuid.UUID) -> None:
         """Удалить кошелек"""
-        try:
-            wallet_uuid = uuid.UUID(wallet_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Неверный формат ID")
-        
-        wallet = db.query(Wallet).filter(
-            Wallet.id == wallet_uuid,
-            Wallet.user_id == user_id
-        ).first()
+        # Один DELETE без загрузки кошелька и его дочерних строк в сессию:
+        # балансы и связи со стратегиями удаляет ON DELETE CASCADE в БД
+        deleted = await db.scalar(
+            delete(Wallet)
+            .where(Wallet.id == wallet_id, Wallet.user_id == user_id)
+            .returning(Wallet.id)
+            .execution_options(synchronize_session=False)
+        )
         
-        if not wallet:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Кошелек не найден")
         
-        db.delete(wallet)
-        db.commit()
+        await db.commit()
+        # Вместе с кошельком удаляются его балансы и связи со стратегиями
+        invalidate(user_id, "wallets", "token_balances", "strategies")
 
@@ -1,9 +1,25 @@
+import asyncio
 import os
 import traceback
 from typing import List, Optional, Dict, Any
 
+import orjson
 from spoon_ai.tools.base import BaseTool
-import requests
+
+from app.utils.http import get_http_client
+
+# Max requests per JSON-RPC batch (public nodes reject larger batches)
+RPC_BATCH_SIZE = 100
+
+
+def get_rpc_endpoint(chain_id: int) -> Optional[str]:
+    """
+    JSON-RPC endpoint for batched native balance lookups, from RPC_URL_<chain_id>
+
+    There is no default: wallet addresses are only sent to a node the operator
+    configured, otherwise balances are fetched from Chainbase per address.
+    """
+    return os.getenv(f"RPC_URL_{chain_id}") or None
 
 
 class GetLatestBlockNumberTool(BaseTool):
@@ -30,9 +46,9 @@ class GetLatestBlockNumberTool(BaseTool):
             headers = {"x-api-key": api_key}
             querystring = {"chain_id": int(chain_id)}
             
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -65,9 +81,9 @@ class GetBlockByNumberTool(BaseTool):
             headers = {"x-api-key": api_key}
             querystring = {"chain_id": int(chain_id), "number": int(number)}
             
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -121,9 +137,9 @@ class GetTransactionByHashTool(BaseTool):
             if tx_index:
                 querystring["tx_index"] = int(tx_index)
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -194,9 +210,9 @@ class GetAccountTransactionsTool(BaseTool):
             if end_timestamp:
                 querystring["end_timestamp"] = end_timestamp
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -265,9 +281,9 @@ class ContractCallTool(BaseTool):
                 "to_block": to_block
             }
             
-            response = requests.request("POST", url, json=payload, headers=headers)
+            response = await get_http_client().post(url, json=payload, headers=headers)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -322,9 +338,9 @@ class GetAccountTokensTool(BaseTool):
             if contract_address:
                 querystring["contract_address"] = contract_address
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -379,9 +395,9 @@ class GetAccountNFTsTool(BaseTool):
             if contract_address:
                 querystring["contract_address"] = contract_address
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -426,12 +442,58 @@ class GetAccountBalanceTool(BaseTool):
             if to_block:
                 querystring["to_block"] = to_block
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
+    async def execute_batch(self, chain_id: int = 1, addresses: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Native balances of several addresses via JSON-RPC batches of eth_getBalance
+
+        Chainbase has no multi-address balance endpoint, so the lookups go to the
+        chain's JSON-RPC node: one HTTP round trip per RPC_BATCH_SIZE addresses
+        instead of one per address. Items are in the order of `addresses` and have
+        the shape of execute(): {"code": 0, "data": "0x..."} or {"error": ...}.
+        Raises NotImplementedError if RPC_URL_<chain_id> is not configured for the
+        chain and ValueError if the node does not accept batches.
+        """
+        rpc_url = get_rpc_endpoint(int(chain_id))
+        if rpc_url is None:
+            raise NotImplementedError(f"No JSON-RPC endpoint for chain_id {chain_id}")
+
+        addresses = list(addresses or [])
+        chunks = [addresses[i:i + RPC_BATCH_SIZE] for i in range(0, len(addresses), RPC_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._get_balances_rpc(rpc_url, chunk) for chunk in chunks))
+        return [item for chunk_results in results for item in chunk_results]
+
+    @staticmethod
+    async def _get_balances_rpc(rpc_url: str, addresses: List[str]) -> List[Dict[str, Any]]:
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_getBalance", "params": [address, "latest"]}
+            for i, address in enumerate(addresses)
+        ]
+        response = await get_http_client().post(rpc_url, json=payload)
+        response.raise_for_status()
+        replies = orjson.loads(response.content)
+        # A node without batch support answers with a single error object
+        if not isinstance(replies, list):
+            raise ValueError(f"JSON-RPC batch rejected: {replies}")
+
+        # Batch responses may come back in any order
+        by_id = {reply.get("id"): reply for reply in replies if isinstance(reply, dict)}
+        results = []
+        for i in range(len(addresses)):
+            reply = by_id.get(i)
+            if reply is None:
+                results.append({"error": "No JSON-RPC response"})
+            elif "error" in reply:
+                results.append({"error": str(reply["error"])})
+            else:
+                results.append({"code": 0, "message": "ok", "data": reply.get("result")})
+        return results
+
 
 class GetTokenMetadataTool(BaseTool):
     name: str = "get_token_metadata"
@@ -466,9 +528,9 @@ class GetTokenMetadataTool(BaseTool):
             
             querystring = {"chain_id": int(chain_id), "contract_address": contract_address}
                 
-            response = requests.request("GET", url, headers=headers, params=querystring)
+            response = await get_http_client().get(url, headers=headers, params=querystring)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
@@ -498,8 +560,6 @@ async def test_get_account_balance():
 
 
 if __name__ == '__main__':
-    import asyncio
-
     async def run_all_tests():
         await test_get_latest_block_number()
         await test_get_account_tokens()
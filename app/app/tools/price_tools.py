@@ -0,0 +1,70 @@
+"""
+Price tools with in-process caching
+"""
+import asyncio
+from typing import List
+
+from spoon_ai.tools.base import BaseTool, ToolResult
+from spoon_toolkits.crypto.crypto_data_tools.price_data import GetTokenPriceTool
+
+from app.utils.price_cache import price_cache
+
+
+class CachedGetTokenPriceTool(GetTokenPriceTool):
+    """get_token_price with a short TTL cache in front of the DEX provider"""
+
+    async def execute(self, symbol: str, exchange: str = "uniswap") -> ToolResult:
+        key = (symbol.strip().upper(), exchange.lower())
+        return await price_cache.get_or_fetch(
+            key,
+            lambda: super(CachedGetTokenPriceTool, self).execute(symbol=symbol, exchange=exchange),
+            cache_if=lambda result: not getattr(result, "error", None),
+        )
+
+
+# Shared instance for batch lookups; the tool keeps no per-call state
+_price_tool = CachedGetTokenPriceTool()
+
+
+class BatchGetTokenPricesTool(BaseTool):
+    """Fetch prices for several trading pairs in one tool call"""
+    name: str = "get_token_prices_batch"
+    description: str = (
+        "Get current prices for several token pairs at once. "
+        "Pass all symbols in one call instead of calling get_token_price per token."
+    )
+    parameters: dict = {
+        "type": "object",
+        "properties": {
+            "symbols": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Trading pair symbols in 'TOKEN-USDT' format (e.g., ['ETH-USDT', 'WBTC-USDT'])"
+            },
+            "exchange": {
+                "type": "string",
+                "description": "Exchange name (default is 'uniswap')",
+                "enum": ["uniswap"]
+            }
+        },
+        "required": ["symbols"]
+    }
+
+    async def execute(self, symbols: List[str], exchange: str = "uniswap") -> ToolResult:
+        # The DEX provider has no multi-symbol endpoint, so the lookups are
+        # fanned out concurrently through the cached single-symbol tool
+        unique_symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+        results = await asyncio.gather(
+            *(_price_tool.execute(symbol=symbol, exchange=exchange) for symbol in unique_symbols),
+            return_exceptions=True,
+        )
+
+        prices = {}
+        for symbol, result in zip(unique_symbols, results):
+            if isinstance(result, Exception):
+                prices[symbol] = {"error": str(result)}
+            elif result.error:
+                prices[symbol] = {"error": result.error}
+            else:
+                prices[symbol] = result.output
+        return ToolResult(output=prices)
@@ -280,35 +280,34 @@ class GetStrategiesTool(BaseTool):
     async def execute(self, search_query: Optional[str] = None, **kwargs) -> str:
         """Gets list of strategies"""
         try:
-            from app.db import get_db, get_user_id
-            from app.db.models import Strategy, StrategyWallet
-            from sqlalchemy.orm import Session
+            from app.db import USER_1_ID, get_session_local
+            from app.db.models import Strategy
+            from sqlalchemy import select
+            from sqlalchemy.orm import selectinload
             
             # Get user ID and database session
-            user_id = get_user_id()
-            db: Session = next(get_db())
+            user_id = USER_1_ID
+            db = get_session_local()()
             
             try:
-                # Query strategies
-                query = db.query(Strategy).filter(Strategy.user_id == user_id)
+                # Query strategies; wallet links for all of them come in one extra IN query
+                query = select(Strategy).where(Strategy.user_id == user_id).options(
+                    selectinload(Strategy.wallet_links)
+                )
                 
                 # Apply search filter if provided
                 if search_query:
                     search_pattern = f"%{search_query}%"
-                    query = query.filter(
+                    query = query.where(
                         (Strategy.name.ilike(search_pattern)) |
                         (Strategy.description.ilike(search_pattern))
                     )
                 
-                strategies = query.all()
+                strategies = (await db.scalars(query)).all()
                 
                 result = []
                 for strategy in strategies:
-                    # Get wallets for this strategy
-                    wallet_links = db.query(StrategyWallet).filter(
-                        StrategyWallet.strategy_id == strategy.id
-                    ).all()
-                    wallet_ids = [str(sw.wallet_id) for sw in wallet_links]
+                    wallet_ids = [str(sw.wallet_id) for sw in strategy.wallet_links]
                     
                     result.append({
                         "id": str(strategy.id),
@@ -322,7 +321,7 @@ class GetStrategiesTool(BaseTool):
                 logger.debug(f"Retrieved {len(result)} strategies for user {user_id}")
                 return json.dumps({"strategies": result, "count": len(result)}, ensure_ascii=False, indent=2)
             finally:
-                db.close()
+                await db.close()
                 
         except Exception as e:
             logger.error(f"Error getting strategies: {e}", exc_info=True)
@@ -347,13 +346,13 @@ class GetStrategyDetailsTool(BaseTool):
     async def execute(self, strategy_id: str, **kwargs) -> str:
         """Gets strategy details"""
         try:
-            from app.db import get_db, get_user_id
+            from app.db import USER_1_ID, get_session_local
             from app.db.models import Strategy, StrategyWallet, Wallet
-            from sqlalchemy.orm import Session
+            from sqlalchemy import select
             
             # Get user ID and database session
-            user_id = get_user_id()
-            db: Session = next(get_db())
+            user_id = USER_1_ID
+            db = get_session_local()()
             
             try:
                 # Parse strategy ID
@@ -363,25 +362,25 @@ class GetStrategyDetailsTool(BaseTool):
                     return json.dumps({"error": "Invalid strategy ID format"}, ensure_ascii=False)
                 
                 # Get strategy
-                strategy = db.query(Strategy).filter(
+                strategy = await db.scalar(select(Strategy).where(
                     Strategy.id == strategy_uuid,
                     Strategy.user_id == user_id
-                ).first()
+                ))
                 
                 if not strategy:
                     return json.dumps({"error": "Strategy not found"}, ensure_ascii=False)
                 
                 # Get wallets for this strategy
-                wallet_links = db.query(StrategyWallet).filter(
+                wallet_links = (await db.scalars(select(StrategyWallet).where(
                     StrategyWallet.strategy_id == strategy.id
-                ).all()
+                ))).all()
                 
                 wallets_info = []
                 for wallet_link in wallet_links:
-                    wallet = db.query(Wallet).filter(
+                    wallet = await db.scalar(select(Wallet).where(
                         Wallet.id == wallet_link.wallet_id,
                         Wallet.user_id == user_id
-                    ).first()
+                    ))
                     if wallet:
                         wallet_label = str(wallet.label) if wallet.label is not None else None
                         wallet_tokens = wallet.tokens if wallet.tokens is not None else []
@@ -405,7 +404,7 @@ class GetStrategyDetailsTool(BaseTool):
                 logger.debug(f"Retrieved strategy details: {strategy_id} for user {user_id}")
                 return json.dumps(result, ensure_ascii=False, indent=2)
             finally:
-                db.close()
+                await db.close()
                 
         except Exception as e:
             logger.error(f"Error getting strategy details for {strategy_id}: {e}", exc_info=True)
@@ -430,22 +429,22 @@ class FindStrategyTool(BaseTool):
     async def execute(self, query: str, **kwargs) -> str:
         """Finds strategy by search query"""
         try:
-            from app.db import get_db, get_user_id
+            from app.db import USER_1_ID, get_session_local
             from app.db.models import Strategy
-            from sqlalchemy.orm import Session
+            from sqlalchemy import select
             
             # Get user ID and database session
-            user_id = get_user_id()
-            db: Session = next(get_db())
+            user_id = USER_1_ID
+            db = get_session_local()()
             
             try:
                 # Search in name and description
                 search_pattern = f"%{query}%"
-                strategies = db.query(Strategy).filter(
+                strategies = (await db.scalars(select(Strategy).where(
                     Strategy.user_id == user_id,
                     (Strategy.name.ilike(search_pattern)) |
                     (Strategy.description.ilike(search_pattern))
-                ).all()
+                ))).all()
                 
                 if not strategies:
                     return json.dumps({"message": "No strategies found", "strategies": []}, ensure_ascii=False, indent=2)
@@ -462,7 +461,7 @@ class FindStrategyTool(BaseTool):
                 logger.debug(f"Found {len(result)} strategies matching query '{query}' for user {user_id}")
                 return json.dumps({"strategies": result, "count": len(result)}, ensure_ascii=False, indent=2)
             finally:
-                db.close()
+                await db.close()
                 
         except Exception as e:
             logger.error(f"Error finding strategy with query '{query}': {e}", exc_info=True)
@@ -496,15 +495,15 @@ class CreateStrategyTool(BaseTool):
     async def execute(self, description: str, name: Optional[str] = None, wallet_ids: Optional[List[str]] = None, **kwargs) -> str:
         """Creates a new strategy"""
         try:
-            from app.db import get_db, get_user_id
+            from app.db import USER_1_ID, get_session_local
             from app.services.strategy_service import StrategyService
             from app.api.schemas import StrategyCreate
-            from sqlalchemy.orm import Session
+            from sqlalchemy import select
             from datetime import datetime
             
             # Get user ID and database session
-            user_id = get_user_id()
-            db: Session = next(get_db())
+            user_id = USER_1_ID
+            db = get_session_local()()
             
             try:
                 # Generate name if not provided
@@ -518,10 +517,10 @@ class CreateStrategyTool(BaseTool):
                     for wallet_id in wallet_ids:
                         try:
                             wallet_uuid = uuid.UUID(wallet_id)
-                            wallet = db.query(Wallet).filter(
+                            wallet = await db.scalar(select(Wallet).where(
                                 Wallet.id == wallet_uuid,
                                 Wallet.user_id == user_id
-                            ).first()
+                            ))
                             if wallet:
                                 validated_wallet_ids.append(wallet_id)
                         except ValueError:
@@ -562,7 +561,7 @@ class CreateStrategyTool(BaseTool):
                 logger.info(f"Strategy created: {strategy_response.id} (name: {name}, user_id: {user_id})")
                 return json.dumps(result, ensure_ascii=False, indent=2)
             finally:
-                db.close()
+                await db.close()
                 
         except Exception as e:
             logger.error(f"Error creating strategy: {e}", exc_info=True)
@@ -1,10 +1,22 @@
+import functools
 from typing import Any
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Степени 10 для decimals ERC20 токенов (0..30)
+_POW10: tuple[int, ...] = tuple(10 ** i for i in range(31))
+
+
 # ==================== HELPER FUNCTIONS ====================
 
+def _pow10(decimals: int) -> int:
+    """10^decimals из таблицы, для нестандартных decimals — вычисляется"""
+    if type(decimals) is int and 0 <= decimals <= 30:
+        return _POW10[decimals]
+    return 10 ** decimals
+
+
 def convert_hex_balance_to_float(balance: Any, decimals: int = 18) -> float:
     """
     Конвертирует баланс из hex строки в число с учетом decimals
@@ -22,26 +34,59 @@ def convert_hex_balance_to_float(balance: Any, decimals: int = 18) -> float:
         >>> convert_hex_balance_to_float('0xde0b6b3a7640000', 18)
         1.0
     """
+    # Строки разбираются через кэш: нулевые и пыльные балансы ("0x0", "0x1")
+    # повторяются по токенам и кошелькам
+    if isinstance(balance, str) and type(decimals) is int:
+        return _convert_balance_str(balance, decimals)
+    
     try:
         # Если balance уже число
         if isinstance(balance, (int, float)):
-            return float(balance) / (10 ** decimals)
+            return float(balance) / _pow10(decimals)
         
         # Если balance строка
         if isinstance(balance, str):
-            # Если это hex строка (начинается с 0x)
-            if balance.startswith('0x') or balance.startswith('0X'):
-                # Конвертируем hex в int
-                balance_int = int(balance, 16)
-                # Учитываем decimals
-                return float(balance_int) / (10 ** decimals)
-            else:
-                # Если это обычная строка с числом
-                return float(balance) / (10 ** decimals)
+            return _parse_balance_str(balance) / _pow10(decimals)
         
         # Если это уже число
-        return float(balance) / (10 ** decimals)
+        return float(balance) / _pow10(decimals)
     
     except (ValueError, TypeError) as e:
         logger.warning(f"Failed to convert balance {balance} with decimals {decimals}: {e}")
         return 0.0
+
+
+def _parse_balance_str(balance: str) -> float:
+    """Hex строка (с префиксом 0x) или строка с числом"""
+    if balance.startswith('0x') or balance.startswith('0X'):
+        return float(int(balance, 16))
+    return float(balance)
+
+
+@functools.lru_cache(maxsize=4096)
+def _convert_balance_str(balance: str, decimals: int) -> float:
+    """convert_hex_balance_to_float для строкового баланса, с кэшем по (balance, decimals)"""
+    try:
+        return _parse_balance_str(balance) / _pow10(decimals)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Failed to convert balance {balance} with decimals {decimals}: {e}")
+        return 0.0
+
+
+def parse_raw_balance(balance: Any) -> float:
+    """
+    Парсит баланс в минимальных единицах токена (без учета decimals)
+    
+    Args:
+        balance: Баланс в виде hex строки (например, '0x35f0a27d') или числа
+    
+    Returns:
+        float: Баланс в минимальных единицах, 0.0 если значение некорректно
+    """
+    try:
+        if isinstance(balance, str) and balance[:2] in ('0x', '0X'):
+            return float(int(balance, 16))
+        return float(balance)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Failed to parse balance {balance}: {e}")
+        return 0.0
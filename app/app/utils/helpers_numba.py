@@ -0,0 +1,61 @@
+"""
+Пакетная конвертация балансов токенов с JIT-компиляцией через Numba
+
+Numba — необязательная зависимость: если она не установлена, используется
+эквивалентная реализация на NumPy.
+"""
+import logging
+
+import numpy as np
+
+from app.utils.helpers import _POW10
+
+logger = logging.getLogger(__name__)
+
+_POW10_F64 = np.array(_POW10, dtype=np.float64)
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - зависит от окружения
+    njit = None
+
+
+def _scale_balances_numpy(raw_balances: np.ndarray, decimals: np.ndarray) -> np.ndarray:
+    """Делит балансы в минимальных единицах на 10^decimals"""
+    # Для стандартных decimals (целые 0..30) берем делители из таблицы
+    if np.all((decimals >= 0) & (decimals < len(_POW10_F64)) & (decimals == np.floor(decimals))):
+        return raw_balances / _POW10_F64[decimals.astype(np.intp)]
+    return raw_balances / np.power(10.0, decimals)
+
+
+if njit is not None:
+    # cache=True сохраняет скомпилированный код на диск, компиляция
+    # выполняется один раз, а не при каждом старте процесса.
+    # parallel/prange не используем: на десятках-сотнях токенов запуск
+    # потоков дороже самого цикла.
+    @njit(cache=True)
+    def _scale_balances_kernel(raw_balances, decimals):
+        result = np.empty(raw_balances.shape[0], dtype=np.float64)
+        for i in range(raw_balances.shape[0]):
+            result[i] = raw_balances[i] / 10.0 ** decimals[i]
+        return result
+
+    def scale_balances(raw_balances: np.ndarray, decimals: np.ndarray) -> np.ndarray:
+        """
+        Конвертирует балансы из минимальных единиц с учетом decimals
+
+        Args:
+            raw_balances: float64-массив балансов в минимальных единицах
+                (hex-строки парсятся заранее через parse_raw_balance)
+            decimals: float64-массив decimals токенов
+
+        Returns:
+            np.ndarray: Балансы в человекочитаемом формате
+        """
+        return _scale_balances_kernel(
+            np.ascontiguousarray(raw_balances, dtype=np.float64),
+            np.ascontiguousarray(decimals, dtype=np.float64),
+        )
+else:
+    logger.debug("numba is not installed, using NumPy balance conversion")
+    scale_balances = _scale_balances_numpy
@@ -0,0 +1,38 @@
+"""
+Общий асинхронный HTTP-клиент для инструментов агента
+"""
+import importlib.util
+from typing import Optional
+
+import httpx
+
+# HTTP/2 включаем только если установлен пакет h2 (httpx[http2])
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий httpx.AsyncClient с пулом соединений.
+
+    Соединения переиспользуются между вызовами инструментов, поэтому
+    TCP/TLS handshake выполняется один раз на хост, а не на каждый запрос.
+    Клиент создается заново, если предыдущий был закрыт.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+            timeout=10.0,
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий клиент (вызывается при остановке приложения)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,89 @@
+"""
+TTL-кэш для асинхронных запросов цен токенов
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from cachetools import TTLCache
+
+# Цены токенов считаем актуальными 5 минут
+PRICE_TTL_SECONDS = 300
+
+
+class AsyncTTLCache:
+    """
+    TTL-кэш результатов корутин.
+
+    Одновременные промахи по одному ключу объединяются: загрузка выполняется
+    один раз, остальные вызовы ждут ее результат.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает значение из кэша или None"""
+        return self._cache.get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохраняет значение в кэш"""
+        self._cache[key] = value
+
+    def clear(self) -> None:
+        """Очищает кэш"""
+        self._cache.clear()
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> None:
+        """Удаляет из кэша ключи, для которых match(key) истинно"""
+        for key in [key for key in self._cache if match(key)]:
+            self._cache.pop(key, None)
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Возвращает значение из кэша или загружает его через fetch().
+
+        Args:
+            key: Ключ кэша
+            fetch: Фабрика корутины загрузки
+            cache_if: Предикат — сохранять ли результат (например, только успешные ответы)
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(fetch())
+            self._inflight[key] = inflight
+            # Результат сохраняется при завершении загрузки, а не в вызывающем:
+            # отмена первого запроса не мешает остальным и не теряет значение
+            inflight.add_done_callback(lambda task: self._store(key, task, cache_if))
+
+        # shield: отмена одного ожидающего не отменяет общую загрузку
+        return await asyncio.shield(inflight)
+
+    def _store(
+        self,
+        key: Hashable,
+        task: asyncio.Future,
+        cache_if: Optional[Callable[[Any], bool]],
+    ) -> None:
+        """Снимает загрузку с учета и сохраняет ее успешный результат"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if cache_if is None or cache_if(value):
+            self._cache[key] = value
+
+
+# Общий кэш цен на процесс: ключ (symbol, exchange)
+price_cache = AsyncTTLCache(maxsize=1024, ttl=PRICE_TTL_SECONDS)
@@ -0,0 +1,78 @@
+"""
+Короткий TTL-кэш ответов GET-эндпоинтов со списками
+
+UI опрашивает списки (стратегии, кошельки, балансы, рекомендации, история
+чата) по таймеру, и одинаковые запросы пользователя повторяются много раз
+подряд. Кэш хранится в памяти процесса; изменения через сервисы сбрасывают
+записи пользователя (invalidate) и повышают поколение раздела: загрузка,
+начатая до изменения, не попадает в кэш, а новые запросы не присоединяются
+к ней. TTL ограничивает только устаревание из-за внешних изменений БД.
+"""
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_session_local
+from app.utils.price_cache import AsyncTTLCache
+
+# Время жизни ответов списков
+RESPONSE_TTL_SECONDS = 10
+
+# /api/chat/new-messages опрашивается чаще всего: схлопываем всплески запросов
+NEW_MESSAGES_TTL_SECONDS = 1
+
+_caches: Dict[str, AsyncTTLCache] = {
+    "strategies": AsyncTTLCache(maxsize=1024, ttl=RESPONSE_TTL_SECONDS),
+    "wallets": AsyncTTLCache(maxsize=1024, ttl=RESPONSE_TTL_SECONDS),
+    "token_balances": AsyncTTLCache(maxsize=1024, ttl=RESPONSE_TTL_SECONDS),
+    "recommendations": AsyncTTLCache(maxsize=1024, ttl=RESPONSE_TTL_SECONDS),
+    "chat_history": AsyncTTLCache(maxsize=1024, ttl=RESPONSE_TTL_SECONDS),
+    "chat_new_messages": AsyncTTLCache(maxsize=1024, ttl=NEW_MESSAGES_TTL_SECONDS),
+}
+
+# Поколение (раздел, пользователь): растет при каждом invalidate
+_generations: Dict[Tuple[str, uuid.UUID], int] = {}
+
+
+async def cached_response(
+    namespace: str,
+    user_id: uuid.UUID,
+    params: Tuple[Hashable, ...],
+    fetch: Callable[[AsyncSession], Awaitable[Any]],
+) -> Any:
+    """
+    Возвращает закэшированный ответ или загружает его через fetch(db)
+
+    Одновременные промахи разделяют одну загрузку, поэтому она выполняется
+    в собственной сессии, а не в сессии запроса: отмена или отключение
+    первого клиента не закрывает сессию под остальными ожидающими.
+
+    Args:
+        namespace: Раздел кэша (имя списка)
+        user_id: ID пользователя — записи разных пользователей не пересекаются
+        params: Query-параметры запроса, входящие в ключ
+        fetch: Фабрика корутины, загружающей ответ из БД в переданной сессии
+    """
+    generation_key = (namespace, user_id)
+    generation = _generations.get(generation_key, 0)
+
+    async def load() -> Any:
+        async with get_session_local()() as db:
+            return await fetch(db)
+
+    # Поколение входит в ключ: после invalidate запросы не присоединяются
+    # к загрузке, начатой до изменения, а ее результат не сохраняется
+    return await _caches[namespace].get_or_fetch(
+        (user_id, generation, *params),
+        load,
+        cache_if=lambda _: _generations.get(generation_key, 0) == generation,
+    )
+
+
+def invalidate(user_id: uuid.UUID, *namespaces: str) -> None:
+    """Сбрасывает закэшированные ответы пользователя в указанных разделах"""
+    for namespace in namespaces:
+        generation_key = (namespace, user_id)
+        _generations[generation_key] = _generations.get(generation_key, 0) + 1
+        _caches[namespace].invalidate(lambda key: key[0] == user_id)
@@ -0,0 +1,97 @@
+"""
+Тесты обработки балансов токенов: векторизованный и скалярный пути
+process_token_balances должны пропускать одни и те же токены и давать
+одинаковые суммы, в том числе на некорректных строках ответа Chainbase
+"""
+import math
+
+from app.agents.portfolio_rebalancer_agent import (
+    PortfolioRebalancerAgent,
+    _VECTORIZE_MIN_TOKENS,
+    _process_tokens_vectorized,
+    _token_entry,
+)
+
+
+def _token(symbol, balance="0xde0b6b3a7640000", decimals=18, **fields):
+    """Строка ответа get_account_tokens (по умолчанию баланс 1.0)"""
+    return {"symbol": symbol, "balance": balance, "decimals": decimals, **fields}
+
+
+# Корректные токены вперемешку с некорректными полями
+MALFORMED_TOKENS = [
+    _token("OK1", balance_usd=10),
+    _token("OK2", current_usd_price=2.5),
+    _token("OK3", balance_usd="12.5"),
+    _token("USDNONE", balance_usd=None, current_usd_price=None),
+    _token("USDTEXT", balance_usd="abc", current_usd_price="3"),
+    _token("USDDICT", balance_usd={}, current_usd_price=[]),
+    _token("USDNAN", balance_usd=float("nan"), current_usd_price=float("inf")),
+    _token("DECNONE", decimals=None, balance_usd=5),
+    _token("DECTEXT", decimals="6", balance_usd=5),
+    _token("DECDICT", decimals={}, balance_usd=5),
+    _token("DECFLOAT", balance="0xf4240", decimals=6.0, current_usd_price=1),
+    _token("BALDICT", balance={"value": 1}, balance_usd=5),
+    _token("BALLIST", balance=[1], balance_usd=5),
+    _token("BALTEXT", balance="not-a-number", balance_usd=5),
+    _token("ZERO", balance="0x0", balance_usd="broken"),
+    _token(None, balance_usd=5),
+    _token(123, balance_usd=5),
+    _token("BAD|SYMBOL", balance_usd=5),
+    {"balance": "0x1"},
+]
+
+
+def _scalar(data):
+    """Результат скалярного пути в формате _process_tokens_vectorized"""
+    entries = [entry for entry in map(_token_entry, data) if entry is not None]
+    tokens = {symbol: (balance, balance_usd) for symbol, balance, balance_usd, _ in entries}
+    return tokens, math.fsum(entry[2] for entry in entries)
+
+
+def test_vectorized_matches_scalar_on_malformed_input():
+    assert len(MALFORMED_TOKENS) >= _VECTORIZE_MIN_TOKENS
+
+    tokens, total = _process_tokens_vectorized(MALFORMED_TOKENS)
+    expected_tokens, expected_total = _scalar(MALFORMED_TOKENS)
+
+    assert set(tokens) == set(expected_tokens)
+    for symbol, (balance, balance_usd) in expected_tokens.items():
+        assert math.isclose(tokens[symbol]["balance"], balance)
+        assert math.isclose(tokens[symbol]["balance_usd"], balance_usd)
+    assert math.isclose(total, expected_total)
+
+
+def test_malformed_fields_are_skipped_or_zeroed():
+    tokens, total = _process_tokens_vectorized(MALFORMED_TOKENS)
+
+    # Некорректные decimals и балансы отбрасывают токен
+    for symbol in ("DECNONE", "DECTEXT", "DECDICT", "BALDICT", "BALLIST", "BALTEXT", "ZERO"):
+        assert symbol not in tokens
+    # Некорректные USD-поля дают нулевую стоимость, но токен остается
+    for symbol in ("USDNONE", "USDDICT", "USDNAN"):
+        assert tokens[symbol]["balance_usd"] == 0.0
+    # current_usd_price строкой-числом разбирается
+    assert math.isclose(tokens["USDTEXT"]["balance_usd"], 3.0)
+    assert math.isclose(tokens["OK2"]["balance_usd"], 2.5)
+    assert math.isclose(tokens["DECFLOAT"]["balance"], 1.0)
+    assert math.isfinite(total)
+
+
+def test_process_token_balances_paths_agree():
+    short = MALFORMED_TOKENS[:_VECTORIZE_MIN_TOKENS - 1]
+
+    # Короткий список идет скалярным путем, длинный — векторизованным
+    scalar = PortfolioRebalancerAgent.process_token_balances({"code": 0, "data": short})
+    vectorized_tokens, vectorized_total = _process_tokens_vectorized(short)
+
+    assert scalar["error"] is None
+    assert scalar["tokens"].keys() == vectorized_tokens.keys()
+    assert math.isclose(scalar["total_value_usd"], vectorized_total)
+
+
+if __name__ == "__main__":
+    test_vectorized_matches_scalar_on_malformed_input()
+    test_malformed_fields_are_skipped_or_zeroed()
+    test_process_token_balances_paths_agree()
+    print("✅ Все тесты обработки балансов пройдены")